@@ -1,23 +1,78 @@
 #!/usr/bin/env python3
+_IMPORT_STARTED_AT = __import__('time').perf_counter()  # 用于统计 "导入到首个周期" 的启动耗时
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import numpy as np
 import time
-import tkinter as tk
-from tkinter import ttk
-from tkinter import messagebox, scrolledtext
-from tkinter import font as tkFont # <--- 引入 tkFont
 from datetime import datetime
+from collections import deque, OrderedDict
 import threading
+import queue
 import sys
 import os
 import json
+import math
+import random
+import sqlite3
+import signal
+import logging
+import argparse
+import bisect
+import contextlib
+import cProfile
+import pstats
+import io
+import itertools
+import heapq
+import socket
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 
-# Matplotlib 和 mplfinance 用于图表
-import matplotlib
-matplotlib.use("TkAgg") # 重要：告诉matplotlib使用Tkinter后端
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import mplfinance as mpf
+# Tkinter 仅在图形界面模式下使用，由 _load_gui_modules() 导入并定义窗口类 CryptoMonitorGUI；没有 Tk 的服务器上仍可以 --headless 运行
+tk = ttk = messagebox = scrolledtext = tkFont = CryptoMonitorGUI = None
+
+# orjson / msgspec 可选：安装了就用来解析 JSON 响应，否则用标准库 json
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    try:
+        import msgspec
+        _json_loads = msgspec.json.decode
+    except ImportError:
+        _json_loads = json.loads
+
+# Matplotlib 和 mplfinance 用于图表，启动 CryptoMonitorGUI 时才加载 (见 _load_plotting_modules)
+matplotlib = plt = FigureCanvasTkAgg = mpf = None
+
+logger = logging.getLogger("CryptoMonitorAlpha")
+
+
+def _load_gui_modules():
+    # 返回 tkinter 是否可用
+    global tk, ttk, messagebox, scrolledtext, tkFont, CryptoMonitorGUI
+    if tk is not None: return True
+    try:
+        import tkinter as _tk
+        from tkinter import ttk as _ttk, messagebox as _messagebox, scrolledtext as _scrolledtext, font as _tkFont
+    except ImportError:
+        return False
+    tk, ttk, messagebox, scrolledtext, tkFont = _tk, _ttk, _messagebox, _scrolledtext, _tkFont
+    CryptoMonitorGUI = _define_gui_class()
+    return True
+
+
+def _load_plotting_modules():
+    global matplotlib, plt, FigureCanvasTkAgg, mpf
+    if mpf is not None: return
+    import matplotlib as _matplotlib
+    _matplotlib.use("TkAgg") # 重要：告诉matplotlib使用Tkinter后端
+    import matplotlib.pyplot as _plt
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg as _FigureCanvasTkAgg
+    import mplfinance as _mpf
+    matplotlib, plt, FigureCanvasTkAgg, mpf = _matplotlib, _plt, _FigureCanvasTkAgg, _mpf
 
 
 # --- 配置参数 ---
@@ -30,16 +85,58 @@ DEFAULT_CONFIG = {
     "days_for_4h_data_base_ma": 10, 
     "days_for_1h_chart": "2",      
     "days_for_4h_chart": "14",     
-    "check_interval_seconds": 300
+    "check_interval_seconds": 300,
+    "api_rate_limit_per_minute": 30,
+    "api_burst": 5,
+    "api_max_retries": 3,
+    "fetch_workers": 4,
+    "ohlc_store_enabled": True,
+    "ohlc_store_fresh_seconds": 60,
+    "crossover_engine": "incremental",
+    "chart_cache_ttl_seconds": 300,
+    "chart_cache_max_mb": 32,
+    "chart_prefetch_neighbors": 1,
+    "chart_auto_refresh_seconds": 60,
+    "api_base_url": "https://api.coingecko.com/api/v3",
+    "metrics_port": 0,
+    "profile_cycles": 0,
+    "indicators": [],
+    "alert_log_enabled": True,
+    "alert_log_max_mb": 5,
+    "alert_log_backups": 3,
+    "alert_memory_limit": 500,
+    "alert_sinks": [],
+    "alert_sink_batch_size": 20,
+    "alert_sink_max_retries": 3,
+    "snapshot_enabled": True,
+    "snapshot_interval_seconds": 300,
+    "stream_url": "",
+    "stream_subscribe": None,
+    "stream_reconnect_seconds": 5,
+    "stream_poll_interval_seconds": 1800,
+    "universe_refresh_seconds": 1800,
+    "scheduler_enabled": True,
+    "scheduler_settle_seconds": 60,
+    "scheduler_hot_spread_pct": 0.5,
+    "scheduler_hot_change_pct": 8.0,
+    "scheduler_retry_seconds": 60,
+    "request_budget_per_minute": 0,
+    "coordination_store_path": "",
+    "coordination_store_shared": False,
+    "worker_heartbeat_seconds": 15,
+    "view_refresh_seconds": 5
 }
-COINGECKO_API_BASE_URL = "https://api.coingecko.com/api/v3"
 
 # --- 全局变量 ---
 # ... (全局变量保持不变)
 monitoring_active = False
 monitor_thread = None
 last_alert_status = {}
+alert_state_lock = threading.RLock()  # 监控线程与行情流线程共用 last_alert_status
+ma_engines = {}  # (coin_id, interval_str) -> IncrementalIndicatorSet
+series_seen_ts = {}  # (coin_id, interval_str) -> 最近一根已收盘K线的时间戳 (ms)，写入快照用于补报停机期间的交叉
 top_coins_data_detailed = []
+coordinator = None  # CoordinationStore；--worker 分片模式下设置
 fig_1h, ax_1h = None, None
 fig_4h, ax_4h = None, None
 canvas_1h, canvas_4h = None, None
@@ -59,24 +156,37 @@ def get_application_path():
 CONFIG_FILE_NAME = "config.json"
 CONFIG_FILE_PATH = os.path.join(get_application_path(), CONFIG_FILE_NAME)
 
+config_notice = None  # (级别, 消息)：导入时只写日志，图形界面启动后再弹窗提示
+
+
 def load_config():
     # ... (此函数保持不变)
+    global config_notice
     if os.path.exists(CONFIG_FILE_PATH):
         try:
             with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
                 loaded_config = json.load(f)
                 return {**DEFAULT_CONFIG, **{k: loaded_config.get(k, DEFAULT_CONFIG.get(k)) for k in DEFAULT_CONFIG}}
         except json.JSONDecodeError:
-            messagebox.showerror("Error", f"配置文件 {CONFIG_FILE_NAME} 格式错误，将使用默认配置。")
-            return DEFAULT_CONFIG
+            config_notice = ("error", f"配置文件 {CONFIG_FILE_NAME} 格式错误，将使用默认配置。")
         except Exception as e:
-            messagebox.showerror("Error", f"加载配置文件失败 ({e})，将使用默认配置。")
-            return DEFAULT_CONFIG
-    else:
+            config_notice = ("error", f"加载配置文件失败 ({e})，将使用默认配置。")
+        logger.error(config_notice[1])
+        return DEFAULT_CONFIG
+    return DEFAULT_CONFIG  # 没有配置文件时由 write_default_config() 在启动时创建
+
+
+def write_default_config():
+    # main() 启动时调用：导入模块不写文件
+    global config_notice
+    if os.path.exists(CONFIG_FILE_PATH): return
+    try:
         with open(CONFIG_FILE_PATH, 'w', encoding='utf-8') as f:
             json.dump(DEFAULT_CONFIG, f, indent=4)
-        messagebox.showinfo("Info", f"未找到配置文件 {CONFIG_FILE_NAME}，已在程序目录下创建默认配置。\n请根据需要修改后重启程序。")
-        return DEFAULT_CONFIG
+        config_notice = ("info", f"未找到配置文件 {CONFIG_FILE_NAME}，已在程序目录下创建默认配置。\n请根据需要修改后重启程序。")
+    except OSError as e:
+        config_notice = ("error", f"无法创建默认配置文件 {CONFIG_FILE_NAME} ({e})，将使用默认配置。")
+    logger.warning(config_notice[1].replace("\n", " "))
 
 config = load_config()
 # ... (config 加载后的全局变量赋值保持不变)
@@ -89,452 +199,3320 @@ DAYS_FOR_4H_DATA_BASE_MA = int(config['days_for_4h_data_base_ma'])
 DAYS_FOR_1H_CHART = str(config['days_for_1h_chart']) 
 DAYS_FOR_4H_CHART = str(config['days_for_4h_chart']) 
 CHECK_INTERVAL_SECONDS = int(config['check_interval_seconds'])
+COINGECKO_API_BASE_URL = str(config['api_base_url']).rstrip('/')
+API_RATE_LIMIT_PER_MINUTE = float(config['api_rate_limit_per_minute'])
+API_BURST = int(config['api_burst'])
+API_MAX_RETRIES = int(config['api_max_retries'])
+FETCH_WORKERS = max(1, int(config['fetch_workers']))
+OHLC_STORE_ENABLED = bool(config['ohlc_store_enabled'])
+OHLC_STORE_FRESH_SECONDS = float(config['ohlc_store_fresh_seconds'])
+CROSSOVER_ENGINE = str(config['crossover_engine']).lower()  # "incremental"、"batch" 或 "pandas"
+CHART_CACHE_TTL_SECONDS = float(config['chart_cache_ttl_seconds'])
+CHART_CACHE_MAX_BYTES = int(float(config['chart_cache_max_mb']) * 1024 * 1024)
+CHART_PREFETCH_NEIGHBORS = max(0, int(config['chart_prefetch_neighbors']))
+CHART_AUTO_REFRESH_SECONDS = float(config['chart_auto_refresh_seconds'])
+METRICS_PORT = int(config['metrics_port'])  # 0 表示不开启本地指标端点
+PROFILE_CYCLES = max(0, int(config['profile_cycles']))
+ALERT_LOG_ENABLED = bool(config['alert_log_enabled'])
+ALERT_LOG_MAX_BYTES = int(float(config['alert_log_max_mb']) * 1024 * 1024)
+ALERT_LOG_BACKUPS = max(0, int(config['alert_log_backups']))
+ALERT_MEMORY_LIMIT = max(1, int(config['alert_memory_limit']))
+ALERT_SINK_BATCH_SIZE = max(1, int(config['alert_sink_batch_size']))
+ALERT_SINK_MAX_RETRIES = max(0, int(config['alert_sink_max_retries']))
+SNAPSHOT_ENABLED = bool(config['snapshot_enabled'])
+SNAPSHOT_INTERVAL_SECONDS = float(config['snapshot_interval_seconds'])
+STREAM_URL = config['stream_url']
+STREAM_RECONNECT_SECONDS = float(config['stream_reconnect_seconds'])
+STREAM_POLL_INTERVAL_SECONDS = int(config['stream_poll_interval_seconds'])  # 启用行情流后轮询 (回填/修补) 的间隔
+UNIVERSE_REFRESH_SECONDS = float(config['universe_refresh_seconds'])  # 两次完整 /coins/markets 刷新之间只做 /simple/price 价格刷新
+# 调度：默认每个 (币种, 周期) 在K线收盘 + settle 秒后检查；快慢线相对价差 <= hot_spread_pct% 或 24h 涨跌幅 >= hot_change_pct%
+# 的币种按 check_interval_seconds 更频繁检查；scheduler_enabled=false 时所有币种都按 check_interval_seconds 检查
+SCHEDULER_ENABLED = bool(config['scheduler_enabled'])
+SCHEDULER_SETTLE_SECONDS = float(config['scheduler_settle_seconds'])
+SCHEDULER_HOT_SPREAD = float(config['scheduler_hot_spread_pct']) / 100
+SCHEDULER_HOT_CHANGE_PCT = float(config['scheduler_hot_change_pct'])
+SCHEDULER_RETRY_SECONDS = float(config['scheduler_retry_seconds'])
+REQUEST_BUDGET_PER_MINUTE = float(config['request_budget_per_minute'])  # 0 表示与 api_rate_limit_per_minute 相同
+# 分片 worker 共享的协调库 (空为程序目录下的 coordination.sqlite3)；只读界面 (--view) 每 view_refresh_seconds 秒读取一次
+COORDINATION_STORE_PATH = config['coordination_store_path'] or os.path.join(get_application_path(), "coordination.sqlite3")
+COORDINATION_STORE_SHARED = bool(config['coordination_store_shared'])  # 多台主机经网络文件系统共用协调库时设为 true (不用 WAL)
+WORKER_HEARTBEAT_SECONDS = float(config['worker_heartbeat_seconds'])
+VIEW_REFRESH_SECONDS = float(config['view_refresh_seconds'])
+
+
+# --- 运行指标 (各阶段计时与计数，Prometheus 文本格式导出) ---
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+METRICS_HELP = {
+    "cma_http_request_seconds": "CoinGecko 单次 HTTP 请求耗时 (不含限速等待)",
+    "cma_http_requests_total": "CoinGecko HTTP 请求数 (按端点与状态码)",
+    "cma_http_429_total": "收到 429 限流响应的次数",
+    "cma_rate_limit_wait_seconds": "令牌桶等待耗时",
+    "cma_parse_seconds": "JSON 解析耗时 (含转为数组 / DataFrame)",
+    "cma_parse_fallback_total": "K线响应无法按数字直接扫描、改走通用 JSON 解析的次数",
+    "cma_resample_seconds": "4H 重采样耗时",
+    "cma_ma_compute_seconds": "MA 计算与交叉判断耗时",
+    "cma_ui_callback_seconds": "Tk 主线程界面回调耗时",
+    "cma_ui_queue_depth": "界面更新队列积压数",
+    "cma_chart_render_seconds": "K线图绘制耗时",
+    "cma_cycle_seconds": "MA 交叉检查周期耗时",
+    "cma_last_cycle_seconds": "最近一个周期耗时",
+    "cma_check_interval_seconds": "配置的检查间隔",
+    "cma_cycles_total": "已完成周期数",
+    "cma_cycle_overruns_total": "耗时超过检查间隔的周期数",
+    "cma_cache_requests_total": "缓存查询次数 (按缓存与命中结果)",
+    "cma_ohlc_store_fetch_total": "本地 OHLC 库读取方式 (fresh 不请求网络 / incremental / full)",
+    "cma_alerts_total": "发出的交叉提醒数",
+    "cma_alerts_deduplicated_total": "协调库中已由其他分片 worker 提醒而跳过的交叉数",
+    "cma_alert_deliveries_total": "提醒投递结果 (按目标：ok / retry / failed / dropped)",
+    "cma_alert_delivery_seconds": "单批提醒投递耗时",
+    "cma_scheduler_jobs_total": "检查完成后重新排期的 (币种, 周期) 任务数 (按热点/普通)",
+    "cma_scheduler_backlog": "已到期但因请求预算未派发的任务数",
+    "cma_request_budget_remaining": "当前窗口剩余请求预算",
+    "cma_stream_ticks_total": "行情流收到的价格数",
+    "cma_stream_bars_total": "行情流收盘的K线数 (按周期)",
+    "cma_stream_repairs_total": "行情流断档后经轮询修补的次数",
+}
+# 周期超时时按阶段归因所用的直方图；工作线程中的耗时为各线程累计值
+CYCLE_STAGE_METRICS = (
+    ("网络", ("cma_http_request_seconds",)),
+    ("限速等待", ("cma_rate_limit_wait_seconds",)),
+    ("解析/重采样", ("cma_parse_seconds", "cma_resample_seconds")),
+    ("MA计算", ("cma_ma_compute_seconds",)),
+    ("界面", ("cma_ui_callback_seconds",)),
+)
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels) + "}"
 
 
-class CryptoMonitorGUI(tk.Tk):
+class MetricsRegistry:
+    # 线程安全的计数器 / 仪表 / 直方图；同名指标按标签区分
     def __init__(self):
-        super().__init__()
-        self.title("加密货币监控 Alpha (MA, 价格, K线图)")
-        self.geometry("1000x750") 
-
-        # --- 字体定义 ---
-        # 获取 ScrolledText 的默认字体信息
-        default_font = tkFont.nametofont(scrolledtext.ScrolledText().cget("font"))
-        default_family = default_font.actual("family")
-        default_size = default_font.actual("size")
-        
-        # 定义新的提醒字体：红色、加粗、字号增大2
-        self.alert_font_style = tkFont.Font(family=default_family, 
-                                            size=default_size + 2, 
-                                            weight="bold")
-
-        # --- 顶部控制区域 ---
-        # ... (顶部控制区域代码保持不变)
-        self.top_controls_frame = tk.Frame(self)
-        self.top_controls_frame.pack(side=tk.TOP, fill=tk.X, padx=10, pady=5)
-
-        self.config_frame = tk.LabelFrame(self.top_controls_frame, text="监控设置")
-        self.config_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
-        tk.Label(self.config_frame, text=f"监控前 {TOP_N_COINS} 币种 (计价: {VS_CURRENCY.upper()})").pack(side=tk.LEFT, padx=5)
-        self.start_button = tk.Button(self.config_frame, text="开始监控", command=self.start_monitoring)
-        self.start_button.pack(side=tk.LEFT, padx=5)
-        self.stop_button = tk.Button(self.config_frame, text="停止监控", command=self.stop_monitoring, state=tk.DISABLED)
-        self.stop_button.pack(side=tk.LEFT, padx=5)
-        self.refresh_button = tk.Button(self.config_frame, text="刷新价格", command=self.refresh_displayed_prices, state=tk.DISABLED)
-        self.refresh_button.pack(side=tk.LEFT, padx=5)
-
-        # --- 主内容区域 (左右分隔) ---
-        # ... (main_paned_window, left_pane, coins_frame, coins_tree 初始化代码保持不变)
-        self.main_paned_window = tk.PanedWindow(self, orient=tk.HORIZONTAL, sashrelief=tk.RAISED)
-        self.main_paned_window.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-
-        self.left_pane = tk.PanedWindow(self.main_paned_window, orient=tk.VERTICAL, sashrelief=tk.RAISED)
-        self.main_paned_window.add(self.left_pane, width=500)
-
-        self.coins_frame = tk.LabelFrame(self.left_pane, text="监控币种实时信息 (UTC+0)")
-        self.left_pane.add(self.coins_frame, height=400)
-
-        self.coins_tree = ttk.Treeview(self.coins_frame, columns=("rank", "name", "price", "change_24h", "change_1d_utc"), show="headings")
-        self.coins_tree.heading("rank", text="排名")
-        self.coins_tree.heading("name", text="名称 (符号)")
-        self.coins_tree.heading("price", text=f"现价 ({VS_CURRENCY.upper()})")
-        self.coins_tree.heading("change_24h", text="24h%")
-        self.coins_tree.heading("change_1d_utc", text="UTC日%")
-        self.coins_tree.column("rank", width=40, anchor=tk.CENTER, stretch=False)
-        self.coins_tree.column("name", width=150, stretch=True)
-        self.coins_tree.column("price", width=90, anchor=tk.E, stretch=False)
-        self.coins_tree.column("change_24h", width=70, anchor=tk.E, stretch=False)
-        self.coins_tree.column("change_1d_utc", width=70, anchor=tk.E, stretch=False)
-        self.coins_tree_scrollbar = ttk.Scrollbar(self.coins_frame, orient="vertical", command=self.coins_tree.yview)
-        self.coins_tree.configure(yscrollcommand=self.coins_tree_scrollbar.set)
-        self.coins_tree_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.coins_tree.pack(fill=tk.BOTH, expand=True)
-        self.coins_tree.bind("<<TreeviewSelect>>", self.on_coin_select)
-
-        self.coins_tree.tag_configure('positive', foreground='red')
-        self.coins_tree.tag_configure('negative', foreground='green')
-        self.coins_tree.tag_configure('neutral', foreground='black')
-
-        self.alert_frame = tk.LabelFrame(self.left_pane, text="MA交叉提醒")
-        self.left_pane.add(self.alert_frame) 
-        self.alert_text = scrolledtext.ScrolledText(self.alert_frame, state=tk.DISABLED, height=8)
-        self.alert_text.pack(fill=tk.BOTH, expand=True)
-        
-        # 为 ScrolledText 定义标签和字体
-        self.alert_text.tag_configure("alert_style", 
-                                      font=self.alert_font_style, 
-                                      foreground="red")
-
-
-        # --- 右侧面板 (K线图) ---
-        # ... (right_pane 和 K线图相关初始化代码保持不变)
-        self.right_pane = tk.Frame(self.main_paned_window) 
-        self.main_paned_window.add(self.right_pane)
-        self.charts_notebook = ttk.Notebook(self.right_pane) 
-        self.chart_frame_1h_container = ttk.Frame(self.charts_notebook)
-        self.charts_notebook.add(self.chart_frame_1h_container, text='1H K线图')
-        self.chart_label_1h = tk.Label(self.chart_frame_1h_container, text="请在左侧列表选择币种以加载图表")
-        self.chart_label_1h.pack(expand=True, fill=tk.BOTH)
-        self.chart_frame_4h_container = ttk.Frame(self.charts_notebook)
-        self.charts_notebook.add(self.chart_frame_4h_container, text='4H K线图')
-        self.chart_label_4h = tk.Label(self.chart_frame_4h_container, text="请在左侧列表选择币种以加载图表")
-        self.chart_label_4h.pack(expand=True, fill=tk.BOTH)
-        self.charts_notebook.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
-        self.selected_coin_label = tk.Label(self.right_pane, text="当前选择: 无")
-        self.selected_coin_label.pack(fill=tk.X, pady=2)
-
-        # --- 底部状态栏 ---
-        # ... (底部状态栏代码保持不变)
-        self.status_label = tk.StringVar(self)
-        self.status_label.set("就绪")
-        tk.Label(self, textvariable=self.status_label, bd=1, relief=tk.SUNKEN, anchor=tk.W).pack(side=tk.BOTTOM, fill=tk.X)
-
-        self.protocol("WM_DELETE_WINDOW", self.on_closing)
-        self._init_chart_canvases()
-
-    def _init_chart_canvases(self):
-        # ... (此方法保持不变)
-        global fig_1h, ax_1h, canvas_1h, fig_4h, ax_4h, canvas_4h
-        fig_1h, ax_1h = plt.subplots(figsize=(5,3)) 
-        plt.style.use('seaborn-v0_8-darkgrid') 
-        fig_1h.patch.set_facecolor('lightgrey') 
-        ax_1h.set_facecolor('white') 
-        canvas_1h = FigureCanvasTkAgg(fig_1h, master=self.chart_frame_1h_container)
-        fig_4h, ax_4h = plt.subplots(figsize=(5,3))
-        fig_4h.patch.set_facecolor('lightgrey')
-        ax_4h.set_facecolor('white')
-        canvas_4h = FigureCanvasTkAgg(fig_4h, master=self.chart_frame_4h_container)
-
-    def update_coins_display(self, coins_details):
-        # ... (此方法保持不变)
-        for item in self.coins_tree.get_children():
-            self.coins_tree.delete(item)
-        for rank, coin_detail in enumerate(coins_details, 1):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}  # (名称, 标签) -> [各桶计数, 总和, 次数, 最大值]
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock: self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock: self.gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None: histogram = self.histograms[key] = [[0] * (len(METRICS_BUCKETS) + 1), 0.0, 0, 0.0]
+            histogram[0][bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            histogram[3] = max(histogram[3], seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try: yield
+        finally: self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self.lock:
+            return (dict(self.counters), dict(self.gauges),
+                    {key: (list(h[0]), h[1], h[2], h[3]) for key, h in self.histograms.items()})
+
+    def histogram_total(self, name):
+        # 某直方图所有标签的耗时总和，用于周期前后做差
+        with self.lock: return sum(h[1] for (metric, _), h in self.histograms.items() if metric == name)
+
+    def stage_totals(self):
+        return {stage: sum(self.histogram_total(name) for name in names) for stage, names in CYCLE_STAGE_METRICS}
+
+    def render_prometheus(self):
+        counters, gauges, histograms = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name in declared: return
+            declared.add(name)
+            if name in METRICS_HELP: lines.append(f"# HELP {name} {METRICS_HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            declare(name, "counter"); lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in sorted(gauges.items()):
+            declare(name, "gauge"); lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count, _) in sorted(histograms.items()):
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(METRICS_BUCKETS + (None,), buckets):
+                cumulative += bucket_count
+                le = "+Inf" if bound is None else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def format_metrics_summary(registry=None):
+    # 统计面板 / 日志用的可读摘要
+    counters, gauges, histograms = (registry or metrics).snapshot()
+    lines = []
+    last_cycle = gauges.get(("cma_last_cycle_seconds", ()))
+    cycles = counters.get(("cma_cycles_total", ()), 0)
+    overruns = counters.get(("cma_cycle_overruns_total", ()), 0)
+    check_interval = gauges.get(("cma_check_interval_seconds", ()), CHECK_INTERVAL_SECONDS)
+    lines.append(f"最近周期: {'N/A' if last_cycle is None else f'{last_cycle:.2f} 秒'} / 检查间隔 {check_interval:g} 秒"
+                 f"  (共 {cycles} 周期，超时 {overruns} 次)")
+    ticks = counters.get(("cma_stream_ticks_total", ()), 0)
+    if ticks:
+        bars = sum(value for (name, _), value in counters.items() if name == "cma_stream_bars_total")
+        lines.append(f"行情流: {ticks} 笔价格，{bars} 根K线收盘，修补 {counters.get(('cma_stream_repairs_total', ()), 0)} 次")
+    titles = (("cma_http_request_seconds", "HTTP 请求"), ("cma_rate_limit_wait_seconds", "限速等待"),
+              ("cma_parse_seconds", "解析"), ("cma_resample_seconds", "4H重采样"), ("cma_ma_compute_seconds", "MA计算"),
+              ("cma_ui_callback_seconds", "界面回调"), ("cma_chart_render_seconds", "K线绘制"), ("cma_cycle_seconds", "周期"))
+    for metric_name, title in titles:
+        rows = sorted((labels, h) for (name, labels), h in histograms.items() if name == metric_name)
+        if not rows: continue
+        lines.append(f"{title}:")
+        for labels, (_, total, count, maximum) in rows:
+            label_text = ",".join(value for _, value in labels) or "-"
+            lines.append(f"  {label_text:<34} 次数 {count:>6}  平均 {total / count * 1000:>8.1f} ms  最大 {maximum * 1000:>8.1f} ms  累计 {total:>8.2f} 秒")
+    http_429 = sum(value for (name, _), value in counters.items() if name == "cma_http_429_total")
+    lines.append(f"429 限流次数: {http_429}")
+    cache_results = {}
+    for (name, labels), value in counters.items():
+        if name != "cma_cache_requests_total": continue
+        label_map = dict(labels)
+        hits, total = cache_results.get(label_map.get("cache"), (0, 0))
+        cache_results[label_map.get("cache")] = (hits + (value if label_map.get("result") == "hit" else 0), total + value)
+    for cache_name, (hits, total) in sorted(cache_results.items()):
+        lines.append(f"缓存命中率 {cache_name}: {hits / total * 100:.1f}% ({hits}/{total})")
+    deliveries = sorted((dict(labels).get("sink"), dict(labels).get("result"), value) for (name, labels), value in counters.items() if name == "cma_alert_deliveries_total")
+    if deliveries:
+        lines.append("提醒投递: " + "  ".join(f"{sink}/{result} {value}" for sink, result, value in deliveries))
+    store_modes = sorted((dict(labels).get("series"), dict(labels).get("mode"), value) for (name, labels), value in counters.items() if name == "cma_ohlc_store_fetch_total")
+    if store_modes:
+        lines.append("本地库读取: " + "  ".join(f"{series}/{mode} {value}" for series, mode, value in store_modes))
+    return "\n".join(lines)
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    # 本地 Prometheus 文本端点：GET /metrics
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True, name="metrics-http").start()
+    logger.info("运行指标端点: http://%s:%d/metrics", host, httpd.server_port)
+    return httpd
+
+
+class CycleProfiler:
+    # 对接下来 N 个周期做 cProfile 剖析 (只覆盖监控线程：MA 计算、重采样、提醒；网络耗时看 cma_http_* 指标)
+    def __init__(self, cycles):
+        self.remaining = cycles
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        self.remaining -= 1
+        return False
+
+    @property
+    def finished(self):
+        return self.remaining <= 0
+
+    def dump(self, top=25):
+        path = os.path.join(get_application_path(), f"profile_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.prof")
+        try: self.profile.dump_stats(path)
+        except OSError as e: logger.error("写入剖析文件失败: %s", e); path = None
+        report = io.StringIO()
+        pstats.Stats(self.profile, stream=report).sort_stats("cumulative").print_stats(top)
+        logger.info("周期剖析完成%s\n%s", f"，已保存到 {path}" if path else "", report.getvalue())
+        return path
+
+
+# --- 网络请求引擎 (共享限速 + 连接池 + 重试) ---
+class TokenBucketRateLimiter:
+    # 令牌桶：所有线程共享同一个 API 配额
+    def __init__(self, rate_per_minute, burst):
+        self.rate_per_second = max(rate_per_minute, 0.001) / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+                self.updated_at = now
+                wait_seconds = self.blocked_until - now
+                if wait_seconds <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait_seconds = (1 - self.tokens) / self.rate_per_second
+            time.sleep(min(wait_seconds, 1.0))
+
+    def penalize(self, seconds):
+        # 收到 429 时让所有线程一起暂停，而不是各自继续撞限额
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+api_rate_limiter = TokenBucketRateLimiter(API_RATE_LIMIT_PER_MINUTE, API_BURST)
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=FETCH_WORKERS + 2))
+http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=FETCH_WORKERS + 2))
+_executors = {}  # 线程名前缀 -> ThreadPoolExecutor，第一次提交任务时才创建
+_executors_lock = threading.Lock()
+
+
+def _executor(name, max_workers):
+    with _executors_lock:
+        pool = _executors.get(name)
+        if pool is None: pool = _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+    return pool
+
+
+def fetch_executor(): return _executor("api-fetch", FETCH_WORKERS)
+
+
+def _retry_delay_seconds(response, attempt):
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try: return max(1.0, float(retry_after))
+        except ValueError: pass
+    return min(60.0, 2.0 ** attempt) + random.uniform(0, 0.5)
+
+
+def _endpoint_label(path):
+    # /coins/bitcoin/market_chart -> /coins/{id}/market_chart，避免每个币种一个标签
+    parts = path.strip('/').split('/')
+    if len(parts) == 3 and parts[0] == 'coins': return f"/coins/{{id}}/{parts[2]}"
+    return path
+
+
+def api_get(path, params, timeout=15):
+    # 所有 CoinGecko 请求的统一入口：先取令牌，429/5xx/连接错误按退避重试
+    url = f"{COINGECKO_API_BASE_URL}{path}"
+    endpoint = _endpoint_label(path)
+    for attempt in range(API_MAX_RETRIES + 1):
+        with metrics.timer("cma_rate_limit_wait_seconds"):
+            api_rate_limiter.acquire()
+        request_budget.record()
+        started = time.perf_counter()
+        try:
+            response = http_session.get(url, params=params, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            metrics.observe("cma_http_request_seconds", time.perf_counter() - started, endpoint=endpoint)
+            metrics.inc("cma_http_requests_total", endpoint=endpoint, status=type(e).__name__)
+            if attempt >= API_MAX_RETRIES: raise
+            delay = _retry_delay_seconds(None, attempt)
+            logger.warning("API 请求失败 (%s): %s，%.1f 秒后重试", type(e).__name__, path, delay)
+            time.sleep(delay)
+            continue
+        metrics.observe("cma_http_request_seconds", time.perf_counter() - started, endpoint=endpoint)
+        metrics.inc("cma_http_requests_total", endpoint=endpoint, status=response.status_code)
+        if response.status_code == 429 or response.status_code >= 500:
+            if attempt >= API_MAX_RETRIES: response.raise_for_status()
+            delay = _retry_delay_seconds(response, attempt)
+            if response.status_code == 429:
+                metrics.inc("cma_http_429_total", endpoint=endpoint)
+                logger.warning("API 限流 (429): %s，%.1f 秒后重试", path, delay)
+                api_rate_limiter.penalize(delay)
+            else:
+                logger.warning("API 服务端错误 (%d): %s，%.1f 秒后重试", response.status_code, path, delay)
+                time.sleep(delay)
+            continue
+        response.raise_for_status()
+        return response
+
+
+# K线响应 ([[ts, 值, ...], ...]) 直接从字节扫描为 float64 数组，不经过 Python 列表与浮点对象
+_NUMERIC_BYTES = b"0123456789.eE+- \t\r\n[],"
+_ARRAY_PUNCTUATION = bytes.maketrans(b"[],", b"   ")
+
+
+def _scan_numeric_rows(body, width):
+    # body 为只含数字的二维 JSON 数组；含 null、字符串或行宽不符时返回 None，由调用方走通用解析
+    if body is None or body.translate(None, _NUMERIC_BYTES): return None
+    rows = body.count(b"[") - 1
+    if rows <= 0: return np.empty((0, width)) if rows == 0 and body.count(b",") == 0 else None
+    if body.count(b"]") != rows + 1 or body.count(b",") != rows * width - 1: return None
+    # 逐行核对：括号须为 [ [..] [..] ... ]，且每行恰好 width - 1 个逗号 ([[1,2,3],[4]] 总数对得上，但行宽不对)
+    raw = np.frombuffer(body, dtype=np.uint8)
+    brackets = np.flatnonzero((raw == ord("[")) | (raw == ord("]")))
+    if not np.array_equal(raw[brackets], np.frombuffer(b"[" + b"[]" * rows + b"]", dtype=np.uint8)): return None
+    commas = np.flatnonzero(raw == ord(","))
+    opens, closes = brackets[1:-1:2], brackets[2::2][:rows]
+    if not np.all(np.searchsorted(commas, closes) - np.searchsorted(commas, opens) == width - 1): return None
+    if not np.all(np.searchsorted(commas, opens[1:]) - np.searchsorted(commas, closes[:-1]) == 1): return None  # 行与行之间恰好一个逗号
+    values = np.fromstring(body.translate(_ARRAY_PUNCTUATION), dtype=np.float64, sep=" ")
+    return values.reshape(rows, width) if values.size == rows * width else None
+
+
+def _json_array_bytes(body, key):
+    # 对象响应中 key 对应的二维数组的原始字节 (只有两层，第一个 ]] 即为结尾)；找不到时返回 None
+    start = body.find(b'"' + key + b'"')
+    if start < 0: return None
+    start = body.find(b"[", start)
+    if start < 0: return None
+    if body[start + 1:start + 2] == b"]": return body[start:start + 2]
+    end = body.find(b"]]", start)
+    return body[start:end + 2] if end >= 0 else None
+
+
+def parse_numeric_rows(response, width, key=None):
+    # 返回 (n, width) float64 数组 (可能含 NaN)；key 为 None 时整个响应就是数组，否则取对象中的 key 字段
+    body = response.content
+    values = _scan_numeric_rows(body if key is None else _json_array_bytes(body, key.encode()), width)
+    if values is not None: return values
+    metrics.inc("cma_parse_fallback_total", width=width)
+    data = _json_loads(body)
+    if key is not None: data = data.get(key) if isinstance(data, dict) else None
+    if not data: return np.empty((0, width))
+    return np.array(data, dtype=np.float64).reshape(-1, width)  # null 转为 NaN
+
+
+# --- 提醒存储与分发 (磁盘日志 + 内存环形缓冲 + 后台批量投递) ---
+ALERT_LOG_FILE_PATH = os.path.join(get_application_path(), "alerts.jsonl")
+
+
+class AlertStore:
+    # 追加写 JSONL (超过 max_bytes 轮转为 .1 ~ .N)，最近 memory_limit 条保留在内存环形缓冲中供界面显示
+    # path 为 None 时只保留内存缓冲
+    def __init__(self, path, max_bytes, backups, memory_limit):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.recent_alerts = deque(maxlen=max(1, memory_limit))
+        self.total = 0  # 本次运行以来 (含启动时载入的历史) 进入缓冲的提醒数，界面用它判断有无新提醒
+        self.file = None
+        self.lock = threading.Lock()
+        self.loaded = not path  # 历史提醒在第一次读写时才载入
+
+    def _load_recent(self):
+        # 第一次读写时从上一个轮转文件和当前文件载入最近的提醒 (调用方持有 lock)
+        self.loaded = True
+        lines = deque(maxlen=self.recent_alerts.maxlen)
+        for path in (f"{self.path}.1", self.path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f: lines.extend(f)
+            except OSError: continue
+        for line in lines:
+            try: self.recent_alerts.append(json.loads(line))
+            except ValueError: continue
+        self.total += len(self.recent_alerts)
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            if not self.loaded: self._load_recent()
+            self.recent_alerts.append(record)
+            self.total += 1
+            if not self.path: return
+            try:
+                if self.file is None: self.file = open(self.path, 'a', encoding='utf-8')
+                if self.file.tell() + len(line.encode('utf-8')) > self.max_bytes and self.file.tell() > 0: self._rotate()
+                self.file.write(line)
+                self.file.flush()
+            except OSError as e:
+                logger.error("写入提醒日志失败: %s", e)
+
+    def _rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"): os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0: os.replace(self.path, f"{self.path}.1")
+        else: os.remove(self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def snapshot(self, start, stop):
+        # 返回 (缓冲中第 start ~ stop 条, 缓冲长度, 累计总数)；下标按时间先后
+        with self.lock:
+            if not self.loaded: self._load_recent()
+            count = len(self.recent_alerts)
+            start, stop = max(0, min(start, count)), max(0, min(stop, count))
+            return list(itertools.islice(self.recent_alerts, start, stop)), count, self.total
+
+    def close(self):
+        with self.lock:
+            if self.file is not None: self.file.close(); self.file = None
+
+
+def format_alert_time(record):
+    return time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime(record['ts'])) if record.get('ts') else "?"
+
+
+class StdoutAlertSink:
+    name = "stdout"
+
+    def deliver(self, batch):
+        for record in batch: print(f"[{format_alert_time(record)}] {record['message'].replace(chr(10), ' | ')}", flush=True)
+
+
+class FileAlertSink:
+    def __init__(self, path):
+        self.path = path
+        self.name = f"file:{os.path.basename(path)}"
+
+    def deliver(self, batch):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+
+
+class WebhookAlertSink:
+    # 一批提醒合并成一次 POST: {"alerts": [...]}；非 2xx 视为失败并重试
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+        self.name = f"webhook:{url}"
+        self.session = requests.Session()
+
+    def deliver(self, batch):
+        response = self.session.post(self.url, json={'alerts': batch}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+def build_alert_sinks(raw_sinks):
+    # 配置形如 [{"type": "stdout"}, {"type": "file", "path": "alerts_out.jsonl"}, {"type": "webhook", "url": "http://127.0.0.1:9000/alerts"}]
+    sinks = []
+    for raw in raw_sinks or []:
+        try:
+            kind = str(raw.get("type", "")).lower()
+            if kind == "stdout": sinks.append(StdoutAlertSink())
+            elif kind == "file": sinks.append(FileAlertSink(os.path.join(get_application_path(), raw["path"])))
+            elif kind == "webhook": sinks.append(WebhookAlertSink(raw["url"], float(raw.get("timeout", 10))))
+            else: raise ValueError(f"未知类型 {kind}")
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logger.error("提醒投递配置 %s 无效 (%s)，已忽略", raw, e)
+    return sinks
+
+
+class AlertSinkWorker:
+    # 每个投递目标一个后台线程和有界队列：队列满时丢弃最旧的提醒而不是阻塞监控线程；
+    # 每次取出最多 batch_size 条一起投递，失败按指数退避重试 max_retries 次
+    def __init__(self, sink, batch_size, max_retries, queue_size=10000, linger_seconds=0.2):
+        self.sink = sink
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.linger_seconds = linger_seconds
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True, name=f"alert-sink-{sink.name}")
+        self.thread.start()
+
+    def submit(self, record):
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                try: self.queue.get_nowait()
+                except queue.Empty: continue
+                metrics.inc("cma_alert_deliveries_total", sink=self.sink.name, result="dropped")
+
+    def _next_batch(self):
+        # 等到第一条后再最多等 linger_seconds 凑满一批；停止时直接取走队列中现有的
+        try: batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty: return []
+        deadline = time.monotonic() + self.linger_seconds
+        while len(batch) < self.batch_size:
+            remaining = 0 if self.stop_event.is_set() else deadline - time.monotonic()
+            try: batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty: break
+        return batch
+
+    def _run(self):
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch: self._deliver(batch)
+
+    def _deliver(self, batch):
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
             try:
-                coin_id, symbol, name, price, change_24h_raw, _, change_1d_utc_raw = coin_detail
-                price_str = f"{price:,.4f}" if price is not None else "N/A"
-                tags_24h = ['neutral']
-                change_24h_str = "N/A"
-                if change_24h_raw is not None:
-                    change_24h_str = f"{change_24h_raw:.2f}%"
-                    if change_24h_raw > 0: tags_24h = ['positive']
-                    elif change_24h_raw < 0: tags_24h = ['negative']
-                tags_1d_utc = ['neutral']
-                change_1d_utc_str = "N/A"
-                if change_1d_utc_raw is not None:
-                    change_1d_utc_str = f"{change_1d_utc_raw:.2f}%"
-                    if change_1d_utc_raw > 0: tags_1d_utc = ['positive']
-                    elif change_1d_utc_raw < 0: tags_1d_utc = ['negative']
-                item_main_tag = tags_24h[0] 
-                self.coins_tree.insert("", tk.END, iid=coin_id, values=(
-                    rank,
-                    f"{name} ({symbol.upper()})",
-                    price_str,
-                    change_24h_str, 
-                    change_1d_utc_str 
-                ), tags=(item_main_tag,)) 
+                self.sink.deliver(batch)
+                metrics.observe("cma_alert_delivery_seconds", time.perf_counter() - started, sink=self.sink.name)
+                metrics.inc("cma_alert_deliveries_total", len(batch), sink=self.sink.name, result="ok")
+                return
             except Exception as e:
-                print(f"更新币种显示错误: {coin_detail} - {e}")
-                self.coins_tree.insert("", tk.END, values=(rank, f"数据错误", "N/A", "N/A", "N/A"))
-        self.coins_tree.tag_configure('positive', foreground='red')
-        self.coins_tree.tag_configure('negative', foreground='green')
-
-    def on_coin_select(self, event):
-        # ... (此方法保持不变)
-        global current_selected_coin_id
-        selected_item = self.coins_tree.focus() 
-        if not selected_item:
-            return
-        current_selected_coin_id = selected_item
-        item_details = self.coins_tree.item(selected_item)
-        coin_name_symbol = item_details['values'][1] if item_details['values'] else "N/A"
-        self.selected_coin_label.config(text=f"当前选择: {coin_name_symbol} ({current_selected_coin_id})")
-        print(f"选中币种: {current_selected_coin_id} - {coin_name_symbol}")
-        self.chart_label_1h.pack_forget()
-        self.chart_label_4h.pack_forget()
-        if canvas_1h: canvas_1h.get_tk_widget().pack(fill=tk.BOTH, expand=True) 
-        if canvas_4h: canvas_4h.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-        self.status_label.set(f"正在加载 {coin_name_symbol} 的图表数据...")
-        threading.Thread(target=self._load_and_draw_charts, args=(current_selected_coin_id,), daemon=True).start()
-
-    def _load_and_draw_charts(self, coin_id):
-        # ... (此方法保持不变)
-        global fig_1h, ax_1h, canvas_1h, fig_4h, ax_4h, canvas_4h
-        if not coin_id:
-            return
-        df_1h_chart = get_ohlc_for_chart(coin_id, days_param=DAYS_FOR_1H_CHART, target_interval='1h')
-        if df_1h_chart is not None and not df_1h_chart.empty:
-            self.draw_chart(df_1h_chart, fig_1h, ax_1h, canvas_1h, f"{coin_id.capitalize()} 1H K线")
-        else:
-            ax_1h.clear()
-            ax_1h.text(0.5, 0.5, "无1H图表数据", ha='center', va='center')
-            canvas_1h.draw_idle()
-            print(f"无1H图表数据 для {coin_id}")
-        df_4h_chart = get_ohlc_for_chart(coin_id, days_param=DAYS_FOR_4H_CHART, target_interval='4h')
-        if df_4h_chart is not None and not df_4h_chart.empty:
-            self.draw_chart(df_4h_chart, fig_4h, ax_4h, canvas_4h, f"{coin_id.capitalize()} 4H K线")
-        else:
-            ax_4h.clear()
-            ax_4h.text(0.5, 0.5, "无4H图表数据", ha='center', va='center')
-            canvas_4h.draw_idle()
-            print(f"无4H图表数据 для {coin_id}")
-        self.status_label.set(f"{coin_id.capitalize()} 图表加载完成。")
-
-    def draw_chart(self, df, fig, ax, canvas, title):
-        # ... (此方法保持不变)
-        if df is None or df.empty:
-            ax.clear()
-            ax.text(0.5, 0.5, "无数据可绘制", ha='center', va='center')
-            canvas.draw_idle()
-            return
-        ax.clear() 
+                if attempt >= self.max_retries:
+                    logger.error("提醒投递到 %s 失败，丢弃 %d 条: %s", self.sink.name, len(batch), e)
+                    metrics.inc("cma_alert_deliveries_total", len(batch), sink=self.sink.name, result="failed")
+                    return
+                metrics.inc("cma_alert_deliveries_total", sink=self.sink.name, result="retry")
+                # 正在退出时缩短退避，在 close() 的时限内尽量送达
+                if self.stop_event.wait(min(30.0, 2.0 ** attempt) + random.uniform(0, 0.5)): time.sleep(0.5)
+
+    def close(self, timeout):
+        self.stop_event.set()
+        self.thread.join(timeout)
+
+
+class AlertDispatcher:
+    # 监控线程调用 submit() 只是入队，投递在各目标自己的线程中完成，慢目标不会拖慢监控或其他目标
+    # 各目标的投递线程在第一条提醒时才启动
+    def __init__(self, sinks, batch_size, max_retries):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.workers = None
+        self.lock = threading.Lock()
+
+    def submit(self, record):
+        with self.lock:
+            if self.workers is None: self.workers = [AlertSinkWorker(sink, self.batch_size, self.max_retries) for sink in self.sinks]
+        for worker in self.workers: worker.submit(record)
+
+    def close(self, timeout=5.0):
+        # 退出前尽量把队列中剩余的提醒投递出去
+        deadline = time.monotonic() + timeout
+        for worker in self.workers or (): worker.close(max(0.0, deadline - time.monotonic()))
+
+
+alert_store = AlertStore(ALERT_LOG_FILE_PATH if ALERT_LOG_ENABLED else None, ALERT_LOG_MAX_BYTES, ALERT_LOG_BACKUPS, ALERT_MEMORY_LIMIT)
+alert_dispatcher = AlertDispatcher(build_alert_sinks(config['alert_sinks']), ALERT_SINK_BATCH_SIZE, ALERT_SINK_MAX_RETRIES)
+
+
+# --- 界面更新调度 (后台线程只投递，Tk 主线程统一执行) ---
+class UiDispatcher:
+    # call() 按顺序执行；call_latest() 以 key 合并突发更新，只执行最后一次投递的参数
+    def __init__(self, root, interval_ms=50, budget_seconds=0.03):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.budget_seconds = budget_seconds
+        self.queue = queue.Queue()
+        self.latest = {}
+        self.lock = threading.Lock()
+        self.running = True
+        self.after_id = self.root.after(self.interval_ms, self.drain)
+
+    def call(self, func, *args):
+        self.queue.put((None, func, args))
+
+    def call_latest(self, key, func, *args):
+        with self.lock:
+            already_queued = key in self.latest
+            self.latest[key] = (func, args)
+        if not already_queued: self.queue.put((key, None, None))
+
+    def drain(self):
+        if not self.running: return
+        deadline = time.perf_counter() + self.budget_seconds
+        while time.perf_counter() < deadline:
+            try: key, func, args = self.queue.get_nowait()
+            except queue.Empty: break
+            if key is not None:
+                with self.lock: func, args = self.latest.pop(key, (None, None))
+                if func is None: continue
+            started = time.perf_counter()
+            try: func(*args)
+            except Exception as e: logger.error("界面更新错误 (%s): %s", getattr(func, '__name__', func), e)
+            metrics.observe("cma_ui_callback_seconds", time.perf_counter() - started, callback=getattr(func, '__name__', 'unknown'))
+        metrics.set_gauge("cma_ui_queue_depth", self.queue.qsize())
+        self.after_id = self.root.after(10 if not self.queue.empty() else self.interval_ms, self.drain)
+
+    def stop(self):
+        self.running = False
+        try: self.root.after_cancel(self.after_id)
+        except Exception: pass
+
+
+# --- K线渲染 (样式只构建一次，复用 artist，末根K线 blit 增量重绘) ---
+_candle_style = None
+
+
+def get_candle_style():
+    global _candle_style
+    if _candle_style is None:
         mc = mpf.make_marketcolors(up='red', down='green',
                                    edge={'up':'red', 'down':'green'},
                                    wick={'up':'red', 'down':'green'},
                                    volume='inherit', ohlc='inherit')
-        s  = mpf.make_mpf_style(marketcolors=mc, base_mpf_style='default', gridstyle=':')
-        df.index.name = 'Date' 
-        if not all(col in df.columns for col in ['open', 'high', 'low', 'close']):
-            print("K线图数据缺少OHLC列")
-            ax.text(0.5, 0.5, "数据格式错误", ha='center', va='center')
-            canvas.draw_idle()
-            return
-        try:
-            mpf.plot(df, type='candle', style=s, ax=ax,
-                     datetime_format='%m-%d %H:%M', 
-                     xrotation=20, 
-                     show_nontrading=False,
-                     tight_layout=True) 
-            ax.set_title(title, fontsize=10)
-            ax.tick_params(axis='x', labelsize=8)
-            ax.tick_params(axis='y', labelsize=8)
-        except Exception as e:
-            print(f"绘制图表错误 ({title}): {e}")
-            ax.text(0.5, 0.5, f"绘制错误: {e}", ha='center', va='center', fontsize=8, color='red')
-        canvas.draw_idle() 
-
-    def on_closing(self): 
-        # ... (此方法保持不变)
-        global monitoring_active, monitor_thread
-        self.status_label.set("正在关闭...")
-        monitoring_active = False
-        if monitor_thread and monitor_thread.is_alive():
-            print("等待监控线程结束...")
-            monitor_thread.join(timeout=7)
-            if monitor_thread.is_alive(): print("监控线程未能及时结束。")
-        print("销毁窗口。")
-        if canvas_1h: canvas_1h.get_tk_widget().destroy()
-        if canvas_4h: canvas_4h.get_tk_widget().destroy()
-        if fig_1h: plt.close(fig_1h) 
-        if fig_4h: plt.close(fig_4h)
-        self.destroy()
-
-    def start_monitoring(self): 
-        # ... (此方法保持不变)
-        global monitoring_active, monitor_thread, top_coins_data_detailed
-        if not monitoring_active:
-            self.status_label.set("获取监控币种及价格...")
-            self.start_button.config(state=tk.DISABLED)
-            self.refresh_button.config(state=tk.DISABLED)
-            threading.Thread(target=self._fetch_and_start_monitoring, daemon=True).start()
-        else:
-            messagebox.showinfo("Info", "监控已在运行。")
+        _candle_style = mpf.make_mpf_style(marketcolors=mc, base_mpf_style='default', gridstyle=':')
+    return _candle_style
 
-    def _fetch_and_start_monitoring(self): 
-        # ... (此方法保持不变)
-        global monitoring_active, monitor_thread, top_coins_data_detailed
-        fetched_data = get_top_coin_data_detailed(TOP_N_COINS)
-        if fetched_data:
-            top_coins_data_detailed = fetched_data
-            self.update_coins_display(top_coins_data_detailed)
-            monitoring_active = True
-            self.status_label.set("开始MA交叉监控...")
-            self.stop_button.config(state=tk.NORMAL)
-            self.refresh_button.config(state=tk.NORMAL)
-            monitor_thread = threading.Thread(target=self.monitoring_loop_ma_cross, daemon=True)
-            monitor_thread.start()
+
+def aggregate_ohlc_arrays(timestamps, opens, highs, lows, closes, max_bars):
+    # K线数超过画布可容纳的数量时按相邻K线合并 (open 取首、high 取大、low 取小、close 取末)，分组从最后一根往前对齐
+    n = len(closes)
+    if n <= max_bars: return timestamps, opens, highs, lows, closes, n - 1
+    bucket = math.ceil(n / max_bars)
+    offset = n % bucket
+    starts = np.arange(offset, n, bucket)
+    if offset: starts = np.concatenate(([0], starts))
+    ends = np.append(starts[1:], n) - 1
+    return (timestamps[ends], opens[starts], np.maximum.reduceat(highs, starts), np.minimum.reduceat(lows, starts),
+            closes[ends], int(starts[-1]))
+
+
+class ChartRenderer:
+    CANDLE_WIDTH = 0.6
+    MIN_PIXELS_PER_CANDLE = 3
+
+    def __init__(self, fig, ax, canvas):
+        self.fig, self.ax, self.canvas = fig, ax, canvas
+        self.raw = None  # (title, 时间戳, OHLC 矩阵)
+        self.last_bucket_start = 0
+        self.last_body = self.last_wick = None
+        self.background = None
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def show_message(self, text, **text_kwargs):
+        self.raw = None
+        self.last_body = self.last_wick = None
+        self.ax.clear()
+        self.ax.text(0.5, 0.5, text, ha='center', va='center', **text_kwargs)
+        self.canvas.draw_idle()
+
+    def render(self, df, title):
+        timestamps = df.index.values
+        ohlc = df[['open', 'high', 'low', 'close']].to_numpy(dtype='float64')
+        previous = self.raw
+        self.raw = (title, timestamps, ohlc)
+        if (previous is not None and previous[0] == title and len(previous[1]) == len(timestamps)
+                and np.array_equal(previous[1], timestamps) and np.array_equal(previous[2][:-1], ohlc[:-1])):
+            if np.array_equal(previous[2][-1], ohlc[-1]) or self._update_last_candle(ohlc): return
+        self._full_draw(title, timestamps, ohlc)
+
+    def _candle_colors(self, rising):
+        marketcolors = get_candle_style()['marketcolors']
+        key = 'up' if rising else 'down'
+        return marketcolors['candle'][key], marketcolors['edge'][key], marketcolors['wick'][key]
+
+    def _full_draw(self, title, timestamps, ohlc):
+        from matplotlib.collections import PolyCollection, LineCollection
+        from matplotlib.patches import Rectangle
+        from matplotlib.lines import Line2D
+        from matplotlib.ticker import FuncFormatter, MaxNLocator
+        ax = self.ax
+        ax.clear()
+        max_bars = max(20, int(ax.get_window_extent().width / self.MIN_PIXELS_PER_CANDLE))
+        bar_times, opens, highs, lows, closes, self.last_bucket_start = aggregate_ohlc_arrays(
+            timestamps, ohlc[:, 0], ohlc[:, 1], ohlc[:, 2], ohlc[:, 3], max_bars)
+        count = len(closes)
+        x = np.arange(count, dtype='float64')
+        half = self.CANDLE_WIDTH / 2
+        bottoms, tops = np.minimum(opens, closes), np.maximum(opens, closes)
+        rising = closes >= opens
+        body_colors = [self._candle_colors(r)[0] for r in rising[:-1]]
+        edge_colors = [self._candle_colors(r)[1] for r in rising[:-1]]
+        wick_colors = [self._candle_colors(r)[2] for r in rising[:-1]]
+        verts = np.stack([np.column_stack([x - half, bottoms]), np.column_stack([x - half, tops]),
+                          np.column_stack([x + half, tops]), np.column_stack([x + half, bottoms])], axis=1)[:-1]
+        wicks = np.stack([np.column_stack([x, lows]), np.column_stack([x, highs])], axis=1)[:-1]
+        ax.add_collection(LineCollection(wicks, colors=wick_colors, linewidths=0.8))
+        ax.add_collection(PolyCollection(verts, facecolors=body_colors, edgecolors=edge_colors, linewidths=0.5))
+        # 最后一根单独作为 animated artist，后续只更新它并 blit
+        self.last_wick = Line2D([x[-1], x[-1]], [lows[-1], highs[-1]], linewidth=0.8, animated=True)
+        self.last_body = Rectangle((x[-1] - half, bottoms[-1]), self.CANDLE_WIDTH, tops[-1] - bottoms[-1], linewidth=0.5, animated=True)
+        ax.add_line(self.last_wick)
+        ax.add_patch(self.last_body)
+        self._style_last_candle(rising[-1])
+        pad = (highs.max() - lows.min()) * 0.05 or abs(highs.max()) * 0.01 or 1.0
+        ax.set_xlim(-1, count)
+        ax.set_ylim(lows.min() - pad, highs.max() + pad)
+        labels = list(pd.DatetimeIndex(bar_times).strftime('%m-%d %H:%M'))
+        ax.xaxis.set_major_locator(MaxNLocator(nbins=6, integer=True))
+        ax.xaxis.set_major_formatter(FuncFormatter(lambda value, pos: labels[int(value)] if 0 <= int(value) < count else ''))
+        ax.grid(True, linestyle=':')
+        ax.set_title(title, fontsize=10)
+        ax.tick_params(axis='x', labelsize=8, labelrotation=20)
+        ax.tick_params(axis='y', labelsize=8)
+        self.fig.tight_layout()
+        self.canvas.draw()
+
+    def _style_last_candle(self, rising):
+        body_color, edge_color, wick_color = self._candle_colors(rising)
+        self.last_body.set_facecolor(body_color)
+        self.last_body.set_edgecolor(edge_color)
+        self.last_wick.set_color(wick_color)
+
+    def _update_last_candle(self, ohlc):
+        # 只有最后一根K线变化：更新其 artist 并 blit；超出当前 y 轴范围时返回 False 走完整重绘
+        if self.last_body is None or self.background is None: return False
+        start = self.last_bucket_start
+        open_, high, low, close = ohlc[start, 0], ohlc[start:, 1].max(), ohlc[start:, 2].min(), ohlc[-1, 3]
+        y_min, y_max = self.ax.get_ylim()
+        if high > y_max or low < y_min: return False
+        self.last_body.set_y(min(open_, close))
+        self.last_body.set_height(abs(close - open_))
+        self.last_wick.set_ydata([low, high])
+        self._style_last_candle(close >= open_)
+        self.canvas.restore_region(self.background)
+        self._blit_last_candle()
+        return True
+
+    def _blit_last_candle(self):
+        self.ax.draw_artist(self.last_wick)
+        self.ax.draw_artist(self.last_body)
+        self.canvas.blit(self.ax.bbox)
+
+    def _on_draw(self, event):
+        # 每次完整重绘 (含窗口缩放) 后重新保存背景并补画末根K线
+        if self.last_body is None or self.last_body.axes is not self.ax: return
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._blit_last_candle()
+
+
+# --- 提醒列表 (虚拟化：只渲染可见的几条，滚动条映射到环形缓冲下标) ---
+class VirtualAlertView:
+    LINES_PER_ALERT = 8  # 7 行消息 + 空行
+
+    def __init__(self, master, store, font):
+        self.store = store
+        self.frame = tk.Frame(master)
+        self.text = tk.Text(self.frame, state=tk.DISABLED, height=8, wrap=tk.WORD)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.text.tag_configure("alert_style", font=font, foreground="red")
+        self.line_height = max(1, font.metrics("linespace"))
+        self.offset = 0  # 距最新一条的偏移；0 表示跟随最新提醒
+        self.seen_total = store.total
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"): self.text.bind(sequence, self._on_wheel)
+        self.text.bind("<Configure>", lambda event: self.render())
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+        self.render()
+
+    def visible_count(self):
+        # 当前高度能容纳的提醒条数，多渲染一条避免底部留白
+        height = self.text.winfo_height()
+        if height <= 1: height = int(self.text.cget("height")) * self.line_height
+        return max(1, height // (self.line_height * self.LINES_PER_ALERT)) + 1
+
+    def on_new_alerts(self):
+        # 停留在历史位置时保持当前看到的内容不动
+        _, count, total = self.store.snapshot(0, 0)
+        if self.offset: self.offset = min(self.offset + total - self.seen_total, max(0, count - 1))
+        self.seen_total = total
+        self.render()
+
+    def on_scroll(self, action, amount, unit=None):
+        _, count, _ = self.store.snapshot(0, 0)
+        visible = self.visible_count()
+        if action == "moveto":
+            self.offset = count - (round(float(amount) * count) + visible)
         else:
-            self.status_label.set("获取监控币种失败。请检查网络或API。")
+            step = int(amount) * (visible if unit == "pages" else 1)
+            self.offset -= step
+        self.offset = max(0, min(self.offset, max(0, count - visible)))
+        self.render()
+
+    def _on_wheel(self, event):
+        if getattr(event, 'num', None) == 4 or getattr(event, 'delta', 0) > 0: self.on_scroll("scroll", -1, "units")
+        else: self.on_scroll("scroll", 1, "units")
+        return "break"
+
+    def render(self):
+        _, count, _ = self.store.snapshot(0, 0)
+        visible = self.visible_count()
+        stop = count - self.offset
+        records, count, _ = self.store.snapshot(stop - visible, stop)
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        for record in records: self.text.insert(tk.END, f"[{format_alert_time(record)}] {record['message']}\n\n", "alert_style")
+        self.text.config(state=tk.DISABLED)
+        if self.offset == 0: self.text.see(tk.END)
+        if count: self.scrollbar.set(max(0, stop - visible) / count, stop / count)
+        else: self.scrollbar.set(0, 1)
+
+
+def _define_gui_class():
+    # 窗口类继承 tk.Tk，由 _load_gui_modules() 在导入 tkinter 之后定义；导入本模块时不需要 tkinter
+    class CryptoMonitorGUI(tk.Tk):
+        __qualname__ = "CryptoMonitorGUI"  # 与模块级名称一致 (repr、pickle)
+
+        def __init__(self, view_store=None):
+            # view_store 为 CoordinationStore 时为只读界面：不运行监控，只显示分片 worker 写入协调库的币种、报价与提醒
+            super().__init__()
+            self.view_store = view_store
+            self.title("加密货币监控 Alpha (MA, 价格, K线图)" + (" - 只读" if view_store is not None else ""))
+            self.geometry("1000x750") 
+
+            # --- 字体定义 ---
+            # 获取 ScrolledText 的默认字体信息
+            default_font = tkFont.nametofont(scrolledtext.ScrolledText().cget("font"))
+            default_family = default_font.actual("family")
+            default_size = default_font.actual("size")
+        
+            # 定义新的提醒字体：红色、加粗、字号增大2
+            self.alert_font_style = tkFont.Font(family=default_family, 
+                                                size=default_size + 2, 
+                                                weight="bold")
+
+            # --- 顶部控制区域 ---
+            # ... (顶部控制区域代码保持不变)
+            self.top_controls_frame = tk.Frame(self)
+            self.top_controls_frame.pack(side=tk.TOP, fill=tk.X, padx=10, pady=5)
+
+            self.config_frame = tk.LabelFrame(self.top_controls_frame, text="监控设置")
+            self.config_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
+            tk.Label(self.config_frame, text=f"监控前 {TOP_N_COINS} 币种 (计价: {VS_CURRENCY.upper()})").pack(side=tk.LEFT, padx=5)
+            self.start_button = tk.Button(self.config_frame, text="开始监控", command=self.start_monitoring)
+            self.start_button.pack(side=tk.LEFT, padx=5)
+            self.stop_button = tk.Button(self.config_frame, text="停止监控", command=self.stop_monitoring, state=tk.DISABLED)
+            self.stop_button.pack(side=tk.LEFT, padx=5)
+            self.refresh_button = tk.Button(self.config_frame, text="刷新价格", command=self.refresh_displayed_prices, state=tk.DISABLED)
+            self.refresh_button.pack(side=tk.LEFT, padx=5)
+            self.stats_button = tk.Button(self.config_frame, text="运行统计", command=self.toggle_stats_panel)
+            self.stats_button.pack(side=tk.LEFT, padx=5)
+            self.stats_window = None
+
+            # --- 主内容区域 (左右分隔) ---
+            # ... (main_paned_window, left_pane, coins_frame, coins_tree 初始化代码保持不变)
+            self.main_paned_window = tk.PanedWindow(self, orient=tk.HORIZONTAL, sashrelief=tk.RAISED)
+            self.main_paned_window.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+            self.left_pane = tk.PanedWindow(self.main_paned_window, orient=tk.VERTICAL, sashrelief=tk.RAISED)
+            self.main_paned_window.add(self.left_pane, width=500)
+
+            self.coins_frame = tk.LabelFrame(self.left_pane, text="监控币种实时信息 (UTC+0)")
+            self.left_pane.add(self.coins_frame, height=400)
+
+            self.coins_tree = ttk.Treeview(self.coins_frame, columns=("rank", "name", "price", "change_24h", "change_1d_utc"), show="headings")
+            self.coins_tree.heading("rank", text="排名")
+            self.coins_tree.heading("name", text="名称 (符号)")
+            self.coins_tree.heading("price", text=f"现价 ({VS_CURRENCY.upper()})")
+            self.coins_tree.heading("change_24h", text="24h%")
+            self.coins_tree.heading("change_1d_utc", text="UTC日%")
+            self.coins_tree.column("rank", width=40, anchor=tk.CENTER, stretch=False)
+            self.coins_tree.column("name", width=150, stretch=True)
+            self.coins_tree.column("price", width=90, anchor=tk.E, stretch=False)
+            self.coins_tree.column("change_24h", width=70, anchor=tk.E, stretch=False)
+            self.coins_tree.column("change_1d_utc", width=70, anchor=tk.E, stretch=False)
+            self.coins_tree_scrollbar = ttk.Scrollbar(self.coins_frame, orient="vertical", command=self.coins_tree.yview)
+            self.coins_tree.configure(yscrollcommand=self.coins_tree_scrollbar.set)
+            self.coins_tree_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            self.coins_tree.pack(fill=tk.BOTH, expand=True)
+            self.coins_tree.bind("<<TreeviewSelect>>", self.on_coin_select)
+
+            self.coins_tree.tag_configure('positive', foreground='red')
+            self.coins_tree.tag_configure('negative', foreground='green')
+            self.coins_tree.tag_configure('neutral', foreground='black')
+
+            self.alert_frame = tk.LabelFrame(self.left_pane, text="MA交叉提醒")
+            self.left_pane.add(self.alert_frame) 
+            # 提醒来自有界的 alert_store 环形缓冲 (启动时载入上次运行的提醒)，只渲染可见部分
+            self.alert_view = VirtualAlertView(self.alert_frame, alert_store, self.alert_font_style)
+            self.alert_view.pack(fill=tk.BOTH, expand=True)
+
+
+            # --- 右侧面板 (K线图) ---
+            # ... (right_pane 和 K线图相关初始化代码保持不变)
+            self.right_pane = tk.Frame(self.main_paned_window) 
+            self.main_paned_window.add(self.right_pane)
+            self.charts_notebook = ttk.Notebook(self.right_pane) 
+            self.chart_frame_1h_container = ttk.Frame(self.charts_notebook)
+            self.charts_notebook.add(self.chart_frame_1h_container, text='1H K线图')
+            self.chart_label_1h = tk.Label(self.chart_frame_1h_container, text="请在左侧列表选择币种以加载图表")
+            self.chart_label_1h.pack(expand=True, fill=tk.BOTH)
+            self.chart_frame_4h_container = ttk.Frame(self.charts_notebook)
+            self.charts_notebook.add(self.chart_frame_4h_container, text='4H K线图')
+            self.chart_label_4h = tk.Label(self.chart_frame_4h_container, text="请在左侧列表选择币种以加载图表")
+            self.chart_label_4h.pack(expand=True, fill=tk.BOTH)
+            self.charts_notebook.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
+            self.selected_coin_label = tk.Label(self.right_pane, text="当前选择: 无")
+            self.selected_coin_label.pack(fill=tk.X, pady=2)
+
+            # --- 底部状态栏 ---
+            # ... (底部状态栏代码保持不变)
+            self.status_label = tk.StringVar(self)
+            self.status_label.set("就绪")
+            tk.Label(self, textvariable=self.status_label, bd=1, relief=tk.SUNKEN, anchor=tk.W).pack(side=tk.BOTTOM, fill=tk.X)
+
+            self.protocol("WM_DELETE_WINDOW", self.on_closing)
+            # 后台线程一律通过 self.ui 更新界面
+            self.ui = UiDispatcher(self)
+            self.coin_rows = {}  # iid -> (values, tag)，用于 Treeview 差量更新
+            self.coin_row_order = []
+            self.coin_row_rank = {}
+            # 合并中的币种列表更新：False 无待处理，None 需全量，dict 为累积的变化币种 (call_latest 合并时不丢变化)
+            self.coins_pending = False
+            self.coins_pending_lock = threading.Lock()
+            self.chart_request_seq = 0
+            self.chart_futures = []
+            self.monitor = CrossoverMonitor(on_alert=lambda message: self.ui.call_latest("alerts", self.display_alert, message),
+                                            on_status=self.post_status,
+                                            on_prices=self._post_coins_display,
+                                            on_price_refresh=self._fetch_and_display_prices,
+                                            on_stopped=lambda: self.ui.call(self._on_monitor_stopped))
+            self.view_stop = threading.Event()
+            if view_store is not None:
+                self.start_button.config(state=tk.DISABLED)
+                threading.Thread(target=self._view_poll_loop, daemon=True, name="coordination-view").start()
+            _load_plotting_modules()
+            self._init_chart_canvases()
+            if CHART_AUTO_REFRESH_SECONDS > 0: self.after(int(CHART_AUTO_REFRESH_SECONDS * 1000), self._auto_refresh_chart)
+            if config_notice:
+                level, notice_message = config_notice
+                (messagebox.showerror if level == "error" else messagebox.showinfo)("Error" if level == "error" else "Info", notice_message)
+
+        def _view_poll_loop(self):
+            # 只读模式的后台线程：定时读取协调库，币种列表按差量刷新，新提醒追加到 alert_store 的内存缓冲
+            previous, last_alert_id = [], 0
+            while not self.view_stop.is_set():
+                try:
+                    coins = self.view_store.load_universe()
+                    changed = diff_coin_data(previous, coins)
+                    if changed != {}: self._post_coins_display(coins, changed); previous = coins
+                    new_alerts = self.view_store.alerts_since(last_alert_id, ALERT_MEMORY_LIMIT)
+                    for last_alert_id, record in new_alerts: alert_store.append(record)
+                    if new_alerts: self.ui.call_latest("alerts", self.display_alert, None)
+                    self.post_status(format_worker_status(self.view_store.workers()))
+                except sqlite3.Error as e:
+                    self.post_status(f"读取协调库失败: {e}")
+                self.view_stop.wait(VIEW_REFRESH_SECONDS)
+
+        def _init_chart_canvases(self):
+            # ... (此方法保持不变)
+            global fig_1h, ax_1h, canvas_1h, fig_4h, ax_4h, canvas_4h
+            fig_1h, ax_1h = plt.subplots(figsize=(5,3)) 
+            plt.style.use('seaborn-v0_8-darkgrid') 
+            fig_1h.patch.set_facecolor('lightgrey') 
+            ax_1h.set_facecolor('white') 
+            canvas_1h = FigureCanvasTkAgg(fig_1h, master=self.chart_frame_1h_container)
+            fig_4h, ax_4h = plt.subplots(figsize=(5,3))
+            fig_4h.patch.set_facecolor('lightgrey')
+            ax_4h.set_facecolor('white')
+            canvas_4h = FigureCanvasTkAgg(fig_4h, master=self.chart_frame_4h_container)
+            self.chart_renderers = {'1h': ChartRenderer(fig_1h, ax_1h, canvas_1h), '4h': ChartRenderer(fig_4h, ax_4h, canvas_4h)}
+
+        def toggle_stats_panel(self):
+            # 可选的统计面板：每 2 秒刷新一次指标摘要；关闭窗口即停止刷新
+            if self.stats_window is not None:
+                self.stats_window.destroy()
+                self.stats_window = None
+                return
+            self.stats_window = tk.Toplevel(self)
+            self.stats_window.title("运行统计")
+            self.stats_window.geometry("760x420")
+            self.stats_window.protocol("WM_DELETE_WINDOW", self.toggle_stats_panel)
+            controls = tk.Frame(self.stats_window)
+            controls.pack(side=tk.TOP, fill=tk.X)
+            tk.Button(controls, text=f"剖析接下来 {PROFILE_CYCLES or 3} 个周期", command=self._request_profile).pack(side=tk.LEFT, padx=5, pady=3)
+            self.stats_text = scrolledtext.ScrolledText(self.stats_window, state=tk.DISABLED, font=("Courier", 9))
+            self.stats_text.pack(fill=tk.BOTH, expand=True)
+            self._refresh_stats_panel()
+
+        def _request_profile(self):
+            self.monitor.profile_cycles = PROFILE_CYCLES or 3
+            self.post_status(f"将在接下来 {self.monitor.profile_cycles} 个周期进行 cProfile 剖析，结果写入程序目录。")
+
+        def _refresh_stats_panel(self):
+            if self.stats_window is None: return
+            self.stats_text.config(state=tk.NORMAL)
+            self.stats_text.delete("1.0", tk.END)
+            self.stats_text.insert(tk.END, format_metrics_summary())
+            self.stats_text.config(state=tk.DISABLED)
+            self.stats_window.after(2000, self._refresh_stats_panel)
+
+        def post_status(self, text):
+            self.ui.call_latest("status", self.status_label.set, text)
+
+        def _coin_row(self, rank, coin):
+            price, change_24h_raw, change_1d_utc_raw = coin.price, coin.change_24h, coin.change_1d
+            price_str = f"{price:,.4f}" if price is not None else "N/A"
+            tags_24h = ['neutral']
+            change_24h_str = "N/A"
+            if change_24h_raw is not None:
+                change_24h_str = f"{change_24h_raw:.2f}%"
+                if change_24h_raw > 0: tags_24h = ['positive']
+                elif change_24h_raw < 0: tags_24h = ['negative']
+            change_1d_utc_str = "N/A"
+            if change_1d_utc_raw is not None:
+                change_1d_utc_str = f"{change_1d_utc_raw:.2f}%"
+            values = (str(rank), f"{coin.name} ({coin.symbol.upper()})", price_str, change_24h_str, change_1d_utc_str)
+            return coin.coin_id, values, tags_24h[0]
+
+        def _post_coins_display(self, coins_details, changed=None):
+            # 可在任意线程调用
+            with self.coins_pending_lock:
+                if changed is None or self.coins_pending is None: self.coins_pending = None
+                elif self.coins_pending is False: self.coins_pending = dict(changed)
+                else: self.coins_pending.update(changed)
+            self.ui.call_latest("coins_display", self._apply_coins_display, coins_details)
+
+        def _apply_coins_display(self, coins_details):
+            with self.coins_pending_lock: changed, self.coins_pending = self.coins_pending, False
+            self.update_coins_display(coins_details, None if changed is False else changed)
+
+        def update_coins_display(self, coins_details, changed=None):
+            # 差量刷新：已有行原地更新变化的单元格，只插入新币种、删除消失的币种，保留选中状态
+            # changed 为 {coin_id: 记录} 时 (币种与排名未变) 只重算这些行
+            columns = self.coins_tree["columns"]
+            if changed is not None:
+                for coin_id, coin in changed.items():
+                    rank = self.coin_row_rank.get(coin_id)
+                    if rank is None: continue
+                    try: iid, values, tag = self._coin_row(rank, coin)
+                    except Exception as e: print(f"更新币种显示错误: {coin} - {e}"); continue
+                    old_values, old_tag = self.coin_rows[iid]
+                    for column, old_value, new_value in zip(columns, old_values, values):
+                        if old_value != new_value: self.coins_tree.set(iid, column, new_value)
+                    if old_tag != tag: self.coins_tree.item(iid, tags=(tag,))
+                    self.coin_rows[iid] = (values, tag)
+                return
+            new_rows = {}
+            new_order = []
+            new_ranks = {}
+            for rank, coin in enumerate(coins_details, 1):
+                try:
+                    iid, values, tag = self._coin_row(rank, coin)
+                except Exception as e:
+                    print(f"更新币种显示错误: {coin} - {e}")
+                    iid, values, tag = f"__error_{rank}", (str(rank), "数据错误", "N/A", "N/A", "N/A"), 'neutral'
+                if iid in new_rows: continue
+                new_rows[iid] = (values, tag)
+                new_ranks[iid] = rank
+                new_order.append(iid)
+            for iid in self.coin_row_order:
+                if iid not in new_rows: self.coins_tree.delete(iid)
+            for iid in new_order:
+                values, tag = new_rows[iid]
+                old_row = self.coin_rows.get(iid)
+                if old_row is None:
+                    self.coins_tree.insert("", tk.END, iid=iid, values=values, tags=(tag,))
+                    continue
+                old_values, old_tag = old_row
+                for column, old_value, new_value in zip(columns, old_values, values):
+                    if old_value != new_value: self.coins_tree.set(iid, column, new_value)
+                if old_tag != tag: self.coins_tree.item(iid, tags=(tag,))
+            surviving_order = [iid for iid in self.coin_row_order if iid in new_rows] + [iid for iid in new_order if iid not in self.coin_rows]
+            if surviving_order != new_order:
+                first_diff = next(i for i, (a, b) in enumerate(zip(surviving_order, new_order)) if a != b)
+                for index in range(first_diff, len(new_order)): self.coins_tree.move(new_order[index], "", index)
+            self.coin_rows = new_rows
+            self.coin_row_order = new_order
+            self.coin_row_rank = new_ranks
+
+        def on_coin_select(self, event):
+            # ... (此方法保持不变)
+            global current_selected_coin_id
+            selected_item = self.coins_tree.focus() 
+            if not selected_item:
+                return
+            current_selected_coin_id = selected_item
+            item_details = self.coins_tree.item(selected_item)
+            coin_name_symbol = item_details['values'][1] if item_details['values'] else "N/A"
+            self.selected_coin_label.config(text=f"当前选择: {coin_name_symbol} ({current_selected_coin_id})")
+            print(f"选中币种: {current_selected_coin_id} - {coin_name_symbol}")
+            self.chart_label_1h.pack_forget()
+            self.chart_label_4h.pack_forget()
+            if canvas_1h: canvas_1h.get_tk_widget().pack(fill=tk.BOTH, expand=True) 
+            if canvas_4h: canvas_4h.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+            # 新的选择使之前排队中的加载/预取失效
+            self.chart_request_seq += 1
+            for future in self.chart_futures: future.cancel()
+            self.chart_futures = []
+            df_1h_chart = chart_cache.get((current_selected_coin_id, VS_CURRENCY, DAYS_FOR_1H_CHART))
+            df_4h_chart = chart_cache.get((current_selected_coin_id, VS_CURRENCY, DAYS_FOR_4H_CHART))
+            if df_1h_chart is not None and df_4h_chart is not None:
+                self._draw_loaded_charts(current_selected_coin_id, df_1h_chart, df_4h_chart)
+            else:
+                self.post_status(f"正在加载 {coin_name_symbol} 的图表数据...")
+                self.chart_futures.append(chart_executor().submit(self._load_and_draw_charts, current_selected_coin_id, self.chart_request_seq))
+            for neighbor_id in self._neighbor_coin_ids(selected_item, CHART_PREFETCH_NEIGHBORS):
+                self.chart_futures.append(chart_executor().submit(prefetch_chart_frames, neighbor_id))
+
+        def _neighbor_coin_ids(self, iid, count):
+            neighbors = []
+            previous_iid = next_iid = iid
+            for _ in range(count):
+                previous_iid = self.coins_tree.prev(previous_iid) if previous_iid else ""
+                next_iid = self.coins_tree.next(next_iid) if next_iid else ""
+                neighbors.extend(i for i in (next_iid, previous_iid) if i and not i.startswith("__error_"))
+            return neighbors
+
+        def _load_and_draw_charts(self, coin_id, request_seq, refresh=False):
+            # 后台线程只负责取数据，绘图交给主线程；选择已变化时丢弃结果 (数据仍留在缓存中)
+            if not coin_id:
+                return
+            # 取数失败 (无论本线程发起请求还是在等别的线程的同一请求) 都要把状态从"正在加载"改为失败
+            try:
+                df_1h_chart = get_chart_frame_cached(coin_id, DAYS_FOR_1H_CHART, '1h', refresh=refresh)
+                if request_seq != self.chart_request_seq: return
+                df_4h_chart = get_chart_frame_cached(coin_id, DAYS_FOR_4H_CHART, '4h', refresh=refresh)
+            except Exception as e:
+                self.ui.call(self._show_chart_error_if_current, coin_id, request_seq, e)
+                return
+            if request_seq != self.chart_request_seq: return
+            self.ui.call(self._draw_loaded_charts_if_current, coin_id, request_seq, df_1h_chart, df_4h_chart)
+
+        def _draw_loaded_charts_if_current(self, coin_id, request_seq, df_1h_chart, df_4h_chart):
+            if request_seq == self.chart_request_seq: self._draw_loaded_charts(coin_id, df_1h_chart, df_4h_chart)
+
+        def _show_chart_error_if_current(self, coin_id, request_seq, error):
+            if request_seq != self.chart_request_seq: return
+            for renderer in self.chart_renderers.values(): renderer.show_message("图表加载失败", color='red')
+            self.status_label.set(f"{coin_id.capitalize()} 图表加载失败: {error}")
+
+        def _draw_loaded_charts(self, coin_id, df_1h_chart, df_4h_chart):
+            if df_1h_chart is not None and not df_1h_chart.empty:
+                self.draw_chart(df_1h_chart, self.chart_renderers['1h'], f"{coin_id.capitalize()} 1H K线")
+            else:
+                self.chart_renderers['1h'].show_message("无1H图表数据")
+                print(f"无1H图表数据 для {coin_id}")
+            if df_4h_chart is not None and not df_4h_chart.empty:
+                self.draw_chart(df_4h_chart, self.chart_renderers['4h'], f"{coin_id.capitalize()} 4H K线")
+            else:
+                self.chart_renderers['4h'].show_message("无4H图表数据")
+                print(f"无4H图表数据 для {coin_id}")
+            self.status_label.set(f"{coin_id.capitalize()} 图表加载完成。")
+
+        def draw_chart(self, df, renderer, title):
+            if df is None or df.empty:
+                renderer.show_message("无数据可绘制")
+                return
+            if not all(col in df.columns for col in ['open', 'high', 'low', 'close']):
+                print("K线图数据缺少OHLC列")
+                renderer.show_message("数据格式错误")
+                return
+            try:
+                with metrics.timer("cma_chart_render_seconds"):
+                    renderer.render(df, title)
+            except Exception as e:
+                print(f"绘制图表错误 ({title}): {e}")
+                renderer.show_message(f"绘制错误: {e}", fontsize=8, color='red')
+
+        def _auto_refresh_chart(self):
+            # 定时刷新当前选中币种的图表；通常只有最后一根K线变化，由 ChartRenderer 增量重绘
+            if current_selected_coin_id and not any(not future.done() for future in self.chart_futures):
+                self.chart_futures.append(chart_executor().submit(self._load_and_draw_charts, current_selected_coin_id, self.chart_request_seq, True))
+            self.after(int(CHART_AUTO_REFRESH_SECONDS * 1000), self._auto_refresh_chart)
+
+        def on_closing(self): 
+            # ... (此方法保持不变)
+            self.status_label.set("正在关闭...")
+            self.view_stop.set()
+            request_monitor_stop()
+            if monitor_thread and monitor_thread.is_alive():
+                print("等待监控线程结束...")
+                monitor_thread.join(timeout=7)
+                if monitor_thread.is_alive(): print("监控线程未能及时结束。")
+            print("销毁窗口。")
+            self.ui.stop()
+            alert_dispatcher.close()
+            alert_store.close()
+            if canvas_1h: canvas_1h.get_tk_widget().destroy()
+            if canvas_4h: canvas_4h.get_tk_widget().destroy()
+            if fig_1h: plt.close(fig_1h) 
+            if fig_4h: plt.close(fig_4h)
+            self.destroy()
+
+        def start_monitoring(self): 
+            # ... (此方法保持不变)
+            if not monitoring_active:
+                self.status_label.set("获取监控币种及价格...")
+                self.start_button.config(state=tk.DISABLED)
+                self.refresh_button.config(state=tk.DISABLED)
+                threading.Thread(target=self._fetch_and_start_monitoring, daemon=True).start()
+            else:
+                messagebox.showinfo("Info", "监控已在运行。")
+
+        def _fetch_and_start_monitoring(self): 
+            # ... (此方法保持不变)
+            global monitoring_active, monitor_thread, top_coins_data_detailed
+            fetched_data = get_top_coin_data_detailed(TOP_N_COINS)
+            if fetched_data:
+                top_coins_data_detailed = fetched_data
+                self.monitor.universe_refreshed_at = time.time()
+                self._post_coins_display(top_coins_data_detailed)
+                monitoring_active = True
+                self.post_status("开始MA交叉监控...")
+                self.ui.call(self.stop_button.config, {"state": tk.NORMAL})
+                self.ui.call(self.refresh_button.config, {"state": tk.NORMAL})
+                monitor_thread = threading.Thread(target=self.monitor.monitoring_loop_ma_cross, daemon=True)
+                monitor_thread.start()
+            else:
+                self.post_status("获取监控币种失败。请检查网络或API。")
+                self.ui.call(self.start_button.config, {"state": tk.NORMAL})
+
+        def refresh_displayed_prices(self): 
+            # ... (此方法保持不变)
+            if not monitoring_active and not (monitor_thread and monitor_thread.is_alive()):
+                self.status_label.set("正在刷新价格...") 
+                threading.Thread(target=self._fetch_and_display_prices, args=(False,), daemon=True).start()
+                return
+            self.status_label.set("正在刷新价格列表...")
+            self.refresh_button.config(state=tk.DISABLED)
+            threading.Thread(target=self._fetch_and_display_prices, args=(False,), daemon=True).start()
+
+        def _fetch_and_display_prices(self, price_only=None): 
+            # 刷新按钮做完整刷新；监控循环中的定时刷新按 universe_refresh_seconds 自动走轻量价格刷新
+            self.monitor.refresh_prices(price_only)
+            if monitoring_active :
+                 self.ui.call(self.refresh_button.config, {"state": tk.NORMAL})
+            elif not (monitor_thread and monitor_thread.is_alive()): 
+                self.ui.call(self.refresh_button.config, {"state": tk.NORMAL})
+
+        def stop_monitoring(self): 
+            # ... (此方法保持不变)
+            if monitoring_active:
+                request_monitor_stop()
+                self.status_label.set("正在停止MA交叉监控...")
+                self.stop_button.config(state=tk.DISABLED)
+            else:
+                messagebox.showinfo("Info", "MA交叉监控尚未启动。")
+
+        def _on_monitor_stopped(self):
             self.start_button.config(state=tk.NORMAL)
+            self.stop_button.config(state=tk.DISABLED)
 
-    def refresh_displayed_prices(self): 
-        # ... (此方法保持不变)
-        if not monitoring_active and not (monitor_thread and monitor_thread.is_alive()):
-            self.status_label.set("正在刷新价格...") 
-            threading.Thread(target=self._fetch_and_display_prices, daemon=True).start()
-            return
-        self.status_label.set("正在刷新价格列表...")
-        self.refresh_button.config(state=tk.DISABLED)
-        threading.Thread(target=self._fetch_and_display_prices, daemon=True).start()
+        def display_alert(self, message):
+            # 提醒已由监控线程写入 alert_store，这里只刷新可见部分
+            self.alert_view.on_new_alerts()
+
+    return CryptoMonitorGUI
+
+
+# --- 检查调度 (按K线收盘对齐的 (coin, interval) 优先队列 + 全局请求预算) ---
+INTERVAL_MS = {"1H": 3600000, "4H": 4 * 3600000}
+monitor_wakeup = threading.Event()  # 停止监控时置位，调度等待立即返回
+
+
+def request_monitor_stop():
+    global monitoring_active
+    monitoring_active = False
+    monitor_wakeup.set()
+
+
+def next_bar_close(now, interval_str):
+    # 下一根K线的收盘时间 (秒)；4H 与 resample('4h') 一样按 UTC 0/4/8... 点对齐
+    interval_seconds = INTERVAL_MS[interval_str] / 1000
+    return (math.floor(now / interval_seconds) + 1) * interval_seconds
+
+
+class RequestBudget:
+    # 滑动窗口内的全局请求预算：api_get 每发出一个请求记一笔，调度器按剩余额度决定本轮派发多少币种，
+    # 避免把超出配额的任务一次性塞进令牌桶排队、让后到期的热点币种等在长队后面
+    def __init__(self, limit, window_seconds=60.0):
+        self.limit = max(1, int(limit))
+        self.window_seconds = window_seconds
+        self.sent = deque()
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        while self.sent and now - self.sent[0] >= self.window_seconds: self.sent.popleft()
+
+    def record(self):
+        with self.lock:
+            now = time.monotonic()
+            self._expire(now)
+            self.sent.append(now)
+
+    def remaining(self):
+        with self.lock:
+            self._expire(time.monotonic())
+            return max(0, self.limit - len(self.sent))
+
+    def seconds_until_available(self):
+        with self.lock:
+            now = time.monotonic()
+            self._expire(now)
+            if len(self.sent) < self.limit: return 0.0
+            return self.sent[len(self.sent) - self.limit] + self.window_seconds - now
 
-    def _fetch_and_display_prices(self): 
-        # ... (此方法保持不变)
+
+request_budget = RequestBudget(REQUEST_BUDGET_PER_MINUTE or API_RATE_LIMIT_PER_MINUTE)
+
+
+class CheckScheduler:
+    # 堆中为 (到期时间, 优先级, 序号, coin_id, interval)；重新排期时旧项留在堆里，以 due_at 为准懒删除
+    def __init__(self):
+        self.heap = []
+        self.due_at = {}
+        self.seq = itertools.count()
+
+    def schedule(self, coin_id, interval_str, due, priority=1):
+        self.due_at[(coin_id, interval_str)] = due
+        heapq.heappush(self.heap, (due, priority, next(self.seq), coin_id, interval_str))
+
+    def sync_universe(self, coin_ids, now):
+        # 新进入列表的币种立即到期；移出列表的币种删除任务
+        current = set(coin_ids)
+        for key in [key for key in self.due_at if key[0] not in current]: del self.due_at[key]
+        for coin_id in coin_ids:
+            for interval_str in INTERVAL_MS:
+                if (coin_id, interval_str) not in self.due_at: self.schedule(coin_id, interval_str, now, priority=0)
+
+    def next_due(self):
+        while self.heap and self.due_at.get(self.heap[0][3:]) != self.heap[0][0]: heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now, max_coins):
+        # 返回 {coin_id: {interval, ...}}：按到期先后 (同时到期高优先级在前)，最多 max_coins 个币种 (同一币种各周期共用一次请求)
+        due = {}
+        while self.next_due() is not None and self.heap[0][0] <= now:
+            coin_id, interval_str = self.heap[0][3:]
+            if coin_id not in due and len(due) >= max_coins: break
+            heapq.heappop(self.heap)
+            del self.due_at[(coin_id, interval_str)]
+            due.setdefault(coin_id, set()).add(interval_str)
+        return due
+
+    def backlog(self, now):
+        return sum(1 for due in self.due_at.values() if due <= now)
+
+
+# --- 监控核心 (与界面无关，GUI 与 --headless 共用) ---
+class CrossoverMonitor:
+    def __init__(self, on_alert=None, on_status=None, on_prices=None, on_price_refresh=None, on_stopped=None):
+        self.on_alert = on_alert or (lambda message: None)
+        self.on_status = on_status or (lambda text: logger.info(text))
+        self.on_prices = on_prices or (lambda coins_details, changed=None: None)
+        self.on_price_refresh = on_price_refresh or self.refresh_prices
+        self.on_stopped = on_stopped or (lambda: None)
+        self.profile_cycles = PROFILE_CYCLES  # >0 时对接下来这么多个周期做 cProfile 剖析 (统计面板可随时设置)
+        self.snapshot_loaded = False  # 每个进程只在首次启动循环时载入一次快照
+        self.snapshot_saved_at = 0.0
+        self.missed_scan_since = {}  # 快照恢复后首次取到各序列时需补查：(coin_id, interval) -> 快照时最近已收盘K线 ts
+        self.stream = None  # StreamingCandleMonitor；配置 stream_url 时在监控循环中启动
+        self.universe_refreshed_at = 0.0
+        self.ma_spreads = {}  # (coin_id, interval, 指标名) -> 最近一次检查时快慢线相对价差，调度据此判断是否接近交叉
+        self.failed_coins = set()  # 上一轮取数失败的币种，调度器提前重试
+        self.fetch_universe = lambda: get_top_coin_data_detailed(TOP_N_COINS)  # 分片 worker 换成只返回本分片币种
+
+    def display_alert(self, message):
+        self.on_alert(message)
+
+    def refresh_prices(self, price_only=None):
+        # price_only=None 时自动选择：距上次完整刷新不足 universe_refresh_seconds 只刷新价格
+        # on_prices 收到完整列表及变化的币种 {coin_id: 记录} (排名/币种变化时为 None，表示需全量重绘)
         global top_coins_data_detailed
-        fetched_data = get_top_coin_data_detailed(TOP_N_COINS)
+        previous = top_coins_data_detailed
+        if price_only is None: price_only = time.time() - self.universe_refreshed_at < UNIVERSE_REFRESH_SECONDS
+        if price_only and previous: fetched_data = refresh_coin_prices(previous)
+        else:
+            fetched_data = self.fetch_universe()
+            if fetched_data: self.universe_refreshed_at = time.time()
         if fetched_data:
             top_coins_data_detailed = fetched_data
-            self.update_coins_display(top_coins_data_detailed)
-            self.status_label.set(f"价格已于 {datetime.utcnow().strftime('%H:%M:%S UTC')} 更新")
+            self.on_prices(top_coins_data_detailed, diff_coin_data(previous, fetched_data))
+            self.on_status(f"价格已于 {datetime.utcnow().strftime('%H:%M:%S UTC')} 更新")
         else:
-            self.status_label.set("刷新价格失败。")
-        if monitoring_active :
-             self.refresh_button.config(state=tk.NORMAL)
-        elif not (monitor_thread and monitor_thread.is_alive()): 
-            self.refresh_button.config(state=tk.NORMAL)
-
-    def stop_monitoring(self): 
-        # ... (此方法保持不变)
+            self.on_status("刷新价格失败。")
+        return bool(fetched_data)
+
+    def monitoring_loop_ma_cross(self, max_cycles=None):
         global monitoring_active
-        if monitoring_active:
-            monitoring_active = False
-            self.status_label.set("正在停止MA交叉监控...")
-            self.stop_button.config(state=tk.DISABLED)
-        else:
-            messagebox.showinfo("Info", "MA交叉监控尚未启动。")
-
-    # --- 修改 display_alert 方法 ---
-    def display_alert(self, message): 
-        self.alert_text.config(state=tk.NORMAL)
-        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')
-        # 插入带标签的文本
-        self.alert_text.insert(tk.END, f"[{timestamp}] {message}\n\n", "alert_style") 
-        self.alert_text.see(tk.END)
-        self.alert_text.config(state=tk.DISABLED)
-
-    def monitoring_loop_ma_cross(self): 
-        # ... (此方法保持不变)
-        global top_coins_data_detailed, last_alert_status, monitoring_active
-        print(f"MA交叉监控循环启动. 检查间隔: {CHECK_INTERVAL_SECONDS / 60:.1f} 分钟.")
+        owned_stream = None  # 只停止本循环启动的行情流 (也可由调用方预先挂上 self.stream)
+        if self.stream is None:
+            source = build_tick_source(STREAM_URL, config['stream_subscribe'])
+            if source is not None: self.stream = owned_stream = StreamingCandleMonitor(self, source).start()
+        # 有行情流时K线收盘即检测，轮询只负责回填与修补，间隔可以放长
+        check_interval = STREAM_POLL_INTERVAL_SECONDS if self.stream else CHECK_INTERVAL_SECONDS
+        print(f"MA交叉监控循环启动. 热点币种检查间隔: {check_interval / 60:.1f} 分钟，其余币种在K线收盘后检查." if SCHEDULER_ENABLED and not self.stream
+              else f"MA交叉监控循环启动. 检查间隔: {check_interval / 60:.1f} 分钟.")
         next_price_refresh_time = time.time() 
+        cycles_done = 0
+        profiler = None
+        metrics.set_gauge("cma_check_interval_seconds", check_interval)
+        if SNAPSHOT_FILE_PATH and not self.snapshot_loaded: self.load_snapshot()
+        scheduler = CheckScheduler()
+        monitor_wakeup.clear()
 
         while monitoring_active:
-            current_loop_start_time = time.time()
-            if current_loop_start_time >= next_price_refresh_time:
+            now = time.time()
+            if now >= next_price_refresh_time:
                 print(f"循环内刷新价格显示... {datetime.utcnow().strftime('%H:%M:%S UTC')}")
-                threading.Thread(target=self._fetch_and_display_prices, daemon=True).start()
-                next_price_refresh_time = current_loop_start_time + CHECK_INTERVAL_SECONDS 
-
-            print(f"\n--- 新的MA交叉检查周期: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')} ---")
+                threading.Thread(target=self.on_price_refresh, daemon=True).start()
+                next_price_refresh_time = now + check_interval
             if not top_coins_data_detailed:
                 print("币种详细数据为空，无法进行MA检查。")
-                time.sleep(5)
+                monitor_wakeup.wait(5)
                 continue
-            for coin_detail in top_coins_data_detailed:
-                if not monitoring_active: break
-                try: coin_id, coin_symbol, coin_name, _, _, _, _ = coin_detail
-                except ValueError: print(f"数据格式错误，跳过: {coin_detail}"); continue
-                # print(f"处理MA交叉 {coin_name} ({coin_symbol.upper()})...") # 减少打印
-                df_1h_raw = get_historical_ohlc_for_ma(coin_id, days=DAYS_FOR_1H_DATA_MA) 
-                time.sleep(1.0) 
-                if not df_1h_raw.empty: self.calculate_mas_and_check_crossover(df_1h_raw, coin_id, coin_name, coin_symbol, "1H")
-                if not monitoring_active: break
-                df_hourly_for_4h_resample = get_historical_ohlc_for_ma(coin_id, days=DAYS_FOR_4H_DATA_BASE_MA) 
-                time.sleep(1.0)
-                if not df_hourly_for_4h_resample.empty and 'timestamp' in df_hourly_for_4h_resample.columns:
-                    try:
-                        df_temp = df_hourly_for_4h_resample.set_index('timestamp')
-                        df_4h_close = df_temp['close'].resample('4H').last().dropna()
-                        if not df_4h_close.empty:
-                            df_4h_processed = pd.DataFrame({'close': df_4h_close})
-                            self.calculate_mas_and_check_crossover(df_4h_processed, coin_id, coin_name, coin_symbol, "4H")
-                    except Exception as e: print(f"4H 数据重采样错误 для {coin_name}: {e}")
+            scheduler.sync_universe([coin.coin_id for coin in top_coins_data_detailed], now)
+            due = scheduler.pop_due(now, request_budget.remaining())
+            metrics.set_gauge("cma_scheduler_backlog", scheduler.backlog(now))
+            metrics.set_gauge("cma_request_budget_remaining", request_budget.remaining())
+            if due:
+                print(f"\n--- 新的MA交叉检查周期: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')} ({len(due)} 个币种) ---")
+                if profiler is None and self.profile_cycles > 0:
+                    profiler = CycleProfiler(self.profile_cycles); self.profile_cycles = 0
+                    logger.info("开始剖析接下来 %d 个周期", profiler.remaining)
+                with profiler or contextlib.nullcontext():
+                    self.run_cycle(check_interval, due)
+                if profiler is not None and (profiler.finished or not monitoring_active):
+                    profiler.dump(); profiler = None
+                self.reschedule(scheduler, due, check_interval)
+                if SNAPSHOT_FILE_PATH and time.time() - self.snapshot_saved_at >= SNAPSHOT_INTERVAL_SECONDS: self.save_snapshot()
+                cycles_done += 1
+                if cycles_done == 1: logger.info("导入到首个周期完成用时 %.2f 秒", time.perf_counter() - _IMPORT_STARTED_AT)
+                if max_cycles is not None and cycles_done >= max_cycles: monitoring_active = False
             if monitoring_active:
-                elapsed_time = time.time() - current_loop_start_time
-                sleep_duration = max(0, CHECK_INTERVAL_SECONDS - elapsed_time)
-                granular_sleep_total = sleep_duration; slept_time = 0; sleep_chunk = 1
-                # print(f"--- MA交叉周期完成. 等待 {granular_sleep_total:.1f} 秒. ---") # 减少打印
-                while monitoring_active and slept_time < granular_sleep_total:
-                    time.sleep(min(sleep_chunk, granular_sleep_total - slept_time))
-                    slept_time += sleep_chunk
+                # 睡到下一个任务到期 / 价格刷新 / 请求预算释放 (取最早者)；停止时 monitor_wakeup 立即唤醒
+                now = time.time()
+                next_due = scheduler.next_due()
+                wake_at = next_price_refresh_time if next_due is None else min(next_due, next_price_refresh_time)
+                if next_due is not None and next_due <= now: wake_at = now + max(request_budget.seconds_until_available(), 0.05)
+                monitor_wakeup.wait(max(0.0, wake_at - now))
+        if profiler is not None: profiler.dump()
+        if owned_stream is not None: owned_stream.stop(); self.stream = None
+        if SNAPSHOT_FILE_PATH and cycles_done: self.save_snapshot()
         print("MA交叉监控循环已停止.")
-        self.status_label.set("MA交叉监控已停止。")
-        self.start_button.config(state=tk.NORMAL)
-        self.stop_button.config(state=tk.DISABLED)
-
-    def calculate_mas_and_check_crossover(self, df_ohlc, coin_id, coin_name, coin_symbol, interval_str):
-        # ... (此方法保持不变，确保其中的 print 语句已修正)
-        global last_alert_status
-        if df_ohlc.empty or len(df_ohlc) < LONG_MA_PERIOD + 1: return
-        if 'close' not in df_ohlc.columns and isinstance(df_ohlc, pd.DataFrame) and len(df_ohlc.columns) == 1: close_prices = df_ohlc.iloc[:, 0]
-        elif 'close' in df_ohlc.columns: close_prices = df_ohlc['close']
-        else: return
+        self.on_status("MA交叉监控已停止。")
+        self.on_stopped()
+
+    def load_snapshot(self):
+        self.snapshot_loaded = True
+        if not os.path.exists(SNAPSHOT_FILE_PATH): return
+        try: self.missed_scan_since = load_state_snapshot(SNAPSHOT_FILE_PATH)
+        except Exception as e: logger.warning("载入状态快照失败 (%s)，本次冷启动。", e)
+
+    def save_snapshot(self):
+        started = time.perf_counter()
         try:
-            ma_short = close_prices.rolling(window=SHORT_MA_PERIOD).mean()
-            ma_long = close_prices.rolling(window=LONG_MA_PERIOD).mean()
-        except Exception as e: print(f"计算 MA 错误 для {coin_name} ({interval_str}): {e}"); return
-        if ma_short.empty or ma_long.empty or len(ma_short) < 2 or len(ma_long) < 2: return
-        current_ma_short = ma_short.iloc[-1]; previous_ma_short = ma_short.iloc[-2]
-        current_ma_long = ma_long.iloc[-1]; previous_ma_long = ma_long.iloc[-2]
-        if pd.isna(current_ma_short) or pd.isna(previous_ma_short) or pd.isna(current_ma_long) or pd.isna(previous_ma_long): return
-        current_price = close_prices.iloc[-1]; alert_key = (coin_id, interval_str)
-        if previous_ma_short <= previous_ma_long and current_ma_short > current_ma_long:
-            current_status_key = "golden_cross"
-            if last_alert_status.get(alert_key) != current_status_key:
-                message = (f"币种: {coin_name} ({coin_symbol.upper()})\n周期: {interval_str}\n类型: 金叉 (MA{SHORT_MA_PERIOD} 上穿 MA{LONG_MA_PERIOD})\n价格触发时: ${current_price:,.4f}\nMA{SHORT_MA_PERIOD}: {current_ma_short:,.4f}\nMA{LONG_MA_PERIOD}: {current_ma_long:,.4f}")
-                self.display_alert(message); print(f"交叉提醒: {message.replace(chr(10), ' | ')}"); last_alert_status[alert_key] = current_status_key
-        elif previous_ma_short >= previous_ma_long and current_ma_short < current_ma_long:
-            current_status_key = "death_cross"
-            if last_alert_status.get(alert_key) != current_status_key:
-                message = (f"币种: {coin_name} ({coin_symbol.upper()})\n周期: {interval_str}\n类型: 死叉 (MA{SHORT_MA_PERIOD} 下穿 MA{LONG_MA_PERIOD})\n价格触发时: ${current_price:,.4f}\nMA{SHORT_MA_PERIOD}: {current_ma_short:,.4f}\nMA{LONG_MA_PERIOD}: {current_ma_long:,.4f}")
-                self.display_alert(message); print(f"交叉提醒: {message.replace(chr(10), ' | ')}"); last_alert_status[alert_key] = current_status_key
-        elif current_ma_short > current_ma_long : last_alert_status[alert_key] = "golden_cross"
-        elif current_ma_short < current_ma_long : last_alert_status[alert_key] = "death_cross"
+            with alert_state_lock: save_state_snapshot(SNAPSHOT_FILE_PATH)
+        except Exception as e: logger.warning("保存状态快照失败: %s", e); return
+        self.snapshot_saved_at = time.time()
+        logger.debug("状态快照已保存，用时 %.1f ms", (time.perf_counter() - started) * 1000)
 
-# --- 数据获取函数 ---
-# ... (get_top_coin_data_detailed, get_ohlc_for_chart, get_historical_ohlc_for_ma 保持不变)
-def get_top_coin_data_detailed(limit=TOP_N_COINS):
-    url = f"{COINGECKO_API_BASE_URL}/coins/markets"
-    params = {'vs_currency': VS_CURRENCY, 'order': 'market_cap_desc', 'per_page': limit, 'page': 1, 'sparkline': 'false', 'price_change_percentage': '1d,24h'}
-    # print(f"调用API (markets): {url} 参数: {params}") # 减少打印
-    try:
-        response = requests.get(url, params=params, timeout=10); response.raise_for_status(); data = response.json()
-        return [(c['id'], c['symbol'], c['name'], c.get('current_price'), c.get('price_change_percentage_24h_in_currency'), c.get('price_change_percentage_24h'), c.get('price_change_percentage_1d_in_currency')) for c in data]
-    except requests.exceptions.RequestException as e: print(f"获取顶级币种详细数据错误: {e}"); return []
-    except Exception as e: print(f"处理顶级币种详细数据错误: {e}"); return []
+    def is_hot(self, coin, interval_str):
+        # 接近交叉 (任一指标快慢线相对价差小) 或 24h 波动大的币种
+        if coin.change_24h is not None and abs(coin.change_24h) >= SCHEDULER_HOT_CHANGE_PCT: return True
+        spreads = (self.ma_spreads.get((coin.coin_id, interval_str, spec.name), math.inf) for spec in INDICATOR_SPECS.get(interval_str, ()))
+        return min(spreads, default=math.inf) <= SCHEDULER_HOT_SPREAD
 
-def get_ohlc_for_chart(coin_id, days_param, target_interval='1h'):
-    print(f"获取图表数据: {coin_id}, days={days_param}, interval_hint={target_interval}")
-    url = f"{COINGECKO_API_BASE_URL}/coins/{coin_id}/ohlc"
-    params = {'vs_currency': VS_CURRENCY, 'days': str(days_param)}
-    try:
-        response = requests.get(url, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        if not data: return pd.DataFrame()
-        df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
-        df.set_index('timestamp', inplace=True) 
-        for col in ['open', 'high', 'low', 'close']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        df.dropna(inplace=True)
-        return df
-    except requests.exceptions.RequestException as e:
-        print(f"获取图表OHLC数据 ({coin_id}, days={days_param}) 错误: {e}")
-        if hasattr(e, 'response') and e.response is not None: print(f"响应: {e.response.text}")
-        return pd.DataFrame()
-    except Exception as e:
-        print(f"处理图表OHLC数据 ({coin_id}) 意外错误: {e}")
-        return pd.DataFrame()
+    def reschedule(self, scheduler, due, check_interval):
+        now = time.time()
+        details = {coin.coin_id: coin for coin in top_coins_data_detailed}
+        for coin_id, intervals in due.items():
+            coin = details.get(coin_id)
+            if coin is None: continue
+            for interval_str in intervals:
+                hot = False
+                if coin_id in self.failed_coins: next_check = now + SCHEDULER_RETRY_SECONDS
+                elif self.stream is not None or not SCHEDULER_ENABLED: next_check = now + check_interval
+                else:
+                    # 新K线收盘后数据需要一点时间出现在 market_chart 中
+                    next_check = next_bar_close(now, interval_str) + SCHEDULER_SETTLE_SECONDS
+                    hot = self.is_hot(coin, interval_str)
+                    if hot: next_check = min(next_check, now + check_interval)
+                scheduler.schedule(coin_id, interval_str, next_check, priority=0 if hot else 1)
+                metrics.inc("cma_scheduler_jobs_total", tier="hot" if hot else "normal")
 
-def get_historical_ohlc_for_ma(coin_id, days): 
-    url = f"{COINGECKO_API_BASE_URL}/coins/{coin_id}/market_chart"
-    params = {'vs_currency': VS_CURRENCY, 'days': str(days)}
+    def run_cycle(self, check_interval=CHECK_INTERVAL_SECONDS, due=None):
+        # 单个检查周期：并发取数 -> MA 计算 -> 提醒；记录周期耗时，超过检查间隔时按阶段归因
+        # due 为调度器派发的 {coin_id: {interval, ...}}；None 时检查全部币种的全部周期
+        cycle_started = time.perf_counter()
+        self.failed_coins = set()
+        stages_before = metrics.stage_totals()
+        series_provider.begin_cycle()
+        batch_inputs = {"1H": [], "4H": []}
+        # 所有币种的历史数据并发获取 (受共享令牌桶限速)，MA 计算与提醒仍在本线程顺序执行
+        pending = {}
+        for coin in top_coins_data_detailed:
+            if due is not None and coin.coin_id not in due: continue
+            pending[fetch_executor().submit(fetch_ma_history_for_coin, coin.coin_id)] = (coin.coin_id, coin.symbol, coin.name)
+        while pending and monitoring_active:
+            done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                coin_id, coin_symbol, coin_name = pending.pop(future)
+                try: series_1h, series_4h = future.result()
+                except Exception as e: logger.warning("获取MA数据异常 (%s): %s", coin_id, e); self.failed_coins.add(coin_id); continue
+                if not len(series_1h): self.failed_coins.add(coin_id)
+                intervals = INTERVAL_MS if due is None else due[coin_id]
+                for interval_str, series in (("1H", series_1h), ("4H", series_4h)):
+                    if not len(series): continue
+                    if self.stream is not None: self.stream.seed(coin_id, coin_name, coin_symbol, interval_str, series)
+                    since_ts = self.missed_scan_since.pop((coin_id, interval_str), None)
+                    if since_ts is not None:
+                        with alert_state_lock: self.report_missed_crosses(series, coin_id, coin_name, coin_symbol, interval_str, since_ts)
+                    last_closed_ts = _last_closed_ts(series)
+                    if last_closed_ts is not None: series_seen_ts[(coin_id, interval_str)] = last_closed_ts
+                if CROSSOVER_ENGINE == "batch":
+                    # 批量模式：本周期数据收齐后统一向量化检测
+                    if "1H" in intervals and len(series_1h): batch_inputs["1H"].append((coin_id, coin_name, coin_symbol, series_1h.closes))
+                    if "4H" in intervals and len(series_4h): batch_inputs["4H"].append((coin_id, coin_name, coin_symbol, series_4h.closes))
+                    continue
+                check_crossover = self.calculate_mas_and_check_crossover if CROSSOVER_ENGINE == "pandas" else self.check_crossover_incremental
+                with alert_state_lock, metrics.timer("cma_ma_compute_seconds", engine=CROSSOVER_ENGINE):
+                    if "1H" in intervals and len(series_1h): check_crossover(series_1h, coin_id, coin_name, coin_symbol, "1H")
+                    if "4H" in intervals and len(series_4h): check_crossover(series_4h, coin_id, coin_name, coin_symbol, "4H")
+        for future in pending: future.cancel()
+        if monitoring_active and CROSSOVER_ENGINE == "batch":
+            with alert_state_lock, metrics.timer("cma_ma_compute_seconds", engine=CROSSOVER_ENGINE):
+                for interval_str, entries in batch_inputs.items(): self.check_crossovers_batch(entries, interval_str)
+        series_provider.begin_cycle()  # 周期结束即释放本周期缓冲
+        cycle_seconds = time.perf_counter() - cycle_started
+        stages = {stage: total - stages_before[stage] for stage, total in metrics.stage_totals().items()}
+        metrics.observe("cma_cycle_seconds", cycle_seconds)
+        metrics.set_gauge("cma_last_cycle_seconds", round(cycle_seconds, 3))
+        metrics.inc("cma_cycles_total")
+        stage_text = "，".join(f"{stage} {seconds:.1f}s" for stage, seconds in stages.items())
+        logger.info("MA交叉周期完成，用时 %.1f 秒 (%s)", cycle_seconds, stage_text)
+        if cycle_seconds > check_interval:
+            metrics.inc("cma_cycle_overruns_total")
+            # 网络/解析在多个工作线程中并行，累计值可能大于周期墙钟时间
+            logger.warning("周期用时 %.1f 秒超过检查间隔 %d 秒；各阶段累计: %s (主要耗时: %s)", cycle_seconds, check_interval,
+                           stage_text, max(stages, key=stages.get))
+        return cycle_seconds
+
+    def calculate_mas_and_check_crossover(self, series, coin_id, coin_name, coin_symbol, interval_str):
+        # pandas 参考实现：每次对完整序列重新 rolling / ewm，多个指标共用的窗口只算一次
+        if not len(series): return
+        close_prices = pd.Series(series.closes)
+        indicator_cache = {}
+        for spec in INDICATOR_SPECS.get(interval_str, ()):
+            if len(close_prices) < spec.long + 1: continue
+            try:
+                ma_short = pandas_indicator_series(close_prices, spec.short_key, indicator_cache)
+                ma_long = pandas_indicator_series(close_prices, spec.long_key, indicator_cache)
+            except Exception as e: print(f"计算 {spec.name} 错误 для {coin_name} ({interval_str}): {e}"); return
+            current_ma_short = ma_short.iloc[-1]; previous_ma_short = ma_short.iloc[-2]
+            current_ma_long = ma_long.iloc[-1]; previous_ma_long = ma_long.iloc[-2]
+            if pd.isna(current_ma_short) or pd.isna(previous_ma_short) or pd.isna(current_ma_long) or pd.isna(previous_ma_long): continue
+            crossed, status = evaluate_ma_cross(previous_ma_short, previous_ma_long, current_ma_short, current_ma_long)
+            self.handle_cross_signal(coin_id, coin_name, coin_symbol, interval_str, spec, crossed, status, close_prices.iloc[-1], current_ma_short, current_ma_long)
+
+    def report_missed_crosses(self, series, coin_id, coin_name, coin_symbol, interval_str, since_ts):
+        # 快照恢复后 / 行情流断档修补后：按时间顺序检查 since_ts 之后已收盘的K线，补报期间发生的交叉；
+        # 状态随之同步到 last_alert_status，随后的实时检查按原去重规则不会重复提醒
+        timestamps, closes = series.ts, series.closes
+        first = max(1, int(np.searchsorted(timestamps, since_ts, side='right')))
+        if first >= len(timestamps) - 1: return
+        close_prices = pd.Series(closes)
+        indicator_cache = {}
+        for spec in INDICATOR_SPECS.get(interval_str, ()):
+            if len(closes) < spec.long + 1: continue
+            ma_short = pandas_indicator_series(close_prices, spec.short_key, indicator_cache).to_numpy()
+            ma_long = pandas_indicator_series(close_prices, spec.long_key, indicator_cache).to_numpy()
+            for i in range(first, len(closes) - 1):
+                values = (ma_short[i - 1], ma_long[i - 1], ma_short[i], ma_long[i])
+                if any(math.isnan(v) for v in values): continue
+                crossed, status = evaluate_ma_cross(*values)
+                self.handle_cross_signal(coin_id, coin_name, coin_symbol, interval_str, spec, crossed, status, float(closes[i]), values[2], values[3],
+                                         missed_at=int(timestamps[i]))
+
+    def check_crossover_incremental(self, series, coin_id, coin_name, coin_symbol, interval_str):
+        if not len(series): return
+        engine = ma_engines.get((coin_id, interval_str))
+        if engine is None: engine = ma_engines[(coin_id, interval_str)] = IncrementalIndicatorSet(INDICATOR_SPECS.get(interval_str, ()))
+        try: results = engine.check(series.ts, series.closes)
+        except Exception as e: print(f"计算 MA 错误 для {coin_name} ({interval_str}): {e}"); return
+        for result in results: self.handle_cross_signal(coin_id, coin_name, coin_symbol, interval_str, *result)
+
+    def check_crossovers_batch(self, entries, interval_str):
+        # entries: [(coin_id, coin_name, coin_symbol, closes ndarray), ...]
+        specs = INDICATOR_SPECS.get(interval_str, ())
+        if not entries or not specs: return
+        try:
+            sma_windows, ema_spans = indicator_windows(specs)
+            # EMA 依赖整段历史，含 EMA 时按最长序列对齐；只有 SMA 时只需最长窗口 + 1 根
+            bars = max(max(sma_windows, default=0) + 1, max(len(entry[3]) for entry in entries) if ema_spans else 0)
+            close_matrix = align_close_matrix([entry[3] for entry in entries], bars)
+            values = batch_indicator_values(close_matrix, sma_windows, ema_spans)
+        except Exception as e: logger.error("批量计算 MA 错误 (%s): %s", interval_str, e); return
+        for spec in specs:
+            result = batch_cross_status(*values[spec.short_key], *values[spec.long_key], close_matrix[:, -1])
+            alert_keys = [(entry[0], interval_str, spec.name) for entry in entries]
+            for row in np.flatnonzero(np.isfinite(result['spread'])): self.ma_spreads[alert_keys[row]] = float(result['spread'][row])
+            for row in apply_batch_alert_dedup(alert_keys, result, last_alert_status):
+                coin_id, coin_name, coin_symbol, _ = entries[row]
+                self.handle_cross_signal(coin_id, coin_name, coin_symbol, interval_str, spec, True, CROSS_STATUS_NAMES[result['status'][row]],
+                                         result['price'][row], result['ma_short'][row], result['ma_long'][row])
+
+    def handle_cross_signal(self, coin_id, coin_name, coin_symbol, interval_str, spec, crossed, status, current_price, current_ma_short, current_ma_long,
+                            missed_at=None):
+        # 按 last_alert_status 去重 (每个指标各自一套键)：只有刚交叉且与上次状态不同才提醒，其余情况只同步状态
+        # missed_at: 补报的交叉 (停机或行情流断档期间) 所在K线时间 (ms)
+        alert_key = (coin_id, interval_str, spec.name)
+        if current_price: self.ma_spreads[alert_key] = abs(current_ma_short - current_ma_long) / abs(current_price)
+        if status is None: return
+        if not crossed:
+            last_alert_status[alert_key] = status
+            return
+        if last_alert_status.get(alert_key) == status: return
+        if coordinator is not None and not claim_shared_alert(alert_key, status):
+            # 其他 worker 已对同一状态提醒过 (重新分片期间或同一分片重复启动)
+            metrics.inc("cma_alerts_deduplicated_total", interval=interval_str)
+            last_alert_status[alert_key] = status
+            return
+        short_label, long_label = f"{spec.label}{spec.short}", f"{spec.label}{spec.long}"
+        cross_desc = f"金叉 ({short_label} 上穿 {long_label})" if status == "golden_cross" else f"死叉 ({short_label} 下穿 {long_label})"
+        message = (f"币种: {coin_name} ({coin_symbol.upper()})\n周期: {interval_str}\n类型: {cross_desc}\n价格触发时: ${current_price:,.4f}\n{short_label}: {current_ma_short:,.4f}\n{long_label}: {current_ma_long:,.4f}")
+        if missed_at is not None:
+            message += f"\n发生于: {time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(missed_at / 1000))} (补报：监控中断期间)"
+        metrics.inc("cma_alerts_total", interval=interval_str, status=status, indicator=spec.name)
+        record = {'ts': time.time(), 'coin_id': coin_id, 'coin_name': coin_name, 'symbol': coin_symbol, 'interval': interval_str,
+                  'indicator': spec.name, 'status': status, 'price': float(current_price), 'ma_short': float(current_ma_short),
+                  'ma_long': float(current_ma_long), 'message': message}
+        if missed_at is not None: record['missed_at'] = int(missed_at)
+        alert_store.append(record); alert_dispatcher.submit(record)
+        self.display_alert(message); print(f"交叉提醒: {message.replace(chr(10), ' | ')}"); last_alert_status[alert_key] = status
+
+# --- 指标配置 (多组 SMA/EMA，可按周期覆盖参数) ---
+class IndicatorSpec:
+    # 一对快/慢均线；name 同时作为 last_alert_status 键的第三段
+    __slots__ = ('kind', 'short', 'long', 'name', 'label', 'short_key', 'long_key')
+
+    def __init__(self, kind, short_period, long_period):
+        self.kind = kind
+        self.short = short_period
+        self.long = long_period
+        self.name = f"{kind.upper()}{short_period}/{long_period}"
+        self.label = "MA" if kind == "sma" else "EMA"
+        self.short_key = (kind, short_period)
+        self.long_key = (kind, long_period)
+
+    def __repr__(self):
+        return f"IndicatorSpec({self.name})"
+
+
+def parse_indicator_specs(raw_specs, intervals=("1H", "4H")):
+    # 返回 {interval: [IndicatorSpec, ...]}；未配置 indicators 时沿用 short_ma_period / long_ma_period 的单个 SMA
+    # 每项形如 {"type": "ema", "short": 12, "long": 26, "intervals": ["4H"], "overrides": {"4H": {"short": 9}}}
+    raw_specs = raw_specs or [{"type": "sma", "short": SHORT_MA_PERIOD, "long": LONG_MA_PERIOD}]
+    specs = {interval_str: [] for interval_str in intervals}
+    for raw in raw_specs:
+        try:
+            for interval_str in raw.get("intervals", intervals):
+                if interval_str not in specs: raise ValueError(f"未知周期 {interval_str}")
+                params = {**raw, **raw.get("overrides", {}).get(interval_str, {})}
+                kind = str(params.get("type", "sma")).lower()
+                if kind not in ("sma", "ema"): raise ValueError(f"未知类型 {kind}")
+                spec = IndicatorSpec(kind, int(params["short"]), int(params["long"]))
+                if not 1 <= spec.short < spec.long: raise ValueError("需要 1 <= short < long")
+                if all(existing.name != spec.name for existing in specs[interval_str]): specs[interval_str].append(spec)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logger.error("指标配置 %s 无效 (%s)，已忽略", raw, e)
+    return specs
+
+
+def indicator_windows(specs):
+    # 多个指标共用的窗口只计算一次：返回 (SMA 窗口列表, EMA 周期列表)
+    keys = {key for spec in specs for key in (spec.short_key, spec.long_key)}
+    return sorted(w for kind, w in keys if kind == "sma"), sorted(w for kind, w in keys if kind == "ema")
+
+
+def pandas_indicator_series(close_prices, key, cache):
+    if key not in cache:
+        kind, window = key
+        if kind == "sma": cache[key] = close_prices.rolling(window=window).mean()
+        else: cache[key] = close_prices.ewm(span=window, adjust=False, min_periods=window).mean()
+    return cache[key]
+
+
+INDICATOR_SPECS = parse_indicator_specs(config['indicators'])
+
+
+# --- 增量指标引擎 ---
+class RollingMeanState:
+    # 逐值复刻 pandas roll_mean 的 Kahan 求和：与从同一根K线起算的 Series.rolling(window).mean() 逐位一致；
+    # 状态跨周期延续而 pandas 每次从截断后的序列起点重算时，两者只在浮点舍入误差内一致 (差几个 ULP)
+    __slots__ = ('window', 'nobs', 'sum_x', 'neg_ct', 'compensation_add', 'compensation_remove', 'num_consecutive_same_value', 'prev_value')
+
+    def __init__(self, window):
+        self.window = window
+        self.nobs = 0
+        self.sum_x = 0.0
+        self.neg_ct = 0
+        self.compensation_add = 0.0
+        self.compensation_remove = 0.0
+        self.num_consecutive_same_value = 0
+        self.prev_value = float('nan')
+
+    def add(self, val):
+        self.nobs += 1
+        y = val - self.compensation_add
+        t = self.sum_x + y
+        self.compensation_add = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1.0, val) < 0: self.neg_ct += 1
+        if val == self.prev_value: self.num_consecutive_same_value += 1
+        else: self.num_consecutive_same_value = 1
+        self.prev_value = val
+
+    def remove(self, val):
+        self.nobs -= 1
+        y = -val - self.compensation_remove
+        t = self.sum_x + y
+        self.compensation_remove = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1.0, val) < 0: self.neg_ct -= 1
+
+    def mean(self):
+        if self.num_consecutive_same_value >= self.nobs and self.nobs > 0 and self.nobs >= self.window: return self.prev_value
+        if self.nobs < self.window or self.nobs == 0: return float('nan')
+        result = self.sum_x / self.nobs
+        if self.neg_ct == 0 and result < 0: return 0.0
+        if self.neg_ct == self.nobs and result > 0: return 0.0
+        return result
+
+    def copy(self):
+        clone = RollingMeanState.__new__(RollingMeanState)
+        for name in RollingMeanState.__slots__: setattr(clone, name, getattr(self, name))
+        return clone
+
+
+class EmaState:
+    # 逐值复刻 pandas ewm(span, adjust=False) 的递推 (含归一化与常数序列分支)，前 span 根之前视为数据不足
+    __slots__ = ('span', 'alpha', 'nobs', 'value')
+
+    def __init__(self, span):
+        self.span = span
+        self.alpha = 2.0 / (span + 1.0)
+        self.nobs = 0
+        self.value = float('nan')
+
+    def add(self, val):
+        self.nobs += 1
+        if self.nobs == 1:
+            self.value = val
+        elif self.value != val:
+            old_weight = 1.0 - self.alpha
+            self.value = (old_weight * self.value + self.alpha * val) / (old_weight + self.alpha)
+
+    def mean(self):
+        return self.value if self.nobs >= self.span else float('nan')
+
+    def copy(self):
+        clone = EmaState.__new__(EmaState)
+        for name in EmaState.__slots__: setattr(clone, name, getattr(self, name))
+        return clone
+
+
+def evaluate_ma_cross(previous_ma_short, previous_ma_long, current_ma_short, current_ma_long):
+    # 返回 (是否刚发生交叉, 当前多空状态)；与原 calculate_mas_and_check_crossover 的判断顺序一致
+    if previous_ma_short <= previous_ma_long and current_ma_short > current_ma_long: return True, "golden_cross"
+    if previous_ma_short >= previous_ma_long and current_ma_short < current_ma_long: return True, "death_cross"
+    if current_ma_short > current_ma_long: return False, "golden_cross"
+    if current_ma_short < current_ma_long: return False, "death_cross"
+    return False, None
+
+
+class IncrementalIndicatorSet:
+    # 每个 (coin_id, interval) 一个实例：所有指标共用一份K线缓冲，每个不同的 SMA 窗口 / EMA 周期各一个状态，
+    # 新K线到来时每个窗口 O(1) 更新，与指标个数无关
+    # 最后一根K线视为未收盘，只做试算 (peek)，下个周期再随新数据正式提交
+    def __init__(self, specs):
+        self.specs = list(specs)
+        self.sma_windows, self.ema_spans = indicator_windows(self.specs)
+        self.reset()
+
+    def reset(self):
+        self.states = {("sma", w): RollingMeanState(w) for w in self.sma_windows}
+        self.states.update({("ema", span): EmaState(span) for span in self.ema_spans})
+        self.closes = deque(maxlen=max(self.sma_windows, default=1))
+        self.last_ts = None
+        self.values = {key: float('nan') for key in self.states}
+
+    def _advance(self, states, close):
+        n = len(self.closes)
+        for (kind, window), state in states.items():
+            if kind == "sma" and n >= window: state.remove(self.closes[-window])
+            state.add(close)
+
+    def push(self, ts, close):
+        self._advance(self.states, close)
+        self.closes.append(close)
+        self.last_ts = ts
+        self.values = {key: state.mean() for key, state in self.states.items()}
+
+    def peek(self, close):
+        # 试算一根未收盘K线后的各窗口取值，不改变已提交状态
+        states = {key: state.copy() for key, state in self.states.items()}
+        self._advance(states, close)
+        return {key: state.mean() for key, state in states.items()}
+
+    def sync(self, timestamps, closes):
+        # timestamps 为升序毫秒时间戳 (int64 数组)；提交除最后一根以外尚未见过的K线，二分定位起点
+        if len(timestamps) == 0: return
+        if self.last_ts is not None and (timestamps[0] > self.last_ts or timestamps[-1] < self.last_ts): self.reset()
+        first = 0 if self.last_ts is None else int(np.searchsorted(timestamps, self.last_ts, side='right'))
+        for ts, close in zip(timestamps[first:-1].tolist(), closes[first:-1].tolist()): self.push(ts, close)
+
+    def check(self, timestamps, closes):
+        # 返回 [(spec, 刚交叉?, 状态, 现价, 快线, 慢线), ...]；数据不足的指标不出现在结果中
+        self.sync(timestamps, closes)
+        if len(closes) == 0: return []
+        current_price = float(closes[-1])
+        current = self.peek(current_price)
+        results = []
+        for spec in self.specs:
+            values = (self.values[spec.short_key], self.values[spec.long_key], current[spec.short_key], current[spec.long_key])
+            if any(math.isnan(v) for v in values): continue
+            crossed, status = evaluate_ma_cross(*values)
+            results.append((spec, crossed, status, current_price, values[2], values[3]))
+        return results
+
+
+# --- 全市场批量 (向量化) 交叉检测 ---
+CROSS_STATUS_NAMES = (None, "golden_cross", "death_cross")
+CROSS_STATUS_CODES = {name: code for code, name in enumerate(CROSS_STATUS_NAMES)}
+
+
+def align_close_matrix(close_arrays, bars):
+    # 各币种收盘价右对齐到 (币种数 × bars) 矩阵，不足部分填 NaN
+    matrix = np.full((len(close_arrays), bars), np.nan)
+    for row, closes in enumerate(close_arrays):
+        tail = closes[-bars:]
+        if len(tail): matrix[row, bars - len(tail):] = tail
+    return matrix
+
+
+def batch_indicator_values(close_matrix, sma_windows, ema_spans):
+    # 所有指标只扫一遍收盘价：返回 {(kind, window): (上一根取值, 当前取值)}，数据不足处为 NaN
+    rows, bars = close_matrix.shape
+    values = {}
+    if sma_windows:
+        # 从最新一根往回累加：reverse_sum[:, k] 为最后 k+1 根之和，较早处的 NaN 填充只影响更长的窗口
+        reverse_sum = np.cumsum(close_matrix[:, ::-1][:, :max(sma_windows) + 1], axis=1)
+        for window in sma_windows:
+            values[("sma", window)] = ((reverse_sum[:, window] - reverse_sum[:, 0]) / window, reverse_sum[:, window - 1] / window)
+    if ema_spans:
+        # 与 EmaState 相同的递推，逐列推进、各币种向量化；各周期在同一次扫描中更新
+        ema = {span: np.full(rows, np.nan) for span in ema_spans}
+        previous = {}
+        nobs = np.zeros(rows, dtype=np.int64)
+        for column in range(bars):
+            closes = close_matrix[:, column]
+            nobs += ~np.isnan(closes)
+            if column == bars - 1: previous = {span: ema[span].copy() for span in ema_spans}
+            for span in ema_spans:
+                alpha = 2.0 / (span + 1.0)
+                old_weight = 1.0 - alpha
+                blended = (old_weight * ema[span] + alpha * closes) / (old_weight + alpha)
+                ema[span] = np.where(np.isnan(ema[span]), closes, np.where(ema[span] != closes, blended, ema[span]))
+        for span in ema_spans:
+            values[("ema", span)] = (np.where(nobs - 1 >= span, previous[span], np.nan), np.where(nobs >= span, ema[span], np.nan))
+    return values
+
+
+def batch_cross_status(previous_ma_short, current_ma_short, previous_ma_long, current_ma_long, prices):
+    # 所有币种最后两根K线的金叉/死叉掩码与当前多空状态；任一取值为 NaN 的行视为数据不足
+    valid = ~(np.isnan(current_ma_short) | np.isnan(previous_ma_short) | np.isnan(current_ma_long) | np.isnan(previous_ma_long))
+    golden = valid & (previous_ma_short <= previous_ma_long) & (current_ma_short > current_ma_long)
+    death = valid & ~golden & (previous_ma_short >= previous_ma_long) & (current_ma_short < current_ma_long)
+    status = np.zeros(len(prices), dtype=np.int8)
+    status[valid & (current_ma_short > current_ma_long)] = CROSS_STATUS_CODES["golden_cross"]
+    status[valid & (current_ma_short < current_ma_long)] = CROSS_STATUS_CODES["death_cross"]
+    # 快慢线相对价差 (调度判断是否接近交叉)；数据不足或价格为 0 的行为 NaN
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread = np.where(valid & (prices != 0), np.abs(current_ma_short - current_ma_long) / np.abs(prices), np.nan)
+    return {'golden': golden, 'death': death, 'status': status, 'price': prices,
+            'ma_short': current_ma_short, 'ma_long': current_ma_long, 'spread': spread}
+
+
+def apply_batch_alert_dedup(alert_keys, result, status_store):
+    # 在掩码上完成 last_alert_status 去重：返回需要提醒的行号，未交叉的行直接同步状态
+    previous_status = np.fromiter((CROSS_STATUS_CODES.get(status_store.get(key), 0) for key in alert_keys), dtype=np.int8, count=len(alert_keys))
+    crossed = result['golden'] | result['death']
+    for row in np.flatnonzero(~crossed & (result['status'] != 0)):
+        status_store[alert_keys[row]] = CROSS_STATUS_NAMES[result['status'][row]]
+    return np.flatnonzero(crossed & (previous_status != result['status']))
+
+
+# --- 状态快照 (热启动：提醒去重状态、增量指标状态与序列末尾，.npz 格式) ---
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_FILE_PATH = os.path.join(get_application_path(), "state_snapshot.npz") if SNAPSHOT_ENABLED else None
+_STATE_CLASSES = {"sma": RollingMeanState, "ema": EmaState}
+_STATE_INT_SLOTS = {'window', 'nobs', 'neg_ct', 'num_consecutive_same_value', 'span'}
+_STATE_WIDTH = max(len(cls.__slots__) for cls in _STATE_CLASSES.values())
+
+
+def _last_closed_ts(series):
+    # 倒数第二根为最近一根已收盘K线 (最后一根视为未收盘)
+    return int(series.ts[-2]) if len(series) >= 2 else None
+
+
+def _string_table(rows, width):
+    return np.array(rows, dtype=str).reshape(len(rows), width) if rows else np.empty((0, width), dtype='<U1')
+
+
+def save_state_snapshot(path):
+    # 先写临时文件再替换，避免中途退出留下损坏的快照
+    alert_items = list(last_alert_status.items())
+    engine_items = list(ma_engines.items())
+    seen_items = list(series_seen_ts.items())
+    state_rows, state_engine, state_kind, state_window = [], [], [], []
+    for engine_index, (_, engine) in enumerate(engine_items):
+        for (kind, window), state in engine.states.items():
+            values = [float(getattr(state, slot)) for slot in type(state).__slots__]
+            state_rows.append(values + [np.nan] * (_STATE_WIDTH - len(values)))
+            state_engine.append(engine_index); state_kind.append(kind); state_window.append(window)
+    tails = [np.asarray(engine.closes, dtype=np.float64) for _, engine in engine_items]
+    offsets = np.zeros(len(tails) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(tail) for tail in tails])
+    arrays = {
+        'version': np.array(SNAPSHOT_FORMAT_VERSION), 'saved_at': np.array(time.time()), 'vs_currency': np.array(VS_CURRENCY),
+        'specs': np.array(sorted(f"{interval_str}|{spec.name}" for interval_str, specs in INDICATOR_SPECS.items() for spec in specs), dtype=str),
+        'alert_keys': _string_table([list(key) for key, _ in alert_items], 3),
+        'alert_status': np.array([CROSS_STATUS_CODES.get(status, 0) for _, status in alert_items], dtype=np.int8),
+        'seen_keys': _string_table([list(key) for key, _ in seen_items], 2),
+        'seen_ts': np.array([ts for _, ts in seen_items], dtype=np.int64),
+        'engine_keys': _string_table([list(key) for key, _ in engine_items], 2),
+        'engine_last_ts': np.array([-1 if engine.last_ts is None else engine.last_ts for _, engine in engine_items], dtype=np.int64),
+        'engine_offsets': offsets,
+        'engine_closes': np.concatenate(tails) if tails else np.empty(0),
+        'state_engine': np.array(state_engine, dtype=np.int32), 'state_kind': np.array(state_kind, dtype=str),
+        'state_window': np.array(state_window, dtype=np.int32), 'state_values': np.array(state_rows, dtype=np.float64).reshape(-1, _STATE_WIDTH),
+    }
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f: np.savez_compressed(f, **arrays)
+    os.replace(temp_path, path)
+
+
+def _restore_state(kind, row):
+    cls = _STATE_CLASSES[kind]
+    state = cls.__new__(cls)
+    for slot, value in zip(cls.__slots__, row): setattr(state, slot, int(value) if slot in _STATE_INT_SLOTS else float(value))
+    return state
+
+
+def load_state_snapshot(path):
+    # 载入提醒状态、增量指标状态和各序列最近已收盘K线时间；指标配置改变的周期不恢复指标状态
+    # 返回 {(coin_id, interval): 最近已收盘K线 ts}，供首个周期补报停机期间的交叉；无快照时返回 {}
+    with np.load(path, allow_pickle=False) as data:
+        if int(data['version']) != SNAPSHOT_FORMAT_VERSION or str(data['vs_currency']) != VS_CURRENCY: return {}
+        saved_specs = set(data['specs'].tolist())
+        current_specs = {f"{interval_str}|{spec.name}" for interval_str, specs in INDICATOR_SPECS.items() for spec in specs}
+        unchanged_intervals = {interval_str for interval_str in INDICATOR_SPECS
+                               if {s for s in saved_specs if s.startswith(interval_str + "|")} == {s for s in current_specs if s.startswith(interval_str + "|")}}
+        for key, code in zip(data['alert_keys'].tolist(), data['alert_status'].tolist()):
+            # 不用 setdefault：分片模式下 SharedAlertStatus 只在 __setitem__ 中记录待写回协调库的键
+            if CROSS_STATUS_NAMES[code] and tuple(key) not in last_alert_status: last_alert_status[tuple(key)] = CROSS_STATUS_NAMES[code]
+        offsets, closes = data['engine_offsets'], data['engine_closes']
+        states_by_engine = {}
+        for engine_index, kind, window, row in zip(data['state_engine'].tolist(), data['state_kind'].tolist(), data['state_window'].tolist(), data['state_values']):
+            states_by_engine.setdefault(engine_index, {})[(kind, window)] = _restore_state(kind, row)
+        restored = 0
+        for engine_index, ((coin_id, interval_str), last_ts) in enumerate(zip(data['engine_keys'].tolist(), data['engine_last_ts'].tolist())):
+            if interval_str not in unchanged_intervals or (coin_id, interval_str) in ma_engines: continue
+            engine = IncrementalIndicatorSet(INDICATOR_SPECS[interval_str])
+            states = states_by_engine.get(engine_index, {})
+            if set(states) != set(engine.states): continue
+            engine.states = states
+            engine.closes.extend(closes[offsets[engine_index]:offsets[engine_index + 1]].tolist())
+            engine.last_ts = None if last_ts < 0 else last_ts
+            engine.values = {key: state.mean() for key, state in states.items()}
+            ma_engines[(coin_id, interval_str)] = engine
+            restored += 1
+        seen = {tuple(key): ts for key, ts in zip(data['seen_keys'].tolist(), data['seen_ts'].tolist())}
+        series_seen_ts.update(seen)
+        logger.info("已载入状态快照 (%s 保存)：提醒状态 %d 条，指标状态 %d 个",
+                    time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime(float(data['saved_at']))), len(data['alert_status']), restored)
+        return seen
+
+
+# --- 实时行情流 (逐笔价格聚合为 1H/4H K线，收盘即检测) ---
+# 轮询周期 (get_historical_ohlc_for_ma) 仍负责回填历史与修补断档；行情流只在K线收盘时推进增量指标并检测交叉
+
+
+def parse_tick_message(raw):
+    # 行情消息为 JSON 对象或对象数组：{"id": "bitcoin", "price": 65000.1, "ts": 1700000000000}；ts 缺省取本地时间
+    data = json.loads(raw)
+    ticks = []
+    for item in data if isinstance(data, list) else [data]:
+        coin_id, price = item.get("id") or item.get("coin_id"), item.get("price")
+        if not coin_id or price is None: continue
+        ts = item.get("ts")
+        ts = int(time.time() * 1000) if ts is None else int(ts if ts > 1e12 else ts * 1000)
+        ticks.append((coin_id, ts, float(price)))
+    return ticks
+
+
+class LineTickSource:
+    # tcp://host:port，每行一条 JSON 消息；断线后按 STREAM_RECONNECT_SECONDS 重连
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def run(self, on_message, stop_event):
+        while not stop_event.is_set():
+            try:
+                with socket.create_connection((self.host, self.port), timeout=10) as sock:
+                    sock.settimeout(1.0)
+                    logger.info("已连接行情流 tcp://%s:%d", self.host, self.port)
+                    buffer = b""
+                    while not stop_event.is_set():
+                        try: chunk = sock.recv(65536)
+                        except socket.timeout: continue
+                        if not chunk: break
+                        *lines, buffer = (buffer + chunk).split(b"\n")
+                        for line in lines:
+                            if line.strip(): on_message(line)
+            except OSError as e: logger.warning("行情流连接错误: %s", e)
+            stop_event.wait(STREAM_RECONNECT_SECONDS)
+
+
+class WebSocketTickSource:
+    # ws:// 或 wss://，需要可选依赖 websocket-client；subscribe 为连接后发送的订阅消息 (config 中的 stream_subscribe)
+    def __init__(self, url, subscribe=None):
+        self.url = url
+        self.subscribe = subscribe
+
+    def run(self, on_message, stop_event):
+        try: import websocket
+        except ImportError: logger.error("WebSocket 行情流需要安装 websocket-client (pip install websocket-client)"); return
+        while not stop_event.is_set():
+            try:
+                ws = websocket.create_connection(self.url, timeout=10)
+                ws.settimeout(1.0)
+                logger.info("已连接行情流 %s", self.url)
+                if self.subscribe is not None: ws.send(json.dumps(self.subscribe))
+                try:
+                    while not stop_event.is_set():
+                        try: message = ws.recv()
+                        except websocket.WebSocketTimeoutException: continue
+                        if not message: break
+                        on_message(message)
+                finally: ws.close()
+            except (OSError, websocket.WebSocketException) as e: logger.warning("行情流连接错误: %s", e)
+            stop_event.wait(STREAM_RECONNECT_SECONDS)
+
+
+def build_tick_source(url, subscribe=None):
+    if not url: return None
+    if url.startswith(("ws://", "wss://")): return WebSocketTickSource(url, subscribe)
+    if url.startswith("tcp://"):
+        host, _, port = url[len("tcp://"):].rpartition(":")
+        return LineTickSource(host or "127.0.0.1", int(port))
+    logger.error("无法识别的 stream_url: %s (支持 tcp:// 与 ws:// / wss://)", url)
+    return None
+
+
+class CandleAggregator:
+    # 单一周期的逐笔 -> K线聚合；K线以开盘时间标记，行情时钟 (最新价格的 ts) 越过收盘时间即收盘
+    def __init__(self, interval_ms):
+        self.interval_ms = interval_ms
+        self.bars = {}  # coin_id -> [start, open, high, low, close]
+        self.clock_start = None  # 行情时钟所在K线的开盘时间
+
+    def add(self, coin_id, ts, price):
+        # 返回因本次价格而收盘的K线 [(coin_id, start, open, high, low, close), ...]
+        start = ts - ts % self.interval_ms
+        closed = []
+        if self.clock_start is None or start > self.clock_start:
+            # 行情时钟进入新K线：所有仍停留在旧K线上的币种一并收盘，不必等各自的下一笔成交
+            self.clock_start = start
+            for other_id, bar in list(self.bars.items()):
+                if bar[0] < start: closed.append((other_id,) + tuple(self.bars.pop(other_id)))
+        bar = self.bars.get(coin_id)
+        if bar is None:
+            if start >= self.clock_start: self.bars[coin_id] = [start, price, price, price, price]
+        elif start == bar[0]:
+            if price > bar[2]: bar[2] = price
+            if price < bar[3]: bar[3] = price
+            bar[4] = price
+        return closed
+
+
+class StreamingCandleMonitor:
+    # 每个 (coin_id, interval) 一个独立的 IncrementalIndicatorSet，由轮询周期的数据播种；
+    # K线收盘时 push 一根并与上一根比较，交叉经 CrossoverMonitor.handle_cross_signal 去重后提醒
+    def __init__(self, monitor, source):
+        self.monitor = monitor
+        self.source = source
+        self.aggregators = {interval_str: CandleAggregator(ms) for interval_str, ms in INTERVAL_MS.items()}
+        self.engines = {}
+        self.coin_names = {}  # coin_id -> (coin_name, coin_symbol)；只处理监控列表中的币种
+        self.repairing = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.source.run, args=(self.on_message, self.stop_event), daemon=True, name="tick-stream")
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=3.0):
+        self.stop_event.set()
+        if self.thread is not None: self.thread.join(timeout)
+
+    def seed(self, coin_id, coin_name, coin_symbol, interval_str, series, force=False):
+        # 用轮询得到的K线播种；已有状态不比轮询数据旧时保留 (行情流通常领先于 market_chart)
+        # 先按周期归并为每根K线一个收盘价：market_chart 末尾的"当前"价格与最后一个小时点落在同一小时，不归并会把这根K线提交两次
+        interval_ms = INTERVAL_MS[interval_str]
+        series = resample_closes(series, interval_ms)
+        if len(series) < 2: return
+        timestamps, closes = series.ts, series.closes
+        # 最后一根视为未收盘，之前的都已收盘：以最后一根所在K线的前一根作为已提交的最新K线
+        last_ts = int(timestamps[-1])
+        last_closed_start = last_ts - last_ts % interval_ms - interval_ms
+        with self.lock:
+            self.coin_names[coin_id] = (coin_name, coin_symbol)
+            engine = self.engines.get((coin_id, interval_str))
+            if engine is not None and not force and engine.last_ts >= last_closed_start: return
+            engine = IncrementalIndicatorSet(INDICATOR_SPECS.get(interval_str, ()))
+            engine.sync(timestamps, closes)
+            engine.last_ts = last_closed_start
+            self.engines[(coin_id, interval_str)] = engine
+
+    def on_message(self, raw):
+        try: ticks = parse_tick_message(raw)
+        except (ValueError, TypeError, AttributeError) as e: logger.debug("无法解析行情消息 (%s): %r", e, raw[:200]); return
+        for coin_id, ts, price in ticks:
+            metrics.inc("cma_stream_ticks_total")
+            for interval_str, aggregator in self.aggregators.items():
+                for closed_id, start, _, _, _, close in aggregator.add(coin_id, ts, price):
+                    if closed_id in self.coin_names: self.on_bar_close(closed_id, interval_str, start, close)
+
+    def on_bar_close(self, coin_id, interval_str, start, close, allow_repair=True):
+        metrics.inc("cma_stream_bars_total", interval=interval_str)
+        key = (coin_id, interval_str)
+        with self.lock:
+            engine = self.engines.get(key)
+            if engine is None or start <= engine.last_ts: return
+            if start > engine.last_ts + INTERVAL_MS[interval_str]:
+                gap = True
+            else:
+                gap = False
+                previous = dict(engine.values)
+                engine.push(start, close)
+                current = dict(engine.values)
+        if gap:
+            # 行情流断档 (断线、漏推)：经轮询路径补齐后再处理这根K线
+            if allow_repair: self.request_repair(coin_id, interval_str, start, close)
+            else: logger.info("%s %s 行情断档，等待下个轮询周期补齐", coin_id, interval_str)
+            return
+        coin_name, coin_symbol = self.coin_names[coin_id]
+        with alert_state_lock:
+            for spec in engine.specs:
+                values = (previous[spec.short_key], previous[spec.long_key], current[spec.short_key], current[spec.long_key])
+                if any(math.isnan(v) for v in values): continue
+                crossed, status = evaluate_ma_cross(*values)
+                self.monitor.handle_cross_signal(coin_id, coin_name, coin_symbol, interval_str, spec, crossed, status, close, values[2], values[3])
+
+    def request_repair(self, coin_id, interval_str, start, close):
+        with self.lock:
+            if coin_id in self.repairing: return
+            self.repairing.add(coin_id)
+        metrics.inc("cma_stream_repairs_total")
+        fetch_executor().submit(self._repair, coin_id, interval_str, start, close)
+
+    def _repair(self, coin_id, interval_str, start, close):
+        try:
+            provider = SharedSeriesProvider(series_provider.history_days, series_provider.days_1h)  # 独立缓冲，不影响进行中的周期
+            coin_name, coin_symbol = self.coin_names[coin_id]
+            with self.lock: previous_ts = {key[1]: engine.last_ts for key, engine in self.engines.items() if key[0] == coin_id}
+            for repair_interval, series in (("1H", provider.get_1h(coin_id)), ("4H", provider.get_4h(coin_id))):
+                if not len(series): continue
+                self.seed(coin_id, coin_name, coin_symbol, repair_interval, series)
+                # 断档期间收盘的K线逐根补报交叉
+                if repair_interval in previous_ts:
+                    with alert_state_lock: self.monitor.report_missed_crosses(series, coin_id, coin_name, coin_symbol, repair_interval, previous_ts[repair_interval])
+            self.on_bar_close(coin_id, interval_str, start, close, allow_repair=False)
+        except Exception as e: logger.warning("修补 %s 行情断档失败: %s", coin_id, e)
+        finally:
+            with self.lock: self.repairing.discard(coin_id)
+
+
+# --- 本地 OHLC 存储 (SQLite，增量更新) ---
+OHLC_STORE_FILE_NAME = "ohlc_store.sqlite3"
+OHLC_STORE_FILE_PATH = os.path.join(get_application_path(), OHLC_STORE_FILE_NAME)
+MS_PER_DAY = 86400000
+MA_STORE_INTERVAL = "market_chart_1h"
+# /ohlc 的 K线粒度由 days 决定：1-2 天为 30 分钟，3-30 天为 4 小时，31 天以上为 4 天
+OHLC_DAYS_CHOICES = (1, 7, 14, 30, 90, 180, 365)
+
+
+def _ohlc_granularity(days):
+    if days <= 2: return "30m"
+    if days <= 30: return "4h"
+    return "4d"
+
+
+class OhlcStore:
+    # 键为 (coin_id, vs_currency, interval)；bars 存 K线，sync_state 记录最近一次同步
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS bars (coin_id TEXT, vs_currency TEXT, interval TEXT, ts INTEGER, "
+                              "open REAL, high REAL, low REAL, close REAL, PRIMARY KEY (coin_id, vs_currency, interval, ts)) WITHOUT ROWID")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS sync_state (coin_id TEXT, vs_currency TEXT, interval TEXT, "
+                              "covered_since INTEGER, last_ts INTEGER, fetched_at REAL, PRIMARY KEY (coin_id, vs_currency, interval))")
+
+    def sync_state(self, coin_id, vs_currency, interval):
+        with self.lock:
+            row = self.conn.execute("SELECT covered_since, last_ts, fetched_at FROM sync_state WHERE coin_id=? AND vs_currency=? AND interval=?",
+                                    (coin_id, vs_currency, interval)).fetchone()
+        return row if row else (None, None, None)
+
+    def merge(self, coin_id, vs_currency, interval, rows, full_range_since=None, keep_since=None):
+        # rows: [(ts, open, high, low, close), ...] 按时间升序；新数据覆盖库中同一时间段之后的旧数据
+        if not rows: return
+        key = (coin_id, vs_currency, interval)
+        first_ts, last_ts = rows[0][0], rows[-1][0]
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM bars WHERE coin_id=? AND vs_currency=? AND interval=? AND ts>=?", key + (first_ts,))
+            self.conn.executemany("INSERT OR REPLACE INTO bars VALUES (?,?,?,?,?,?,?,?)", [key + tuple(r) for r in rows])
+            if keep_since is not None:
+                self.conn.execute("DELETE FROM bars WHERE coin_id=? AND vs_currency=? AND interval=? AND ts<?", key + (keep_since,))
+            row = self.conn.execute("SELECT covered_since FROM sync_state WHERE coin_id=? AND vs_currency=? AND interval=?", key).fetchone()
+            covered_since = full_range_since if full_range_since is not None or not row else row[0]
+            if keep_since is not None and covered_since is not None: covered_since = max(covered_since, keep_since)
+            self.conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?,?,?,?,?,?)", key + (covered_since, last_ts, time.time()))
+
+    def coin_ids(self, vs_currency, interval):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT coin_id FROM sync_state WHERE vs_currency=? AND interval=? ORDER BY coin_id",
+                                                        (vs_currency, interval))]
+
+    def load(self, coin_id, vs_currency, interval, since_ts):
+        with self.lock:
+            return self.conn.execute("SELECT ts, open, high, low, close FROM bars WHERE coin_id=? AND vs_currency=? AND interval=? AND ts>=? ORDER BY ts",
+                                     (coin_id, vs_currency, interval, since_ts)).fetchall()
+
+    def load_closes(self, coin_id, vs_currency, interval, since_ts):
+        # 只读收盘价，返回 (int64 时间戳, float64 收盘价) 数组
+        with self.lock:
+            rows = self.conn.execute("SELECT ts, close FROM bars WHERE coin_id=? AND vs_currency=? AND interval=? AND ts>=? ORDER BY ts",
+                                     (coin_id, vs_currency, interval, since_ts)).fetchall()
+        if not rows: return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        timestamps, closes = zip(*rows)
+        return np.array(timestamps, dtype=np.int64), np.array(closes, dtype=np.float64)
+
+
+ohlc_store = None  # 第一次用到时由 get_ohlc_store() 打开，导入模块不创建库文件
+_ohlc_store_opened = False
+_ohlc_store_lock = threading.Lock()
+
+
+def get_ohlc_store():
+    # 返回本地K线库；未启用或打开失败时为 None (之后不再重试)
+    global ohlc_store, _ohlc_store_opened
+    if ohlc_store is not None or _ohlc_store_opened: return ohlc_store
+    with _ohlc_store_lock:
+        if ohlc_store is None and not _ohlc_store_opened and OHLC_STORE_ENABLED:
+            try: ohlc_store = OhlcStore(OHLC_STORE_FILE_PATH)
+            except sqlite3.Error as e: logger.warning("打开本地K线存储失败 (%s)，将直接请求 API。", e)
+        _ohlc_store_opened = True
+    return ohlc_store
+
+
+def _rows_to_frame(rows):
+    df = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
+    return df
+
+
+def _incremental_days(requested_days, last_ts, now_ms, candidates):
+    # 选能覆盖 "上次最后一根K线至今" 的最小 days，且与原请求保持同一数据粒度
+    gap_days = (now_ms - last_ts) / MS_PER_DAY
+    for days in sorted(set(candidates) | {requested_days}):
+        if days >= gap_days and days <= requested_days: return days
+    return requested_days
+
+
+# --- K线图数据缓存 (LRU + TTL + 内存上限) ---
+class ChartFrameCache:
+    def __init__(self, max_bytes, ttl_seconds, name="chart"):
+        self.name = name  # 命中率指标的 cache 标签
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (df, expires_at, nbytes)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._pop(key)
+                entry = None
+            if entry is not None: self.entries.move_to_end(key)
+        metrics.inc("cma_cache_requests_total", cache=self.name, result="miss" if entry is None else "hit")
+        return None if entry is None else entry[0]
+
+    def put(self, key, df):
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes: return
+        with self.lock:
+            if key in self.entries: self._pop(key)
+            self.entries[key] = (df, time.monotonic() + self.ttl_seconds, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes: self._pop(next(iter(self.entries)))
+
+    def _pop(self, key):
+        _, _, nbytes = self.entries.pop(key)
+        self.total_bytes -= nbytes
+
+
+chart_cache = ChartFrameCache(CHART_CACHE_MAX_BYTES, CHART_CACHE_TTL_SECONDS)
+# 图表加载与预取用独立的小线程池，避免排在监控周期的大量请求之后
+def chart_executor(): return _executor("chart-fetch", 2)
+_chart_inflight = {}
+_chart_inflight_lock = threading.Lock()
+
+
+def get_chart_frame_cached(coin_id, days_param, target_interval, refresh=False):
+    # 命中缓存直接返回 (refresh=True 时跳过缓存)；同一数据已有线程在取时等待其结果，不重复请求
+    key = (coin_id, VS_CURRENCY, str(days_param))
+    df = None if refresh else chart_cache.get(key)
+    if df is not None: return df
+    with _chart_inflight_lock:
+        inflight = _chart_inflight.get(key)
+        if inflight is None: inflight = _chart_inflight[key] = Future(); is_owner = True
+        else: is_owner = False
+    if not is_owner:
+        try: return inflight.result()
+        except Exception as e: _chart_fetch_failed(key, inflight, e); raise
     try:
-        response = requests.get(url, params=params, timeout=15); response.raise_for_status(); data = response.json()
-        if not data or 'prices' not in data or not data['prices']: return pd.DataFrame()
-        df = pd.DataFrame(data['prices'], columns=['timestamp', 'close'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
-        df['open'] = df['close']; df['high'] = df['close']; df['low'] = df['close']
-        for col in ['open', 'high', 'low', 'close']: df[col] = pd.to_numeric(df[col], errors='coerce')
-        df.dropna(inplace=True); return df
-    except requests.exceptions.Timeout: print(f"获取MA数据 ({coin_id}, days={days}) 超时。"); return pd.DataFrame()
-    except requests.exceptions.RequestException as e: print(f"获取MA数据 ({coin_id}, days={days}) 错误: {e}"); return pd.DataFrame()
-    except Exception as e: print(f"处理MA数据 ({coin_id}) 意外错误: {e}"); return pd.DataFrame()
-
-
-def main():
-    app = CryptoMonitorGUI()
+        df = get_ohlc_for_chart(coin_id, days_param=days_param, target_interval=target_interval)
+        if df is not None and not df.empty: chart_cache.put(key, df)
+        inflight.set_result(df)
+        return df
+    except Exception as e:
+        inflight.set_exception(e)
+        _chart_fetch_failed(key, inflight, e)
+        raise
+    finally:
+        with _chart_inflight_lock:
+            if _chart_inflight.get(key) is inflight: del _chart_inflight[key]
+
+
+def _chart_fetch_failed(key, inflight, error):
+    # 取数线程与等待同一结果的线程共用：清掉进行中的条目 (只清这一次的，不误删之后新发起的请求) 并记录失败
+    with _chart_inflight_lock:
+        if _chart_inflight.get(key) is inflight: del _chart_inflight[key]
+    logger.warning("获取图表数据失败 (%s, days=%s): %s", key[0], key[2], error)
+
+
+def prefetch_chart_frames(coin_id):
+    get_chart_frame_cached(coin_id, DAYS_FOR_1H_CHART, '1h')
+    get_chart_frame_cached(coin_id, DAYS_FOR_4H_CHART, '4h')
+
+
+# --- 数据获取函数 ---
+class PriceSeries:
+    # 单个币种的收盘价序列：连续的 int64 毫秒时间戳 + float64 收盘价，按时间升序；缓冲留有余量，新数据原地追加
+    # ts / closes 为缓冲的视图 (不复制)；merge 只在纯追加时原地写入，改写已有位置或扩容时换新缓冲 (写时复制)，已取出的视图内容不变
+    __slots__ = ('ts_buffer', 'close_buffer', 'start', 'end', 'covered_since', 'fetched_at')
+
+    def __init__(self, timestamps=None, closes=None):
+        self.ts_buffer = np.empty(0, dtype=np.int64) if timestamps is None else np.asarray(timestamps, dtype=np.int64)
+        self.close_buffer = np.empty(0, dtype=np.float64) if closes is None else np.asarray(closes, dtype=np.float64)
+        self.start, self.end = 0, len(self.ts_buffer)
+        self.covered_since = None  # 已完整覆盖的起始时间 (ms)
+        self.fetched_at = None
+
+    def __len__(self): return self.end - self.start
+
+    @property
+    def ts(self): return self.ts_buffer[self.start:self.end]
+
+    @property
+    def closes(self): return self.close_buffer[self.start:self.end]
+
+    @property
+    def nbytes(self): return self.ts_buffer.nbytes + self.close_buffer.nbytes
+
+    def merge(self, timestamps, closes):
+        # 与 OhlcStore.merge 相同的规则：新数据覆盖同一时间及之后的旧数据
+        if len(timestamps) == 0: return
+        keep = int(np.searchsorted(self.ts, timestamps[0], side='left'))
+        size = keep + len(timestamps)
+        # 覆盖 end 之前的位置会改动 window() / closes 已交出的视图 (批量引擎输入、行情流修补线程仍在使用)
+        if keep < len(self) or self.start + size > len(self.ts_buffer):
+            capacity = size + size // 4 + 16
+            ts_buffer, close_buffer = np.empty(capacity, dtype=np.int64), np.empty(capacity, dtype=np.float64)
+            ts_buffer[:keep] = self.ts[:keep]; close_buffer[:keep] = self.closes[:keep]
+            self.ts_buffer, self.close_buffer, self.start = ts_buffer, close_buffer, 0
+        offset = self.start + keep
+        self.ts_buffer[offset:offset + len(timestamps)] = timestamps
+        self.close_buffer[offset:offset + len(timestamps)] = closes
+        self.end = self.start + size
+
+    def trim_before(self, since_ts):
+        self.start += int(np.searchsorted(self.ts, since_ts, side='left'))
+
+    def window(self, since_ts):
+        # since_ts 之后的只读视图
+        first = self.start + int(np.searchsorted(self.ts, since_ts, side='left'))
+        return PriceSeries(self.ts_buffer[first:self.end], self.close_buffer[first:self.end])
+
+
+def resample_closes(series, interval_ms):
+    # 小时收盘价 -> 周期收盘价：每个 floor(ts / interval) 区间取最后一个价格，K线以区间开始时间标记 (与 pandas resample().last() 相同)
+    if not len(series): return PriceSeries()
+    buckets = series.ts - series.ts % interval_ms
+    last = np.flatnonzero(np.diff(buckets))
+    last = np.append(last, len(buckets) - 1)
+    return PriceSeries(buckets[last], series.closes[last])
+
+
+class SharedSeriesProvider:
+    # 每个币种每个周期只取一次最长窗口 (常驻序列的视图)，1H 切片与 4H 重采样都由它生成
+    def __init__(self, history_days, days_1h):
+        self.history_days = history_days
+        self.days_1h = days_1h
+        self.buffers = {}
+        self.lock = threading.Lock()
+
+    def begin_cycle(self):
+        with self.lock: self.buffers.clear()
+
+    def get_hourly(self, coin_id):
+        with self.lock: series = self.buffers.get(coin_id)
+        metrics.inc("cma_cache_requests_total", cache="series", result="miss" if series is None else "hit")
+        if series is None:
+            series = get_historical_ohlc_for_ma(coin_id, days=self.history_days)
+            with self.lock: self.buffers[coin_id] = series
+        return series
+
+    def get_1h(self, coin_id):
+        # 同样按小时归并：market_chart 末尾的"当前"价格与最后一个小时点同属一根K线
+        series = self.get_hourly(coin_id)
+        if not len(series): return series
+        return resample_closes(series.window(int(series.ts[-1]) - self.days_1h * MS_PER_DAY), INTERVAL_MS["1H"])
+
+    def get_4h(self, coin_id):
+        series = self.get_hourly(coin_id)
+        with metrics.timer("cma_resample_seconds"):
+            return resample_closes(series, INTERVAL_MS["4H"])
+
+
+series_provider = SharedSeriesProvider(max(DAYS_FOR_1H_DATA_MA, DAYS_FOR_4H_DATA_BASE_MA), DAYS_FOR_1H_DATA_MA)
+
+
+def fetch_ma_history_for_coin(coin_id):
+    # 在 fetch_executor 中运行；停止监控后尚未开始的任务直接返回空结果
+    if not monitoring_active: return PriceSeries(), PriceSeries()
+    # 取数失败 (get_1h) 交给调用方记为失败币种；这里只兜住 4H 重采样，1H 结果照常使用
+    series_1h = series_provider.get_1h(coin_id)
+    try: return series_1h, series_provider.get_4h(coin_id)
+    except Exception as e: logger.warning("4H 数据重采样错误 (%s): %s", coin_id, e); return series_1h, PriceSeries()
+
+class CoinRecord:
+    # 监控列表中的一个币种 (/coins/markets 的一行)；__slots__ 不带实例字典
+    __slots__ = ('coin_id', 'symbol', 'name', 'price', 'change_24h', 'change_1d')
+
+    def __init__(self, coin_id, symbol, name, price=None, change_24h=None, change_1d=None):
+        self.coin_id, self.symbol, self.name = coin_id, symbol, name
+        self.price, self.change_24h, self.change_1d = price, change_24h, change_1d
+
+    @classmethod
+    def from_market(cls, c):
+        return cls(c['id'], c['symbol'], c['name'], c.get('current_price'), c.get('price_change_percentage_24h_in_currency'),
+                   c.get('price_change_percentage_1d_in_currency'))
+
+    def with_quote(self, price, change_24h):
+        return CoinRecord(self.coin_id, self.symbol, self.name, price, change_24h, self.change_1d)
+
+    def __eq__(self, other):
+        if not isinstance(other, CoinRecord): return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"CoinRecord({self.coin_id!r}, price={self.price!r}, change_24h={self.change_24h!r})"
+
+
+# /coins/markets 单页上限 250；更多币种分页并发获取 (共享令牌桶限速)，合并后按市值排名排序
+MARKETS_PAGE_SIZE = 250
+SIMPLE_PRICE_BATCH = 250  # /simple/price 每个请求的 ids 数，避免 URL 过长
+def markets_executor(): return _executor("markets-fetch", 4)
+
+
+def _fetch_markets_page(page, per_page):
+    params = {'vs_currency': VS_CURRENCY, 'order': 'market_cap_desc', 'per_page': per_page, 'page': page, 'sparkline': 'false', 'price_change_percentage': '1d,24h'}
+    response = api_get("/coins/markets", params, timeout=10)
+    with metrics.timer("cma_parse_seconds", endpoint="/coins/markets"):
+        return _json_loads(response.content)
+
+
+def get_top_coin_data_detailed(limit=TOP_N_COINS):
+    per_page = min(limit, MARKETS_PAGE_SIZE)
+    page_count = -(-limit // per_page)
+    futures = [markets_executor().submit(_fetch_markets_page, page, per_page) for page in range(1, page_count + 1)]
+    merged = {}
+    for page_index, future in enumerate(futures):
+        try:
+            data = future.result()
+            # 分页期间排名可能变动，同一币种出现在两页时保留先取到的；整页校验通过后再合并，坏页不留下半页数据
+            page = [(c['id'], (c.get('market_cap_rank') or float('inf'), page_index * per_page + position, CoinRecord.from_market(c))) for position, c in enumerate(data)]
+        except requests.exceptions.RequestException as e:
+            if page_index == 0: logger.warning("获取顶级币种详细数据错误: %s", e); return []
+            logger.warning("获取市值排名第 %d 页失败 (%s)，本次币种列表不完整", page_index + 1, e); continue
+        except Exception as e:
+            if page_index == 0: logger.warning("处理顶级币种详细数据错误: %s", e); return []
+            logger.warning("解析市值排名第 %d 页失败 (%s)，本次币种列表不完整", page_index + 1, e); continue
+        for coin_id, item in page:
+            if coin_id not in merged: merged[coin_id] = item
+    ranked = sorted(merged.values(), key=lambda item: item[:2])[:limit]
+    return [coin for _, _, coin in ranked]
+
+
+def _fetch_simple_prices(coin_ids):
+    params = {'ids': ",".join(coin_ids), 'vs_currencies': VS_CURRENCY, 'include_24hr_change': 'true'}
+    response = api_get("/simple/price", params, timeout=10)
+    with metrics.timer("cma_parse_seconds", endpoint="/simple/price"):
+        return _json_loads(response.content)
+
+
+def refresh_coin_prices(coins_details):
+    # 轻量价格刷新：经 /simple/price 只更新现价与 24h 涨跌幅，币种列表与排名不变；1d (UTC) 涨跌幅保留上次完整刷新的值
+    coin_ids = [coin.coin_id for coin in coins_details]
+    batches = [coin_ids[i:i + SIMPLE_PRICE_BATCH] for i in range(0, len(coin_ids), SIMPLE_PRICE_BATCH)]
+    prices = {}
+    for future in [markets_executor().submit(_fetch_simple_prices, batch) for batch in batches]:
+        try: prices.update(future.result())
+        except Exception as e: logger.warning("获取简单价格失败: %s", e)
+    if not prices: return []
+    refreshed = []
+    for coin in coins_details:
+        quote = prices.get(coin.coin_id)
+        if not quote or quote.get(VS_CURRENCY) is None: refreshed.append(coin); continue
+        refreshed.append(coin.with_quote(quote[VS_CURRENCY], quote.get(f"{VS_CURRENCY}_24h_change")))
+    return refreshed
+
+
+def diff_coin_data(previous, current):
+    # 返回 {coin_id: 新记录}，只含字段有变化的币种；币种集合或排名顺序变化时返回 None (需要全量刷新)
+    if len(previous) != len(current) or any(old.coin_id != new.coin_id for old, new in zip(previous, current)): return None
+    return {new.coin_id: new for old, new in zip(previous, current) if old != new}
+
+def get_ohlc_for_chart(coin_id, days_param, target_interval='1h'):
+    days_str = str(days_param)
+    store = get_ohlc_store()
+    if store is None or not days_str.isdigit(): return _download_ohlc_for_chart(coin_id, days_str, target_interval)
+    days = int(days_str)
+    interval = f"ohlc_{_ohlc_granularity(days)}"
+    now_ms = int(time.time() * 1000)
+    since_ts = now_ms - days * MS_PER_DAY
+    covered_since, last_ts, fetched_at = store.sync_state(coin_id, VS_CURRENCY, interval)
+    if fetched_at is not None and time.time() - fetched_at < OHLC_STORE_FRESH_SECONDS and covered_since <= since_ts:
+        rows = store.load(coin_id, VS_CURRENCY, interval, since_ts)
+        if rows:
+            metrics.inc("cma_ohlc_store_fetch_total", series="chart", mode="fresh")
+            return _rows_to_frame(rows).set_index('timestamp')
+    full_fetch = covered_since is None or covered_since > since_ts
+    metrics.inc("cma_ohlc_store_fetch_total", series="chart", mode="full" if full_fetch else "incremental")
+    if full_fetch: fetch_days = days
+    else:
+        candidates = [d for d in OHLC_DAYS_CHOICES if _ohlc_granularity(d) == _ohlc_granularity(days)]
+        fetch_days = _incremental_days(days, last_ts, now_ms, candidates)
+    timestamps, ohlc = _download_ohlc_arrays(coin_id, fetch_days, target_interval)
+    if not len(timestamps): return pd.DataFrame()
+    rows = list(zip(timestamps.tolist(), *ohlc.T.tolist()))
+    keep_since = now_ms - (days + 1) * MS_PER_DAY
+    store.merge(coin_id, VS_CURRENCY, interval, rows, full_range_since=since_ts if full_fetch else None, keep_since=keep_since)
+    return _rows_to_frame(store.load(coin_id, VS_CURRENCY, interval, since_ts)).set_index('timestamp')
+
+def _download_ohlc_for_chart(coin_id, days_param, target_interval='1h'):
+    timestamps, ohlc = _download_ohlc_arrays(coin_id, days_param, target_interval)
+    if not len(timestamps): return pd.DataFrame()
+    index = pd.DatetimeIndex(pd.to_datetime(timestamps, unit='ms', utc=True), name='timestamp')
+    return pd.DataFrame(ohlc, index=index, columns=['open', 'high', 'low', 'close'])
+
+def _download_ohlc_arrays(coin_id, days_param, target_interval='1h'):
+    # 返回 (int64 毫秒时间戳, (n, 4) float64 开高低收)；失败时为空数组
+    logger.debug("获取图表数据: %s, days=%s, interval_hint=%s", coin_id, days_param, target_interval)
+    params = {'vs_currency': VS_CURRENCY, 'days': str(days_param)}
+    empty = (np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float64))
+    try:
+        response = api_get(f"/coins/{coin_id}/ohlc", params, timeout=15)
+        with metrics.timer("cma_parse_seconds", endpoint="/coins/{id}/ohlc"):
+            rows = parse_numeric_rows(response, 5)
+            rows = rows[np.isfinite(rows).all(axis=1)]
+            return rows[:, 0].astype(np.int64), np.ascontiguousarray(rows[:, 1:])
+    except requests.exceptions.RequestException as e:
+        logger.warning("获取图表OHLC数据 (%s, days=%s) 错误: %s", coin_id, days_param, e)
+        if hasattr(e, 'response') and e.response is not None: logger.warning("响应: %s", e.response.text)
+        return empty
+    except Exception as e:
+        logger.warning("处理图表OHLC数据 (%s) 意外错误: %s", coin_id, e)
+        return empty
+
+hourly_series = {}  # coin_id -> PriceSeries：MA 用的小时收盘价常驻内存，每次只合并新数据，不再每个周期从库中整段重读
+hourly_series_lock = threading.Lock()
+
+
+def get_historical_ohlc_for_ma(coin_id, days):
+    # 返回最近 days 天小时收盘价的 PriceSeries 视图；已有数据时只请求上次之后的区间 (market_chart 的 days>=2 才保持小时粒度)
+    now_ms = int(time.time() * 1000)
+    since_ts = now_ms - days * MS_PER_DAY
+    with hourly_series_lock:
+        series = hourly_series.get(coin_id)
+        if series is None: series = hourly_series[coin_id] = _load_stored_series(coin_id)
+        covered_since, fetched_at = series.covered_since, series.fetched_at
+        last_ts = int(series.ts[-1]) if len(series) else None
+    full_fetch = covered_since is None or covered_since > since_ts or last_ts is None
+    if full_fetch or fetched_at is None or time.time() - fetched_at >= OHLC_STORE_FRESH_SECONDS:
+        metrics.inc("cma_ohlc_store_fetch_total", series="ma", mode="full" if full_fetch else "incremental")
+        fetch_days = days if full_fetch else max(2, min(days, math.ceil((now_ms - last_ts) / MS_PER_DAY)))
+        timestamps, closes = _download_historical_ohlc_for_ma(coin_id, fetch_days)
+        if not len(timestamps): return PriceSeries()
+        keep_since = now_ms - (max(days, DAYS_FOR_4H_DATA_BASE_MA, DAYS_FOR_1H_DATA_MA) + 1) * MS_PER_DAY
+        with hourly_series_lock:
+            series.merge(timestamps, closes)
+            series.trim_before(keep_since)
+            series.covered_since = max(since_ts if full_fetch else covered_since, keep_since)
+            series.fetched_at = time.time()
+        store = get_ohlc_store()
+        if store is not None:
+            # 库表仍是 OHLC 结构；market_chart 只有收盘价，open/high/low 写同一个值
+            rows = list(zip(timestamps.tolist(), *[closes.tolist()] * 4))
+            store.merge(coin_id, VS_CURRENCY, MA_STORE_INTERVAL, rows, full_range_since=since_ts if full_fetch else None, keep_since=keep_since)
+    else:
+        metrics.inc("cma_ohlc_store_fetch_total", series="ma", mode="fresh")
+    with hourly_series_lock: return series.window(since_ts)
+
+
+def _load_stored_series(coin_id):
+    # 进程内第一次用到该币种时从本地库载入 (启动后免去整段重新下载)
+    series = PriceSeries()
+    store = get_ohlc_store()
+    if store is None: return series
+    covered_since, _, fetched_at = store.sync_state(coin_id, VS_CURRENCY, MA_STORE_INTERVAL)
+    if covered_since is None: return series
+    timestamps, closes = store.load_closes(coin_id, VS_CURRENCY, MA_STORE_INTERVAL, covered_since)
+    series.merge(timestamps, closes)
+    series.covered_since, series.fetched_at = covered_since, fetched_at
+    return series
+
+
+def _download_historical_ohlc_for_ma(coin_id, days):
+    # 返回 (int64 毫秒时间戳, float64 收盘价)；失败时为空数组
+    params = {'vs_currency': VS_CURRENCY, 'days': str(days)}
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+    try:
+        response = api_get(f"/coins/{coin_id}/market_chart", params, timeout=15)
+        with metrics.timer("cma_parse_seconds", endpoint="/coins/{id}/market_chart"):
+            points = parse_numeric_rows(response, 2, key='prices')
+            points = points[np.isfinite(points).all(axis=1)]
+            return points[:, 0].astype(np.int64), np.ascontiguousarray(points[:, 1])
+    except requests.exceptions.Timeout: logger.warning("获取MA数据 (%s, days=%s) 超时。", coin_id, days); return empty
+    except requests.exceptions.RequestException as e: logger.warning("获取MA数据 (%s, days=%s) 错误: %s", coin_id, days, e); return empty
+    except Exception as e: logger.warning("处理MA数据 (%s) 意外错误: %s", coin_id, e); return empty
+
+
+# --- 回测与参数扫描 (多进程；各周期价格序列放在共享内存中，工作进程只挂载不复制) ---
+BACKTEST_MAX_HOURLY_DAYS = 90  # market_chart 超过 90 天返回日线，回测只使用小时数据
+_backtest_series = {}  # 工作进程内: interval -> (共享内存, 拼接后的收盘价, 各币种偏移)
+
+
+def history_cross_signals(closes, short_period, long_period, ma_cache=None):
+    # 对整段历史做向量化交叉判断：条件与 evaluate_ma_cross 相同，并按 handle_cross_signal 的规则去重
+    # (与上一次多空状态相同的交叉不重复计数)；返回 (信号所在K线下标, 方向 +1 金叉 / -1 死叉)
+    n = len(closes)
+    if n < long_period + 1 or short_period < 1: return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8)
+    ma_cache = {} if ma_cache is None else ma_cache
+
+    def moving_average(window):
+        # 第 i 个元素为以 closes[long-1+i] 结尾的 window 均值；逐窗口求和，避免长序列累加和的误差改变均线相等的判断
+        if window not in ma_cache: ma_cache[window] = np.lib.stride_tricks.sliding_window_view(closes, window).sum(axis=1) / window
+        return ma_cache[window][long_period - window:]
+
+    ma_short, ma_long = moving_average(short_period), moving_average(long_period)
+    state = np.sign(ma_short - ma_long).astype(np.int8)
+    golden = (ma_short[:-1] <= ma_long[:-1]) & (ma_short[1:] > ma_long[1:])
+    death = (ma_short[:-1] >= ma_long[:-1]) & (ma_short[1:] < ma_long[1:])
+    # 均线相等时状态不更新，沿用上一次的多空状态
+    last_nonzero = np.maximum.accumulate(np.where(state != 0, np.arange(len(state)), 0))
+    carried_state = state[last_nonzero]
+    fired = (golden | death) & (carried_state[:-1] != state[1:])
+    return np.flatnonzero(fired) + long_period, state[1:][fired]
+
+
+def forward_returns(closes, positions, directions, horizon):
+    # 信号后 horizon 根K线的收益，按信号方向取正负 (死叉后下跌记为正收益)；末尾不足 horizon 的信号丢弃
+    valid = positions + horizon < len(closes)
+    positions, directions = positions[valid], directions[valid]
+    return (closes[positions + horizon] / closes[positions] - 1.0) * directions
+
+
+def _pack_shared_series(close_arrays):
+    # 把各币种收盘价拼接到一块共享内存，返回 (共享内存, 偏移数组)
+    from multiprocessing import shared_memory
+    offsets = np.zeros(len(close_arrays) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(closes) for closes in close_arrays])
+    shm = shared_memory.SharedMemory(create=True, size=max(8, int(offsets[-1]) * 8))
+    values = np.ndarray((int(offsets[-1]),), dtype=np.float64, buffer=shm.buf)
+    for index, closes in enumerate(close_arrays): values[offsets[index]:offsets[index + 1]] = closes
+    return shm, offsets
+
+
+def _backtest_worker_init(layout):
+    # layout: {interval: (共享内存名, 偏移数组)}
+    from multiprocessing import shared_memory
+    for interval_str, (shm_name, offsets) in layout.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        values = np.ndarray((int(offsets[-1]),), dtype=np.float64, buffer=shm.buf)
+        _backtest_series[interval_str] = (shm, values, offsets)
+
+
+def _backtest_evaluate(interval_str, param_pairs, horizons):
+    # 在工作进程中运行：对该周期所有币种评估一组 (short, long)，返回每组参数的累计统计
+    _, values, offsets = _backtest_series[interval_str]
+    totals = {pair: {'golden': 0, 'death': 0, 'coins': 0, 'n': [0] * len(horizons), 'hits': [0] * len(horizons),
+                     'sum': [0.0] * len(horizons)} for pair in param_pairs}
+    for index in range(len(offsets) - 1):
+        closes = values[offsets[index]:offsets[index + 1]]
+        ma_cache = {}  # 同一币种的各窗口均线在参数之间复用
+        for short_period, long_period in param_pairs:
+            positions, directions = history_cross_signals(closes, short_period, long_period, ma_cache)
+            if not len(positions): continue
+            total = totals[(short_period, long_period)]
+            total['golden'] += int((directions > 0).sum())
+            total['death'] += int((directions < 0).sum())
+            total['coins'] += 1
+            for h_index, horizon in enumerate(horizons):
+                returns = forward_returns(closes, positions, directions, horizon)
+                total['n'][h_index] += len(returns)
+                total['hits'][h_index] += int((returns > 0).sum())
+                total['sum'][h_index] += float(returns.sum())
+    return interval_str, totals
+
+
+def load_backtest_series(coin_ids, days, refresh=False):
+    # 从本地 OHLC 库读取小时收盘价 (refresh=True 时先按需补齐到 days 天)，4H 序列用与监控相同的 resample_closes 生成
+    series = {"1H": [], "4H": []}
+    since_ts = int(time.time() * 1000) - days * MS_PER_DAY
+
+    def load_one(coin_id):
+        store = get_ohlc_store()
+        if refresh or store is None: return get_historical_ohlc_for_ma(coin_id, days)
+        return PriceSeries(*store.load_closes(coin_id, VS_CURRENCY, MA_STORE_INTERVAL, since_ts))
+
+    for coin_id, hourly in zip(coin_ids, fetch_executor().map(load_one, coin_ids)):
+        if not len(hourly): continue
+        series["1H"].append((coin_id, hourly.closes))
+        bars_4h = resample_closes(hourly, INTERVAL_MS["4H"])
+        if len(bars_4h): series["4H"].append((coin_id, bars_4h.closes))
+    return series
+
+
+def run_parameter_sweep(series, short_periods, long_periods, intervals=("1H", "4H"), horizons=(1, 4, 24), workers=None):
+    # series: {interval: [(coin_id, closes), ...]}；返回每个 (interval, short, long) 一行的 DataFrame
+    pairs = [(s, l) for s in sorted(set(short_periods)) for l in sorted(set(long_periods)) if s < l]
+    intervals = [interval_str for interval_str in intervals if series.get(interval_str)]
+    if not pairs or not intervals: return pd.DataFrame()
+    workers = max(1, workers or os.cpu_count() or 1)
+    shared, layout = [], {}
+    try:
+        for interval_str in intervals:
+            shm, offsets = _pack_shared_series([closes for _, closes in series[interval_str]])
+            shared.append(shm)
+            layout[interval_str] = (shm.name, offsets)
+        # 同一 long 的参数放在同一任务里以复用长均线；任务数约为进程数的 4 倍以均衡负载
+        pairs.sort(key=lambda pair: pair[1])
+        chunk_size = max(1, math.ceil(len(pairs) * len(intervals) / (workers * 4)))
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_backtest_worker_init, initargs=(layout,)) as pool:
+            futures = [pool.submit(_backtest_evaluate, interval_str, pairs[i:i + chunk_size], tuple(horizons))
+                       for interval_str in intervals for i in range(0, len(pairs), chunk_size)]
+            results = [future.result() for future in futures]
+    finally:
+        for shm in shared:
+            shm.close()
+            shm.unlink()
+    rows = []
+    for interval_str, totals in results:
+        for (short_period, long_period), total in totals.items():
+            row = {'interval': interval_str, 'short': short_period, 'long': long_period, 'coins': len(series[interval_str]),
+                   'coins_with_signals': total['coins'], 'golden': total['golden'], 'death': total['death'],
+                   'signals': total['golden'] + total['death']}
+            for h_index, horizon in enumerate(horizons):
+                n = total['n'][h_index]
+                row[f'hit_rate_{horizon}'] = total['hits'][h_index] / n if n else float('nan')
+                row[f'avg_return_{horizon}'] = total['sum'][h_index] / n if n else float('nan')
+            rows.append(row)
+    return pd.DataFrame(rows).sort_values(['interval', 'short', 'long'], ignore_index=True)
+
+
+def run_backtest(args):
+    # --backtest 入口：读取 (或补齐) 历史序列，多进程扫描参数网格并输出统计
+    days = min(args.backtest_days, BACKTEST_MAX_HOURLY_DAYS)
+    coin_ids = args.backtest_coins
+    if not coin_ids and not args.backtest_refresh and get_ohlc_store() is not None:
+        coin_ids = get_ohlc_store().coin_ids(VS_CURRENCY, MA_STORE_INTERVAL)
+    if not coin_ids:
+        coin_ids = [coin.coin_id for coin in get_top_coin_data_detailed(TOP_N_COINS)]
+    if not coin_ids:
+        logger.error("没有可回测的币种 (本地库为空且获取币种列表失败)。")
+        return 1
+    logger.info("读取 %d 个币种最近 %d 天的小时数据%s", len(coin_ids), days, " (先从 API 补齐)" if args.backtest_refresh else "")
+    series = load_backtest_series(coin_ids, days, refresh=args.backtest_refresh)
+    started = time.perf_counter()
+    result = run_parameter_sweep(series, args.shorts or [SHORT_MA_PERIOD], args.longs or [LONG_MA_PERIOD],
+                                 intervals=args.intervals, horizons=args.horizons, workers=args.workers)
+    if result.empty:
+        logger.error("没有可评估的数据或参数组合 (需要 short < long 且序列长度 > long)。")
+        return 1
+    logger.info("扫描 %d 组参数 × %d 个币种用时 %.2f 秒", len(result), max(len(v) for v in series.values()), time.perf_counter() - started)
+    rank_column = f'avg_return_{args.horizons[-1]}'
+    with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:.4f}'.format):
+        for interval_str, group in result.groupby('interval', sort=False):
+            print(f"\n=== {interval_str} (按 {rank_column} 排序，前 {args.top} 组) ===")
+            print(group.sort_values(rank_column, ascending=False).head(args.top).to_string(index=False))
+    if args.backtest_output:
+        result.to_csv(args.backtest_output, index=False)
+        logger.info("完整结果已写入 %s", args.backtest_output)
+    return 0
+
+
+# --- 分片 worker (一致性哈希划分币种；多个进程/主机经共享协调库协作) ---
+# 协调库为 SQLite：共享限速令牌桶、提醒去重状态 (last_alert_status)、提醒结果、币种列表与报价、worker 心跳；
+# 多主机时需放在支持文件锁的共享存储上
+SHARD_VIRTUAL_NODES = 400
+COORDINATION_ALERT_KEEP = 10000  # 协调库中保留的最近提醒条数
+
+
+def _stable_hash(text):
+    # 不能用 hash()：各进程的字符串哈希种子不同
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class ShardRing:
+    # 一致性哈希环：每个分片放 SHARD_VIRTUAL_NODES 个虚拟节点 (均衡各分片币种数)；分片数从 N 变为 N+1 时只有约 1/(N+1) 的币种换分片
+    def __init__(self, shard_count, virtual_nodes=SHARD_VIRTUAL_NODES):
+        points = sorted((_stable_hash(f"shard-{index}#{node}"), index) for index in range(shard_count) for node in range(virtual_nodes))
+        self.points = [point for point, _ in points]
+        self.owners = [index for _, index in points]
+
+    def shard_of(self, coin_id):
+        return self.owners[bisect.bisect(self.points, _stable_hash(coin_id)) % len(self.points)]
+
+
+class CoordinationStore:
+    # 所有写操作都在 BEGIN IMMEDIATE 事务中完成，多个进程同时读改写同一行也不会互相覆盖
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        # WAL 依赖同一主机上的共享内存索引，网络文件系统上会损坏数据库或读到旧数据；共享存储时用默认的回滚日志
+        self.conn.execute(f"PRAGMA journal_mode={'DELETE' if COORDINATION_STORE_SHARED else 'WAL'}")
+        with self.transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, tokens REAL, updated_at REAL, blocked_until REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS alert_status (coin_id TEXT, interval TEXT, indicator TEXT, status TEXT, updated_at REAL, "
+                         "PRIMARY KEY (coin_id, interval, indicator)) WITHOUT ROWID")
+            conn.execute("CREATE TABLE IF NOT EXISTS alerts (id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL, worker TEXT, record TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS coins (coin_id TEXT PRIMARY KEY, rank INTEGER, symbol TEXT, name TEXT, price REAL, "
+                         "change_24h REAL, change_1d REAL, updated_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT, expires_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, shard_index INTEGER, shard_count INTEGER, host TEXT, "
+                         "pid INTEGER, coins INTEGER, cycles INTEGER, last_cycle_seconds REAL, heartbeat_at REAL)")
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try: yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def take_token(self, name, rate_per_second, capacity):
+        # 返回 (是否取得令牌, 需等待秒数)
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at, blocked_until FROM rate_buckets WHERE name=?", (name,)).fetchone()
+            tokens, updated_at, blocked_until = row if row else (float(capacity), now, 0.0)
+            tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate_per_second)
+            acquired, wait_seconds = False, blocked_until - now
+            if wait_seconds <= 0:
+                if tokens >= 1: tokens -= 1; acquired = True
+                else: wait_seconds = (1 - tokens) / rate_per_second
+            conn.execute("INSERT OR REPLACE INTO rate_buckets VALUES (?,?,?,?)", (name, tokens, now, blocked_until))
+        return acquired, max(0.0, wait_seconds)
+
+    def penalize(self, name, seconds):
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT blocked_until FROM rate_buckets WHERE name=?", (name,)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO rate_buckets VALUES (?,?,?,?)", (name, 0.0, now, max(row[0] if row else 0.0, now + seconds)))
+
+    def load_alert_status(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT coin_id, interval, indicator, status FROM alert_status").fetchall()
+        return {(coin_id, interval_str, indicator): status for coin_id, interval_str, indicator, status in rows}
+
+    def _write_alert_status(self, conn, statuses):
+        now = time.time()
+        conn.executemany("INSERT OR REPLACE INTO alert_status VALUES (?,?,?,?,?)", [key + (status, now) for key, status in statuses.items()])
+
+    def flush_alert_status(self, statuses):
+        if not statuses: return
+        with self.transaction() as conn: self._write_alert_status(conn, statuses)
+
+    def claim_alert(self, alert_key, status, pending):
+        # 先写回本地积累的状态变化，再原子地比较并设置：库中已是同一状态 (其他 worker 已提醒) 时返回 False
+        with self.transaction() as conn:
+            self._write_alert_status(conn, pending)
+            row = conn.execute("SELECT status FROM alert_status WHERE coin_id=? AND interval=? AND indicator=?", alert_key).fetchone()
+            if row is not None and row[0] == status: return False
+            self._write_alert_status(conn, {alert_key: status})
+            return True
+
+    def publish_alerts(self, records, worker_id):
+        with self.transaction() as conn:
+            conn.executemany("INSERT INTO alerts (ts, worker, record) VALUES (?,?,?)",
+                             [(record['ts'], worker_id, json.dumps(record, ensure_ascii=False)) for record in records])
+            conn.execute("DELETE FROM alerts WHERE id <= (SELECT MAX(id) FROM alerts) - ?", (COORDINATION_ALERT_KEEP,))
+
+    def alerts_since(self, last_id, limit):
+        # 返回 id 大于 last_id 的最近 limit 条 [(id, record), ...]，按时间先后
+        with self.lock:
+            rows = self.conn.execute("SELECT id, record FROM alerts WHERE id > ? ORDER BY id DESC LIMIT ?", (last_id, limit)).fetchall()
+        return [(alert_id, json.loads(record)) for alert_id, record in reversed(rows)]
+
+    def publish_universe(self, coins):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM coins")
+            conn.executemany("INSERT INTO coins VALUES (?,?,?,?,?,?,?,?)",
+                             [(coin.coin_id, rank, coin.symbol, coin.name, coin.price, coin.change_24h, coin.change_1d, now) for rank, coin in enumerate(coins, 1)])
+
+    def publish_quotes(self, coins):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany("UPDATE coins SET price=?, change_24h=?, change_1d=?, updated_at=? WHERE coin_id=?",
+                             [(coin.price, coin.change_24h, coin.change_1d, now, coin.coin_id) for coin in coins])
+
+    def load_universe(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT coin_id, symbol, name, price, change_24h, change_1d FROM coins ORDER BY rank").fetchall()
+        return [CoinRecord(*row) for row in rows]
+
+    def try_lease(self, name, holder, ttl_seconds):
+        # 租约未过期 (包括自己持有的) 时返回 False；用于 "全体 worker 中只需一个去做" 的任务
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT expires_at FROM leases WHERE name=?", (name,)).fetchone()
+            if row is not None and row[0] > now: return False
+            conn.execute("INSERT OR REPLACE INTO leases VALUES (?,?,?)", (name, holder, now + ttl_seconds))
+            return True
+
+    def release_lease(self, name, holder):
+        with self.transaction() as conn: conn.execute("DELETE FROM leases WHERE name=? AND holder=?", (name, holder))
+
+    def heartbeat(self, worker_id, shard_index, shard_count, coins, cycles, last_cycle_seconds):
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO workers VALUES (?,?,?,?,?,?,?,?,?)",
+                         (worker_id, shard_index, shard_count, socket.gethostname(), os.getpid(), coins, cycles, last_cycle_seconds, time.time()))
+
+    def remove_worker(self, worker_id):
+        with self.transaction() as conn: conn.execute("DELETE FROM workers WHERE worker_id=?", (worker_id,))
+
+    def workers(self):
+        with self.lock:
+            return self.conn.execute("SELECT worker_id, shard_index, shard_count, coins, cycles, last_cycle_seconds, heartbeat_at FROM workers "
+                                     "ORDER BY shard_count, shard_index").fetchall()
+
+
+class SharedRateLimiter:
+    # 与 TokenBucketRateLimiter 接口相同，令牌桶放在协调库中，所有 worker 共用同一份 API 配额
+    def __init__(self, store, rate_per_minute, burst, name="coingecko"):
+        self.store = store
+        self.name = name
+        self.rate_per_second = max(rate_per_minute, 0.001) / 60.0
+        self.capacity = max(1, burst)
+
+    def acquire(self):
+        while True:
+            acquired, wait_seconds = self.store.take_token(self.name, self.rate_per_second, self.capacity)
+            if acquired: return
+            time.sleep(min(wait_seconds, 1.0))
+
+    def penalize(self, seconds):
+        self.store.penalize(self.name, seconds)
+
+
+class SharedAlertStatus(dict):
+    # 分片模式下的 last_alert_status：本地照常读写，记下变化的键，由 claim_alert / 心跳批量写回协调库
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.dirty = {}
+
+    def __setitem__(self, key, value):
+        if dict.get(self, key) != value: self.dirty[key] = value
+        super().__setitem__(key, value)
+
+    def take_dirty(self):
+        dirty, self.dirty = self.dirty, {}
+        return dirty
+
+    def restore_dirty(self, dirty):
+        self.dirty = {**dirty, **self.dirty}
+
+
+def claim_shared_alert(alert_key, status):
+    # 调用方持有 alert_state_lock；协调库不可用时照常提醒 (宁可重复也不漏报)
+    pending = last_alert_status.take_dirty()
+    try: return coordinator.claim_alert(alert_key, status, pending)
+    except sqlite3.Error as e:
+        logger.warning("协调库去重失败 (%s)，照常提醒", e)
+        last_alert_status.restore_dirty(pending)
+        return True
+
+
+class CoordinationAlertSink:
+    # 把提醒写入协调库，供只读界面 (--view) 显示
+    name = "coordination"
+
+    def __init__(self, store, worker_id):
+        self.store = store
+        self.worker_id = worker_id
+
+    def deliver(self, batch):
+        self.store.publish_alerts(batch, self.worker_id)
+
+
+class ShardWorker:
+    # 一个分片：只监控 ShardRing 分到本分片的币种；币种列表由持有 "universe" 租约的 worker 拉取后写入协调库，
+    # 其余 worker 直接读取，避免每个 worker 都分页请求 /coins/markets
+    def __init__(self, store, shard_index, shard_count):
+        self.store = store
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.ring = ShardRing(shard_count)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{shard_index}/{shard_count}"
+        self.coin_count = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def owns(self, coin_id):
+        return self.ring.shard_of(coin_id) == self.shard_index
+
+    def fetch_universe(self):
+        if self.store.try_lease("universe", self.worker_id, UNIVERSE_REFRESH_SECONDS):
+            coins = get_top_coin_data_detailed(TOP_N_COINS)
+            if coins: self.store.publish_universe(coins)
+            else: self.store.release_lease("universe", self.worker_id)  # 失败时让其他 worker 可以立即重试
+        shard_coins = [coin for coin in self.store.load_universe() if self.owns(coin.coin_id)]
+        self.coin_count = len(shard_coins)
+        return shard_coins
+
+    def publish_prices(self, coins_details, changed=None):
+        try: self.store.publish_quotes(coins_details if changed is None else list(changed.values()))
+        except sqlite3.Error as e: logger.warning("写入协调库报价失败: %s", e)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._heartbeat_loop, daemon=True, name="shard-heartbeat")
+        self.thread.start()
+        return self
+
+    def _heartbeat_loop(self):
+        while not self.stop_event.wait(WORKER_HEARTBEAT_SECONDS): self.beat()
+
+    def beat(self):
+        with alert_state_lock: pending = last_alert_status.take_dirty()
+        try:
+            self.store.flush_alert_status(pending)
+            counters, gauges, _ = metrics.snapshot()
+            self.store.heartbeat(self.worker_id, self.shard_index, self.shard_count, self.coin_count, counters.get(("cma_cycles_total", ()), 0),
+                                 gauges.get(("cma_last_cycle_seconds", ()), 0.0))
+        except sqlite3.Error as e:
+            logger.warning("写入协调库心跳失败: %s", e)
+            with alert_state_lock: last_alert_status.restore_dirty(pending)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None: self.thread.join(5)
+        self.beat()
+        self.store.remove_worker(self.worker_id)
+
+
+def format_worker_status(workers, now=None):
+    # workers: CoordinationStore.workers() 的结果；超过 3 个心跳间隔未更新视为离线
+    now = time.time() if now is None else now
+    alive = [row for row in workers if now - row[6] <= 3 * WORKER_HEARTBEAT_SECONDS]
+    if not alive: return f"只读模式：没有在线的分片 worker (协调库: {COORDINATION_STORE_PATH})"
+    shards = "，".join(f"{row[1]}/{row[2]}: {row[3]} 币种 {row[4]} 轮" for row in alive)
+    return f"只读模式：{len(alive)} 个分片 worker 在线 ({shards})，最近心跳 {time.strftime('%H:%M:%S UTC', time.gmtime(max(row[6] for row in alive)))}"
+
+
+def parse_shard(text):
+    # "I/N" -> (I, N)
+    try: index, count = (int(part) for part in text.split("/"))
+    except ValueError: raise argparse.ArgumentTypeError(f"分片格式应为 I/N (如 0/4): {text}")
+    if count < 1 or not 0 <= index < count: raise argparse.ArgumentTypeError(f"分片编号超出范围: {text}")
+    return index, count
+
+
+def run_worker(shard_index, shard_count, max_cycles=None):
+    # 分片 worker：与 --headless 相同的监控循环，只处理本分片的币种；限速、去重与结果经协调库共享
+    global coordinator, api_rate_limiter, request_budget, last_alert_status, alert_store, alert_dispatcher, SNAPSHOT_FILE_PATH
+    global monitoring_active, top_coins_data_detailed
+    try: coordinator = CoordinationStore(COORDINATION_STORE_PATH)
+    except sqlite3.Error as e:
+        logger.error("无法打开协调库 %s: %s", COORDINATION_STORE_PATH, e)
+        return 1
+    worker = ShardWorker(coordinator, shard_index, shard_count)
+    api_rate_limiter = SharedRateLimiter(coordinator, API_RATE_LIMIT_PER_MINUTE, API_BURST)
+    request_budget = RequestBudget((REQUEST_BUDGET_PER_MINUTE or API_RATE_LIMIT_PER_MINUTE) / shard_count)  # 各分片平分全局请求预算
+    last_alert_status = SharedAlertStatus(coordinator.load_alert_status())
+    # 提醒只进内存缓冲 (多个进程不能轮转同一个日志文件)，持久化由协调库负责；快照按分片分开
+    alert_store.close()
+    alert_store = AlertStore(None, 0, 0, ALERT_MEMORY_LIMIT)
+    alert_dispatcher = AlertDispatcher(build_alert_sinks(config['alert_sinks']) + [CoordinationAlertSink(coordinator, worker.worker_id)],
+                                       ALERT_SINK_BATCH_SIZE, ALERT_SINK_MAX_RETRIES)
+    if SNAPSHOT_FILE_PATH: SNAPSHOT_FILE_PATH = f"{os.path.splitext(SNAPSHOT_FILE_PATH)[0]}.shard{shard_index}of{shard_count}.npz"
+
+    def request_stop(signum, frame):
+        logger.info("收到信号 %s，正在停止分片 %d/%d...", signum, shard_index, shard_count)
+        request_monitor_stop()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    monitoring_active = True
+    # 首次启动时币种列表可能正由其他 worker 拉取
+    while monitoring_active:
+        top_coins_data_detailed = worker.fetch_universe()
+        if top_coins_data_detailed or coordinator.load_universe(): break
+        logger.info("等待币种列表写入协调库...")
+        monitor_wakeup.wait(5)
+    logger.info("分片 %d/%d 监控 %d 个币种 (worker %s)", shard_index, shard_count, len(top_coins_data_detailed), worker.worker_id)
+    worker.start()
+    monitor = CrossoverMonitor(on_prices=worker.publish_prices)
+    monitor.fetch_universe = worker.fetch_universe
+    monitor.universe_refreshed_at = time.time()
+    try: monitor.monitoring_loop_ma_cross(max_cycles=max_cycles)
+    finally:
+        worker.stop()
+        alert_dispatcher.close()
+    return 0
+
+
+def run_shard_supervisor(shard_count, forwarded_args, metrics_port=0):
+    # --shards N：在本机启动 N 个 --worker 子进程并等待；收到 SIGINT/SIGTERM 时转发给子进程
+    command = [sys.executable] if getattr(sys, 'frozen', False) else [sys.executable, os.path.abspath(__file__)]
+    children = []
+    for index in range(shard_count):
+        extra = ["--metrics-port", str(metrics_port + index)] if metrics_port else []
+        children.append(subprocess.Popen(command + ["--worker", f"{index}/{shard_count}"] + forwarded_args + extra))
+    logger.info("已启动 %d 个分片 worker (pid %s)，协调库: %s", shard_count, ", ".join(str(child.pid) for child in children), COORDINATION_STORE_PATH)
+
+    def forward_stop(signum, frame):
+        for child in children:
+            if child.poll() is None: child.send_signal(signal.SIGTERM)
+    signal.signal(signal.SIGINT, forward_stop)
+    signal.signal(signal.SIGTERM, forward_stop)
+    return max(child.wait() for child in children)
+
+
+def run_headless(max_cycles=None):
+    # 无界面守护模式：只运行数据获取、交叉检测与提醒输出，不加载 Tk/matplotlib
+    global monitoring_active, top_coins_data_detailed
+    def request_stop(signum, frame):
+        logger.info("收到信号 %s，正在停止监控...", signum)
+        request_monitor_stop()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    fetched_data = get_top_coin_data_detailed(TOP_N_COINS)
+    if not fetched_data:
+        logger.error("获取监控币种失败。请检查网络或API。")
+        return 1
+    top_coins_data_detailed = fetched_data
+    logger.info("监控前 %d 币种 (计价: %s)，导入到首个周期开始用时 %.2f 秒", len(fetched_data), VS_CURRENCY.upper(), time.perf_counter() - _IMPORT_STARTED_AT)
+    monitoring_active = True
+    monitor = CrossoverMonitor()
+    monitor.universe_refreshed_at = time.time()
+    try: monitor.monitoring_loop_ma_cross(max_cycles=max_cycles)
+    finally:
+        alert_dispatcher.close()
+        alert_store.close()
+    return 0
+
+
+def main(argv=None):
+    global PROFILE_CYCLES, COORDINATION_STORE_PATH, alert_store
+    parser = argparse.ArgumentParser(description="加密货币 MA 交叉监控")
+    parser.add_argument("--headless", action="store_true", help="无界面模式运行 (服务器/守护进程)")
+    shard = parser.add_argument_group("分片 worker")
+    shard.add_argument("--worker", type=parse_shard, default=None, metavar="I/N", help="作为 N 个分片中的第 I 个 (从 0 开始) 无界面运行")
+    shard.add_argument("--shards", type=int, default=None, metavar="N", help="在本机启动 N 个分片 worker 子进程")
+    shard.add_argument("--view", action="store_true", help="只读界面：显示分片 worker 写入协调库的结果，不运行监控")
+    shard.add_argument("--coord-store", default=None, help="协调库路径 (默认取配置 coordination_store_path)")
+    parser.add_argument("--cycles", type=int, default=None, help="运行指定周期数后退出 (默认一直运行)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="在 127.0.0.1 的该端口提供 /metrics (0 为关闭)")
+    parser.add_argument("--profile-cycles", type=int, default=PROFILE_CYCLES, help="对前 N 个周期做 cProfile 剖析")
+    backtest = parser.add_argument_group("回测 / 参数扫描")
+    backtest.add_argument("--backtest", action="store_true", help="用本地库中的历史数据回测 MA 交叉参数网格后退出")
+    backtest.add_argument("--shorts", type=int, nargs="+", default=None, help="短期 MA 周期列表 (默认取配置)")
+    backtest.add_argument("--longs", type=int, nargs="+", default=None, help="长期 MA 周期列表 (默认取配置)")
+    backtest.add_argument("--intervals", nargs="+", default=["1H", "4H"], choices=["1H", "4H"])
+    backtest.add_argument("--horizons", type=int, nargs="+", default=[1, 4, 24], help="前瞻收益的K线数")
+    backtest.add_argument("--backtest-days", type=int, default=BACKTEST_MAX_HOURLY_DAYS, help="历史天数 (最多 90 天小时数据)")
+    backtest.add_argument("--backtest-coins", nargs="+", default=None, help="指定币种 id (默认为本地库中所有币种)")
+    backtest.add_argument("--backtest-refresh", action="store_true", help="先从 API 补齐历史数据")
+    backtest.add_argument("--workers", type=int, default=None, help="进程数 (默认 CPU 核数)")
+    backtest.add_argument("--top", type=int, default=20, help="每个周期显示前 N 组参数")
+    backtest.add_argument("--backtest-output", default=None, help="完整结果写入 CSV")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    write_default_config()
+    PROFILE_CYCLES = max(0, args.profile_cycles)
+    if args.coord_store: COORDINATION_STORE_PATH = os.path.abspath(args.coord_store)
+    if args.shards:
+        forwarded = ["--coord-store", COORDINATION_STORE_PATH] + (["--cycles", str(args.cycles)] if args.cycles is not None else [])
+        return run_shard_supervisor(max(1, args.shards), forwarded, args.metrics_port)
+    if args.metrics_port:
+        try: start_metrics_server(args.metrics_port)
+        except OSError as e: logger.error("无法在端口 %d 启动指标端点: %s", args.metrics_port, e)
+    if args.backtest:
+        return run_backtest(args)
+    if args.worker is not None:
+        return run_worker(*args.worker, max_cycles=args.cycles)
+    if args.headless:
+        return run_headless(max_cycles=args.cycles)
+    if not _load_gui_modules():
+        logger.error("当前 Python 环境缺少 tkinter，请使用 --headless 运行。")
+        return 1
+    view_store = None
+    if args.view:
+        try: view_store = CoordinationStore(COORDINATION_STORE_PATH)
+        except sqlite3.Error as e: logger.error("无法打开协调库 %s: %s", COORDINATION_STORE_PATH, e); return 1
+        alert_store.close()
+        alert_store = AlertStore(None, 0, 0, ALERT_MEMORY_LIMIT)  # 只显示协调库中的提醒
+    app = CryptoMonitorGUI(view_store)
     app.mainloop()
+    return 0
 
 if __name__ == "__main__":
-    main()
+    import multiprocessing
+    multiprocessing.freeze_support()  # 打包成可执行文件时回测进程池需要
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# 离线基准：针对本地 CoinGecko 替身服务器运行完整监控周期
+# 报告冷/热周期耗时、每周期请求数、峰值 RSS (含同进程内的替身服务器)、以及 "K线收盘 -> 提醒" 延迟
+# --stream 时热阶段改由行情流替身推送价格，测量K线收盘即检测的延迟与期间的 API 请求数
+# 用法: python benchmarks/bench_cycle.py [--sizes 100 500 1000] [--latency-ms 30] [--engine batch] [--stream]
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from mock_coingecko import MockCoinGeckoServer, MockTickFeed
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _total_requests(counters):
+    return sum(counters.values())
+
+
+def run_single(args, coins):
+    server = MockCoinGeckoServer(coins, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                 rate_limit_per_minute=args.mock_rate_limit, error_rate=args.error_rate).start()
+    import CryptoMonitorAlpha as monitor
+    work_dir = tempfile.mkdtemp(prefix="cma-bench-")
+    monitor.COINGECKO_API_BASE_URL = server.base_url
+    monitor.api_rate_limiter = monitor.TokenBucketRateLimiter(args.client_rate_limit, args.client_burst)
+    monitor.request_budget = monitor.RequestBudget(args.client_rate_limit)  # 每轮派发全部币种，预算与客户端限速一致
+    monitor.TOP_N_COINS = coins
+    monitor.CROSSOVER_ENGINE = args.engine
+    monitor.ohlc_store = monitor.OhlcStore(os.path.join(work_dir, "ohlc_store.sqlite3"))
+    monitor.OHLC_STORE_FRESH_SECONDS = 0  # 每个周期都走网络增量更新
+    monitor.alert_store = monitor.AlertStore(None, 0, 0, monitor.ALERT_MEMORY_LIMIT)  # 不写程序目录下的提醒日志
+    monitor.SNAPSHOT_FILE_PATH = os.path.join(work_dir, "state_snapshot.npz")
+    alerts = []
+    crossover_monitor = monitor.CrossoverMonitor(on_alert=lambda message: alerts.append((time.time(), message)))
+    feed = None
+    if args.stream:
+        feed = MockTickFeed(server.market).start()
+        crossover_monitor.stream = monitor.StreamingCandleMonitor(crossover_monitor, monitor.build_tick_source(feed.url)).start()
+        deadline = time.time() + 5
+        while feed.client_count() == 0 and time.time() < deadline: time.sleep(0.01)
+
+    def run_cycle():
+        before = server.snapshot_counters()
+        started = time.perf_counter()
+        monitor.monitoring_active = True
+        with contextlib.redirect_stdout(io.StringIO()):
+            crossover_monitor.monitoring_loop_ma_cross(max_cycles=1)
+        elapsed = time.perf_counter() - started
+        after = server.snapshot_counters()
+        return elapsed, _total_requests(after) - _total_requests(before)
+
+    # 部分币种先处于下跌段 (冷周期不会触发)，下一根K线拉升形成金叉
+    injected = server.market.set_cross_coins(args.cross_fraction)
+    injected_names = {coin_id.replace('-', ' ').title() for coin_id in injected}
+    with contextlib.redirect_stdout(io.StringIO()):
+        monitor.top_coins_data_detailed = monitor.get_top_coin_data_detailed(coins)
+    cold_seconds, cold_requests = run_cycle()
+
+    def is_detected(message):
+        return "周期: 1H" in message and "金叉" in message and message.split("\n")[0].split(": ", 1)[1].rsplit(" (", 1)[0] in injected_names
+
+    if feed is None:
+        # 收盘一根新K线后随即开始下一个周期，测量收盘到提醒的延迟
+        alerts.clear()
+        server.market.advance_bar()
+        bar_closed_at = server.market.last_bar_closed_at
+        warm_seconds, warm_requests = run_cycle()
+    else:
+        # 行情流只在收盘时检测：拉升的那根K线要再收盘一次，推送下一根K线的首笔价格即触发
+        feed.broadcast()
+        server.market.advance_bar(); feed.broadcast()
+        time.sleep(0.2)
+        alerts.clear()
+        before = _total_requests(server.snapshot_counters())
+        server.market.advance_bar()
+        bar_closed_at = server.market.last_bar_closed_at
+        feed.broadcast()
+        deadline = time.time() + 10
+        while sum(is_detected(message) for _, message in alerts) < len(injected) and time.time() < deadline: time.sleep(0.005)
+        warm_seconds = time.time() - bar_closed_at
+        warm_requests = _total_requests(server.snapshot_counters()) - before
+        crossover_monitor.stream.stop()
+        feed.stop()
+    detected = [at for at, message in alerts if is_detected(message)]
+    latencies = sorted(at - bar_closed_at for at in detected)
+    server.stop()
+    return {
+        'coins': coins,
+        'engine': args.engine + ("+stream" if args.stream else ""),
+        'cold_cycle_seconds': round(cold_seconds, 3),
+        'cold_requests': cold_requests,
+        'warm_cycle_seconds': round(warm_seconds, 3),
+        'warm_requests': warm_requests,
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'alerts': len(alerts),
+        'injected_crosses': len(injected),
+        'detected_crosses': len(detected),
+        'alert_latency_p50_seconds': round(statistics.median(latencies), 3) if latencies else None,
+        'alert_latency_max_seconds': round(latencies[-1], 3) if latencies else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CryptoMonitorAlpha 离线周期基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--engine", default="incremental", choices=["incremental", "batch", "pandas"])
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="替身服务器每个请求的固定延迟")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--mock-rate-limit", type=int, default=0, help="替身服务器每分钟请求上限 (0 为不限)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身服务器随机 500 比例")
+    parser.add_argument("--client-rate-limit", type=float, default=60000.0, help="客户端令牌桶速率 (次/分钟)")
+    parser.add_argument("--client-burst", type=int, default=50)
+    parser.add_argument("--cross-fraction", type=float, default=0.05, help="注入金叉的币种比例")
+    parser.add_argument("--stream", action="store_true", help="热阶段由行情流替身推送价格 (K线收盘即检测)")
+    parser.add_argument("--json", default=None, help="把结果写入 JSON 文件")
+    parser.add_argument("--single", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single is not None:
+        print(json.dumps(run_single(args, args.single)))
+        return 0
+
+    # 每个规模单独一个子进程，峰值 RSS 互不影响
+    forwarded = list(argv if argv is not None else sys.argv[1:])
+    results = []
+    for coins in args.sizes:
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--single", str(coins)] + forwarded,
+                                   capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{coins} 币种基准失败:\n{completed.stderr}")
+            return 1
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    header = f"{'币种':>6} {'冷周期(s)':>10} {'冷请求':>7} {'热周期(s)':>10} {'热请求':>7} {'峰值RSS(MB)':>12} {'检出/注入':>10} {'延迟p50(s)':>11} {'延迟max(s)':>11}"
+    print(f"引擎: {args.engine}{' + 行情流' if args.stream else ''}  替身延迟: {args.latency_ms}±{args.jitter_ms} ms")
+    print(header)
+    for r in results:
+        print(f"{r['coins']:>6} {r['cold_cycle_seconds']:>10} {r['cold_requests']:>7} {r['warm_cycle_seconds']:>10} {r['warm_requests']:>7} "
+              f"{r['peak_rss_mb']:>12} {str(r['detected_crosses']) + '/' + str(r['injected_crosses']):>10} "
+              f"{str(r['alert_latency_p50_seconds']):>11} {str(r['alert_latency_max_seconds']):>11}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f: json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# 微基准：K线响应解析，原路径 (response.json() -> Python 列表 -> np.array / DataFrame + to_datetime + to_numeric + dropna)
+# 对比 parse_numeric_rows (响应字节直接扫描为 float64 数组)；响应体由替身服务器的合成行情生成，不走网络
+# 用法: python benchmarks/bench_parse.py [--coins 100] [--ma-days 10 30 90] [--ohlc-days 1 14 30] [--repeat 5]
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import numpy as np
+import pandas as pd
+
+from mock_coingecko import SyntheticMarket
+
+
+def legacy_ma(response):
+    data = json.loads(response.content.decode('utf-8'))
+    if not data or 'prices' not in data or not data['prices']: return None
+    points = np.array(data['prices'], dtype=np.float64).reshape(-1, 2)
+    points = points[np.isfinite(points).all(axis=1)]
+    return points[:, 0].astype(np.int64), np.ascontiguousarray(points[:, 1])
+
+
+def legacy_chart(response):
+    data = json.loads(response.content.decode('utf-8'))
+    if not data: return pd.DataFrame()
+    df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
+    df.set_index('timestamp', inplace=True)
+    for col in ['open', 'high', 'low', 'close']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df.dropna(inplace=True)
+    return df
+
+
+def fast_ma(monitor, response):
+    points = monitor.parse_numeric_rows(response, 2, key='prices')
+    points = points[np.isfinite(points).all(axis=1)]
+    return points[:, 0].astype(np.int64), np.ascontiguousarray(points[:, 1])
+
+
+def fast_chart(monitor, response):
+    rows = monitor.parse_numeric_rows(response, 5)
+    rows = rows[np.isfinite(rows).all(axis=1)]
+    index = pd.DatetimeIndex(pd.to_datetime(rows[:, 0].astype(np.int64), unit='ms', utc=True), name='timestamp')
+    return pd.DataFrame(np.ascontiguousarray(rows[:, 1:]), index=index, columns=['open', 'high', 'low', 'close'])
+
+
+def best_seconds(func, responses, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for response in responses: func(response)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CryptoMonitorAlpha K线响应解析微基准")
+    parser.add_argument("--coins", type=int, default=100, help="每个场景解析的响应数 (每币种一个)")
+    parser.add_argument("--ma-days", type=int, nargs="+", default=[10, 30, 90], help="market_chart 的 days (小时粒度)")
+    parser.add_argument("--ohlc-days", type=int, nargs="+", default=[1, 14, 30], help="/ohlc 的 days")
+    parser.add_argument("--repeat", type=int, default=5, help="取最快一轮")
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import CryptoMonitorAlpha as monitor
+    market = SyntheticMarket(args.coins)
+    scenarios = []
+    for days in args.ma_days:
+        # 真实 market_chart 同时返回 market_caps 与 total_volumes，原路径要把三组都解析成 Python 对象
+        bodies = []
+        for coin_id in market.coin_ids:
+            prices = market.market_chart(coin_id, days)
+            bodies.append(json.dumps({'prices': prices, 'market_caps': prices, 'total_volumes': prices}).encode('utf-8'))
+        scenarios.append((f"market_chart days={days}", bodies, legacy_ma, lambda r: fast_ma(monitor, r)))
+    for days in args.ohlc_days:
+        bodies = [json.dumps(market.ohlc(coin_id, days)).encode('utf-8') for coin_id in market.coin_ids]
+        scenarios.append((f"ohlc days={days}", bodies, legacy_chart, lambda r: fast_chart(monitor, r)))
+
+    print(f"通用 JSON 解析: {getattr(monitor._json_loads, '__module__', None) or monitor._json_loads!r}  响应数/场景: {args.coins}")
+    print(f"{'场景':<22} {'点数/响应':>9} {'原路径(ms)':>11} {'字节扫描(ms)':>13} {'加速':>7}")
+    for name, bodies, legacy, fast in scenarios:
+        responses = [types.SimpleNamespace(content=body) for body in bodies]
+        for response in responses[:3]:
+            expected, got = legacy(response), fast(response)
+            if isinstance(expected, pd.DataFrame): assert expected.equals(got), name
+            else: assert all(np.array_equal(a, b) for a, b in zip(expected, got)), name
+        points = len(monitor.parse_numeric_rows(responses[0], 5 if name.startswith("ohlc") else 2, key=None if name.startswith("ohlc") else 'prices'))
+        legacy_seconds, fast_seconds = best_seconds(legacy, responses, args.repeat), best_seconds(fast, responses, args.repeat)
+        print(f"{name:<22} {points:>9} {legacy_seconds * 1000:>11.1f} {fast_seconds * 1000:>13.1f} {legacy_seconds / fast_seconds:>6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
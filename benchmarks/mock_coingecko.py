@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# 本地 CoinGecko 替身服务器：提供 /coins/markets、/simple/price、/coins/{id}/ohlc、/coins/{id}/market_chart，
+# 以及行分隔 JSON 的 TCP 行情流替身 (MockTickFeed)
+# 数据为按币种固定种子生成的合成行情 (或 --fixtures 目录中录制的 JSON)，可配置延迟、限流与错误注入
+import argparse
+import json
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+MS_PER_HOUR = 3600000
+HISTORY_HOURS = 24 * 120  # 合成历史长度 (小时)
+FUTURE_HOURS = 48  # 预先生成、可由 advance_bar() 逐根"收盘"的K线数
+NOW_POINT_OFFSET_MS = 30 * 60 * 1000  # market_chart 末尾"当前"价格点在当前小时内的偏移
+
+
+class SyntheticMarket:
+    # 每个币种一条小时收盘价随机游走；cross_coins 中的币种在 advance_bar() 后的新K线形成金叉
+    def __init__(self, coin_count, seed=7):
+        self.coin_ids = [f"coin-{i:04d}" for i in range(coin_count)]
+        self.seed = seed
+        self.series = {}
+        self.cross_coins = set()
+        self.lock = threading.Lock()
+        self.current_bar_ms = (int(time.time() * 1000) // MS_PER_HOUR) * MS_PER_HOUR
+        self.bars_advanced = 0
+        self.last_bar_closed_at = None
+
+    def closes(self, coin_id):
+        with self.lock:
+            closes = self.series.get(coin_id)
+            if closes is None:
+                rng = np.random.default_rng(zlib.crc32(f"{self.seed}:{coin_id}".encode()))
+                start = 10 ** rng.uniform(-2, 4)
+                closes = start * np.exp(np.cumsum(rng.normal(0, 0.01, HISTORY_HOURS + FUTURE_HOURS)))
+                self.series[coin_id] = closes
+            return closes
+
+    def set_cross_coins(self, fraction):
+        # 让一部分币种在最近 30 根K线单边下跌，下一根K线大幅拉升 -> 新K线上出现金叉
+        count = int(len(self.coin_ids) * fraction)
+        with self.lock: self.cross_coins = set(self.coin_ids[:count])
+        last_index = HISTORY_HOURS - 1 + self.bars_advanced
+        for coin_id in self.cross_coins:
+            closes = self.closes(coin_id).copy()
+            base = closes[last_index - 30]
+            closes[last_index - 29:last_index + 1] = base * np.linspace(0.99, 0.80, 30)
+            closes[last_index + 1:] = base * 1.25
+            with self.lock: self.series[coin_id] = closes
+        return sorted(self.cross_coins)
+
+    def advance_bar(self):
+        # 收盘一根新的小时K线 (虚拟时钟前进 1 小时)
+        with self.lock:
+            self.current_bar_ms += MS_PER_HOUR
+            self.bars_advanced += 1
+            self.last_bar_closed_at = time.time()
+
+    def hourly(self, coin_id, days):
+        closes = self.closes(coin_id)
+        last_index = HISTORY_HOURS - 1 + self.bars_advanced
+        count = min(int(days * 24), last_index + 1)
+        values = closes[last_index - count + 1:last_index + 1]
+        start_ms = self.current_bar_ms - (count - 1) * MS_PER_HOUR
+        return [[start_ms + i * MS_PER_HOUR + 1234, float(v)] for i, v in enumerate(values)]
+
+    def market_chart(self, coin_id, days):
+        # 与真实 market_chart 一样在末尾多一个"当前"价格点，和最后一个小时点落在同一小时 (价格与行情流一致)
+        points = self.hourly(coin_id, days)
+        if points: points.append([self.current_bar_ms + NOW_POINT_OFFSET_MS, points[-1][1]])
+        return points
+
+    def ohlc(self, coin_id, days):
+        hours_per_bar = 0.5 if days <= 2 else (4 if days <= 30 else 96)
+        points = self.hourly(coin_id, days)
+        step = max(1, int(hours_per_bar))
+        bars = []
+        for i in range(0, len(points) - step + 1, step):
+            chunk = [p[1] for p in points[i:i + step]]
+            bars.append([points[i + step - 1][0] - 1234, chunk[0], max(chunk), min(chunk), chunk[-1]])
+        return bars
+
+    def ticks(self):
+        # 当前 (虚拟时钟) 小时K线上每个币种一笔价格，与 hourly() 最后一个点一致
+        last_index = HISTORY_HOURS - 1 + self.bars_advanced
+        ts = self.current_bar_ms + 1234
+        return [{'id': coin_id, 'price': float(self.closes(coin_id)[last_index]), 'ts': ts} for coin_id in self.coin_ids]
+
+    def simple_price(self, coin_ids, vs_currency):
+        last_index = HISTORY_HOURS - 1 + self.bars_advanced
+        quotes = {}
+        for coin_id in coin_ids:
+            if coin_id not in self.coin_ids: continue
+            closes = self.closes(coin_id)
+            price = float(closes[last_index])
+            quotes[coin_id] = {vs_currency: price, f"{vs_currency}_24h_change": (price / float(closes[last_index - 24]) - 1) * 100}
+        return quotes
+
+    def markets(self, per_page, page):
+        rows = []
+        for rank in range((page - 1) * per_page, min(page * per_page, len(self.coin_ids))):
+            coin_id = self.coin_ids[rank]
+            closes = self.closes(coin_id)
+            last_index = HISTORY_HOURS - 1 + self.bars_advanced
+            price, price_24h = float(closes[last_index]), float(closes[last_index - 24])
+            change = (price / price_24h - 1) * 100
+            rows.append({'id': coin_id, 'symbol': coin_id[-4:], 'name': coin_id.replace('-', ' ').title(),
+                         'current_price': price, 'market_cap_rank': rank + 1,
+                         'price_change_percentage_24h': change, 'price_change_percentage_24h_in_currency': change,
+                         'price_change_percentage_1d_in_currency': change})
+        return rows
+
+
+class MockCoinGeckoServer:
+    def __init__(self, coin_count=100, port=0, latency_ms=0.0, jitter_ms=0.0, rate_limit_per_minute=0,
+                 error_rate=0.0, fixtures_dir=None, seed=7):
+        self.market = SyntheticMarket(coin_count, seed=seed)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self.error_rate = error_rate
+        self.fixtures_dir = fixtures_dir
+        self.random = random.Random(seed)
+        self.counters = {}
+        self.request_times = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, name):
+        with self.lock: self.counters[name] = self.counters.get(name, 0) + 1
+
+    def snapshot_counters(self):
+        with self.lock: return dict(self.counters)
+
+    def _rate_limited(self):
+        if not self.rate_limit_per_minute: return False
+        now = time.monotonic()
+        with self.lock:
+            self.request_times = [t for t in self.request_times if now - t < 60]
+            if len(self.request_times) >= self.rate_limit_per_minute: return True
+            self.request_times.append(now)
+        return False
+
+    def _fixture(self, *parts):
+        if not self.fixtures_dir: return None
+        path = os.path.join(self.fixtures_dir, *parts)
+        if not os.path.exists(path): return None
+        with open(path, 'r', encoding='utf-8') as f: return json.load(f)
+
+    def route(self, path, query):
+        # 返回 (状态码, 数据, 额外响应头)
+        if self._rate_limited():
+            self.count("429")
+            return 429, {'error': 'rate limited'}, {'Retry-After': '1'}
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.count("500")
+            return 500, {'error': 'injected'}, {}
+        parts = [p for p in path.split('/') if p]
+        if parts[-2:] == ['coins', 'markets']:
+            self.count("markets")
+            # 与真实 API 一样单页最多 250 条
+            per_page, page = min(int(query.get('per_page', ['100'])[0]), 250), int(query.get('page', ['1'])[0])
+            return 200, self._fixture('markets.json') or self.market.markets(per_page, page), {}
+        if parts[-2:] == ['simple', 'price']:
+            self.count("simple_price")
+            coin_ids = [coin_id for coin_id in query.get('ids', [''])[0].split(',') if coin_id]
+            return 200, self.market.simple_price(coin_ids, query.get('vs_currencies', ['usd'])[0]), {}
+        if len(parts) >= 3 and parts[-3] == 'coins' and parts[-1] in ('ohlc', 'market_chart'):
+            coin_id, endpoint = parts[-2], parts[-1]
+            self.count(endpoint)
+            days_text = query.get('days', ['1'])[0]
+            days = 365 if days_text == 'max' else float(days_text)
+            recorded = self._fixture(endpoint, f"{coin_id}.json")
+            if recorded is not None: return 200, recorded, {}
+            if endpoint == 'ohlc': return 200, self.market.ohlc(coin_id, days), {}
+            return 200, {'prices': self.market.market_chart(coin_id, days)}, {}
+        self.count("404")
+        return 404, {'error': 'not found'}, {}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                status, data, headers = server.route(parsed.path, parse_qs(parsed.query))
+                delay = server.latency_ms + (server.random.uniform(0, server.jitter_ms) if server.jitter_ms else 0)
+                if delay: time.sleep(delay / 1000.0)
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in headers.items(): self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+class MockTickFeed:
+    # 行情流替身：客户端连上后保持连接，broadcast() 把当前K线上的价格按行推给所有客户端
+    def __init__(self, market, port=0):
+        self.market = market
+        self.clients = []
+        self.lock = threading.Lock()
+        feed = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with feed.lock: feed.clients.append(self.request)
+                try:
+                    while self.request.recv(1024): pass
+                except OSError: pass
+                finally:
+                    with feed.lock:
+                        if self.request in feed.clients: feed.clients.remove(self.request)
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"tcp://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.lock:
+            for client in self.clients:
+                try: client.shutdown(socket.SHUT_RDWR)
+                except OSError: pass
+        self.server.shutdown()
+        self.server.server_close()
+
+    def client_count(self):
+        with self.lock: return len(self.clients)
+
+    def broadcast(self):
+        payload = "".join(json.dumps(tick) + "\n" for tick in self.market.ticks()).encode('utf-8')
+        with self.lock: clients = list(self.clients)
+        for client in clients:
+            try: client.sendall(payload)
+            except OSError: pass
+        return len(clients)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地 CoinGecko 替身服务器")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--coins", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0, help="每分钟请求上限，超出返回 429 (0 为不限)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 500 的比例")
+    parser.add_argument("--fixtures", default=None, help="录制数据目录 (markets.json、market_chart/<id>.json、ohlc/<id>.json)")
+    parser.add_argument("--tick-port", type=int, default=None, help="同时在该端口提供 TCP 行情流替身")
+    parser.add_argument("--tick-seconds", type=float, default=5.0, help="行情流每隔多少秒推送一轮价格")
+    parser.add_argument("--bar-seconds", type=float, default=0.0, help="虚拟时钟每隔多少秒收盘一根小时K线 (0 为不前进)")
+    args = parser.parse_args(argv)
+    server = MockCoinGeckoServer(args.coins, args.port, args.latency_ms, args.jitter_ms, args.rate_limit, args.error_rate, args.fixtures).start()
+    print(f"CoinGecko 替身服务器运行于 {server.base_url} (在 config.json 中设置 api_base_url 指向它)")
+    feed = None
+    if args.tick_port is not None:
+        feed = MockTickFeed(server.market, args.tick_port).start()
+        print(f"行情流替身运行于 {feed.url} (在 config.json 中设置 stream_url 指向它)")
+    try:
+        next_bar = time.time() + args.bar_seconds
+        while True:
+            time.sleep(args.tick_seconds if feed else 3600)
+            if args.bar_seconds and time.time() >= next_bar:
+                server.market.advance_bar(); next_bar += args.bar_seconds
+            if feed: feed.broadcast()
+    except KeyboardInterrupt:
+        if feed: feed.stop()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# 图表数据的进行中去重：取数线程失败时，等待同一请求的线程也按失败处理 (清掉进行中条目、图表状态改为失败)
+import os
+import sys
+import threading
+import types
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import CryptoMonitorAlpha as monitor
+
+WAITERS = 3
+
+
+class FailingChartFetch:
+    # 第一次调用阻塞到 release 后抛错，之后的调用返回一根K线
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, coin_id, days_param, target_interval):
+        self.calls += 1
+        if self.calls > 1:
+            index = pd.DatetimeIndex(pd.to_datetime([1700000000000], unit='ms', utc=True), name='timestamp')
+            return pd.DataFrame([[1.0, 2.0, 0.5, 1.5]], index=index, columns=['open', 'high', 'low', 'close'])
+        self.started.set()
+        self.release.wait(5)
+        raise RuntimeError("store unavailable")
+
+
+@pytest.fixture
+def failing_fetch(monkeypatch):
+    fetch = FailingChartFetch()
+    waiting = threading.Semaphore(0)
+
+    class CountingFuture(monitor.Future):
+        # 等待者真正阻塞在 result() 上之后才放行取数线程，保证它们走的是等待分支
+        def result(self, timeout=None):
+            waiting.release()
+            return super().result(timeout)
+
+    monkeypatch.setattr(monitor, "get_ohlc_for_chart", fetch)
+    monkeypatch.setattr(monitor, "Future", CountingFuture)
+    monkeypatch.setattr(monitor, "chart_cache", monitor.ChartFrameCache(1 << 20, 60))
+    monkeypatch.setattr(monitor, "_chart_inflight", {})
+    fetch.waiting = waiting
+    return fetch
+
+
+def run_concurrently(fetch, target):
+    # 先启动取数线程，等它进入 get_ohlc_for_chart 后再启动等待者，全部在 result() 上等待后让取数失败
+    results = [None] * (WAITERS + 1)
+
+    def run(slot):
+        try: results[slot] = target()
+        except Exception as e: results[slot] = e
+
+    threads = [threading.Thread(target=run, args=(0,))]
+    threads[0].start()
+    assert fetch.started.wait(5)
+    for slot in range(1, WAITERS + 1):
+        threads.append(threading.Thread(target=run, args=(slot,)))
+        threads[-1].start()
+    for _ in range(WAITERS): assert fetch.waiting.acquire(timeout=5)
+    fetch.release.set()
+    for thread in threads: thread.join(5)
+    return results
+
+
+def test_waiters_share_owner_failure_and_clear_inflight(failing_fetch):
+    results = run_concurrently(failing_fetch, lambda: monitor.get_chart_frame_cached("coin", "2", "1h"))
+    assert failing_fetch.calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert monitor._chart_inflight == {}
+    # 失败不留下进行中条目，下一次调用重新取数
+    assert not monitor.get_chart_frame_cached("coin", "2", "1h").empty
+    assert failing_fetch.calls == 2
+
+
+def test_chart_loaders_waiting_on_failed_owner_report_error(failing_fetch):
+    if not monitor._load_gui_modules(): pytest.skip("tkinter 不可用")
+    posted = []
+    gui = types.SimpleNamespace(chart_request_seq=1, ui=types.SimpleNamespace(call=lambda func, *args: posted.append((func, args))),
+                                _show_chart_error_if_current="error", _draw_loaded_charts_if_current="draw")
+    run_concurrently(failing_fetch, lambda: monitor.CryptoMonitorGUI._load_and_draw_charts(gui, "coin", 1))
+    assert failing_fetch.calls == 1
+    assert len(posted) == WAITERS + 1
+    assert all(func == "error" and isinstance(args[2], RuntimeError) for func, args in posted)
@@ -0,0 +1,116 @@
+# 增量指标引擎与 pandas 参考实现的一致性：逐根K线比较 SMA / EMA 取值 (逐位相等) 以及交叉判断结果
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import CryptoMonitorAlpha as monitor
+
+MS_PER_HOUR = 3600000
+
+
+def random_walk_closes(seed, count=400):
+    # 随机游走，中间插入一段不变的价格 (走 pandas 的常数序列分支) 与极小价格 (Kahan 补偿)
+    rng = np.random.default_rng(seed)
+    closes = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.02, count)))
+    closes[150:175] = closes[149]
+    closes[250:300] *= 1e-6
+    return closes
+
+
+@pytest.mark.parametrize("window", [1, 5, 20, 50])
+def test_rolling_mean_state_matches_pandas(window):
+    closes = random_walk_closes(window)
+    expected = pd.Series(closes).rolling(window=window).mean().to_numpy()
+    state = monitor.RollingMeanState(window)
+    actual = []
+    for i, close in enumerate(closes.tolist()):
+        if i >= window: state.remove(float(closes[i - window]))
+        state.add(close)
+        actual.append(state.mean())
+    np.testing.assert_array_equal(np.array(actual), expected)
+
+
+@pytest.mark.parametrize("span", [5, 12, 26])
+def test_ema_state_matches_pandas(span):
+    closes = random_walk_closes(100 + span)
+    expected = pd.Series(closes).ewm(span=span, adjust=False, min_periods=span).mean().to_numpy()
+    state = monitor.EmaState(span)
+    actual = []
+    for close in closes.tolist():
+        state.add(close)
+        actual.append(state.mean())
+    np.testing.assert_array_equal(np.array(actual), expected)
+
+
+class RecordingMonitor(monitor.CrossoverMonitor):
+    # 只记录交叉判断结果，不做去重与提醒
+    def __init__(self):
+        self.signals = []
+
+    def handle_cross_signal(self, coin_id, coin_name, coin_symbol, interval_str, spec, crossed, status, current_price, current_ma_short,
+                            current_ma_long, missed_at=None):
+        self.signals.append((spec.name, crossed, status, float(current_price), float(current_ma_short), float(current_ma_long)))
+
+
+@pytest.fixture
+def specs(monkeypatch):
+    raw = [{"type": "sma", "short": 5, "long": 20}, {"type": "sma", "short": 20, "long": 50}, {"type": "ema", "short": 12, "long": 26}]
+    parsed = monitor.parse_indicator_specs(raw)
+    monkeypatch.setattr(monitor, "INDICATOR_SPECS", parsed)
+    return parsed["1H"]
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_incremental_indicator_set_matches_pandas_crossovers(specs, seed):
+    closes = random_walk_closes(seed)
+    timestamps = 1700000000000 + np.arange(len(closes), dtype=np.int64) * MS_PER_HOUR
+    engine = monitor.IncrementalIndicatorSet(specs)
+    reference = RecordingMonitor()
+    crosses = 0
+    # 每个周期多一根K线 (最后一根为未收盘K线)，偶尔一次多根，模拟跳过的周期
+    ends = list(range(2, len(closes) + 1))
+    del ends[100:103]
+    for end in ends:
+        series = monitor.PriceSeries(timestamps[:end], closes[:end])
+        reference.signals.clear()
+        reference.calculate_mas_and_check_crossover(series, "coin", "Coin", "cn", "1H")
+        actual = [(spec.name, crossed, status, price, short, long) for spec, crossed, status, price, short, long in engine.check(series.ts, series.closes)]
+        assert actual == reference.signals, f"第 {end} 根K线结果不一致"
+        crosses += sum(1 for signal in actual if signal[1])
+    assert crosses > 0
+
+
+def test_incremental_indicator_set_resyncs_after_gap(specs):
+    # 序列整段被替换 (如重新下载后起点晚于已提交的K线) 时重新建立状态，结果仍与 pandas 一致
+    closes = random_walk_closes(7)
+    timestamps = 1700000000000 + np.arange(len(closes), dtype=np.int64) * MS_PER_HOUR
+    engine = monitor.IncrementalIndicatorSet(specs)
+    engine.check(timestamps[:120], closes[:120])
+    series = monitor.PriceSeries(timestamps[150:], closes[150:])
+    reference = RecordingMonitor()
+    reference.calculate_mas_and_check_crossover(series, "coin", "Coin", "cn", "1H")
+    actual = [(spec.name, crossed, status, price, short, long) for spec, crossed, status, price, short, long in engine.check(series.ts, series.closes)]
+    assert actual == reference.signals
+
+
+def test_incremental_sma_stays_within_rounding_of_pandas_on_sliding_window(specs):
+    # 每个周期序列窗口前移一根 (旧K线被截掉)：引擎状态一直延续，pandas 每次从窗口起点重算，SMA 只差舍入误差
+    closes = random_walk_closes(11, count=700)
+    timestamps = 1700000000000 + np.arange(len(closes), dtype=np.int64) * MS_PER_HOUR
+    engine = monitor.IncrementalIndicatorSet(specs)
+    reference = RecordingMonitor()
+    sma_specs = {spec.name for spec in specs if spec.short_key[0] == "sma"}
+    for end in range(200, len(closes) + 1):
+        series = monitor.PriceSeries(timestamps[end - 200:end], closes[end - 200:end])
+        reference.signals.clear()
+        reference.calculate_mas_and_check_crossover(series, "coin", "Coin", "cn", "1H")
+        expected = {name: (short, long) for name, _, _, _, short, long in reference.signals if name in sma_specs}
+        actual = {spec.name: (short, long) for spec, _, _, _, short, long in engine.check(series.ts, series.closes) if spec.name in sma_specs}
+        assert actual.keys() == expected.keys() == sma_specs
+        for name, values in actual.items():
+            np.testing.assert_allclose(values, expected[name], rtol=1e-12, atol=0, err_msg=f"第 {end} 根K线 {name}")
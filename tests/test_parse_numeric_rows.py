@@ -0,0 +1,45 @@
+# K线响应字节扫描：与通用 JSON 解析结果一致，行宽不符或含 null 时回退而不是错位
+import json
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import CryptoMonitorAlpha as monitor
+
+
+def response(payload):
+    return types.SimpleNamespace(content=payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8'))
+
+
+def test_market_chart_prices_match_generic_parse():
+    prices = [[1700000000000 + i * 3600000, 0.1 * i + 1e-7] for i in range(50)]
+    body = {'prices': prices, 'market_caps': prices, 'total_volumes': prices}
+    assert monitor._scan_numeric_rows(monitor._json_array_bytes(response(body).content, b'prices'), 2) is not None
+    np.testing.assert_array_equal(monitor.parse_numeric_rows(response(body), 2, key='prices'), np.array(prices, dtype=np.float64))
+
+
+def test_ohlc_rows_match_generic_parse():
+    rows = [[1700000000000 + i * 14400000, 1.5, 2.25, 0.75, 1.0 + i] for i in range(20)]
+    np.testing.assert_array_equal(monitor.parse_numeric_rows(response(rows), 5), np.array(rows, dtype=np.float64))
+
+
+@pytest.mark.parametrize("body, width", [
+    (b'[[1,2,3],[4]]', 2),
+    (b'[[1],[2,3,4]]', 2),
+    (b'[[1,2,3,4],[5,6,7,8,9,10]]', 5),
+    (b'[[1,2],,[3,4]]', 2),
+])
+def test_ragged_rows_are_not_scanned(body, width):
+    assert monitor._scan_numeric_rows(body, width) is None
+    with pytest.raises(ValueError):
+        monitor.parse_numeric_rows(response(body), width)
+
+
+def test_null_prices_fall_back_to_nan():
+    values = monitor.parse_numeric_rows(response({'prices': [[1, 2.5], [2, None]]}), 2, key='prices')
+    assert values.shape == (2, 2) and values[0, 1] == 2.5 and np.isnan(values[1, 1])